@@ -0,0 +1,198 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Roda sem janela (CI, servidores); pode ser sobrescrito pelo ambiente
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PyQt5.QtCore import QDate
+from PyQt5.QtWidgets import QApplication
+
+import finance_app
+from synthetic import generate_ledger
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def measure(function, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    
+    return {
+        "runs": repeat,
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "mean_s": statistics.mean(timings),
+        "max_s": max(timings),
+    }
+
+def build_benchmarks(window, output_dir):
+    def clear_caches():
+        # Mede o caminho "frio", sem os caches em memória da janela
+        window.budget_status.invalidate_budgets(window.user_id)
+        window.chart.data_key = None
+        window.chart_renderer.invalidate_user(window.user_id)
+    
+    def full_range_filters():
+        window.filter_type_combo.setCurrentIndex(0)
+        window.filter_category_combo.setCurrentIndex(0)
+        window.filter_start_date.setDate(QDate(1900, 1, 1))
+        window.filter_end_date.setDate(QDate.currentDate())
+    
+    def expense_filters():
+        window.filter_type_combo.setCurrentText("Despesa")
+        window.filter_category_combo.setCurrentText("Alimentação")
+        window.filter_start_date.setDate(QDate.currentDate().addYears(-1))
+        window.filter_end_date.setDate(QDate.currentDate())
+    
+    def until_page_loaded(function):
+        # A primeira página é lida em segundo plano; mede até ela chegar à tabela
+        def run():
+            function()
+            while window.page_loading:
+                QApplication.processEvents()
+                time.sleep(0.0005)
+        return run
+    
+    def apply_filters_with(prepare):
+        def run():
+            prepare()
+            window.apply_filters()
+        return until_page_loaded(run)
+    
+    return [
+        ("load_transactions", until_page_loaded(window.load_transactions), None),
+        ("sort_transactions_amount", until_page_loaded(lambda: window.sort_transactions(3)), None),
+        ("apply_filters_full_range", apply_filters_with(full_range_filters), None),
+        ("apply_filters_category_year", apply_filters_with(expense_filters), None),
+        ("update_dashboard_cold", window.update_dashboard, clear_caches),
+        ("update_dashboard_warm", window.update_dashboard, None),
+        ("update_budget_alerts_cold", window.update_budget_alerts, clear_caches),
+        ("update_budget_alerts_warm", window.update_budget_alerts, None),
+        ("export_excel", lambda: window.write_excel(os.path.join(output_dir, "report.xlsx")), None),
+        ("export_pdf", lambda: window.write_pdf(os.path.join(output_dir, "report.pdf")), clear_caches),
+        ("sync_snapshot", lambda: window.db_manager.snapshot(window.user_id), None),
+    ]
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+    
+    regressions = []
+    print(f"{'benchmark':32} {'baseline':>10} {'atual':>10} {'razão':>8}")
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["median_s"]
+        after = stats["median_s"]
+        ratio = after / before if before else float("inf")
+        flag = "  <-- regressão" if ratio > threshold else ""
+        print(f"{name:32} {before:10.4f} {after:10.4f} {ratio:8.2f}{flag}")
+        if ratio > threshold:
+            regressions.append(name)
+    
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do Controle Financeiro Pessoal")
+    parser.add_argument("--users", type=int, default=5, help="usuários sintéticos")
+    parser.add_argument("--years", type=int, default=10, help="anos de histórico por usuário")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--layout", choices=["shared", "per_user"], default="shared",
+                        help="arquivo único ou um ledger por usuário")
+    parser.add_argument("--closed-years", type=int, default=0, 
+                        help="fecha os N anos mais antigos do histórico antes das medições")
+    parser.add_argument("--repeat", type=int, default=5, help="execuções por operação")
+    parser.add_argument("--only", nargs="*", help="roda apenas os benchmarks indicados")
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="razão mediana acima da qual a comparação acusa regressão")
+    args = parser.parse_args()
+    
+    work_dir = tempfile.mkdtemp(prefix="finance_bench_")
+    app = QApplication.instance() or QApplication(sys.argv)
+    
+    db_manager = finance_app.DatabaseManager(os.path.join(work_dir, "finance_manager.db"), layout=args.layout)
+    
+    start = time.perf_counter()
+    user_ids, counts = generate_ledger(db_manager, users=args.users, years=args.years, seed=args.seed)
+    generation_s = time.perf_counter() - start
+    
+    if args.closed_years:
+        # Dashboard e alertas passam a ler só os meses abertos e os totais congelados
+        first_month = finance_app.add_months(datetime.date.today().isoformat()[:7], -12 * args.years)
+        through_month = finance_app.add_months(first_month, 12 * args.closed_years - 1)
+        writer = db_manager.get_writer()
+        for user_id in user_ids:
+            writer.submit(user_id, lambda cursor, user_id=user_id: 
+                          db_manager.periods.close(cursor, user_id, through_month)).result()
+    
+    # Mede o primeiro usuário: no layout compartilhado as consultas também atravessam as linhas dos demais
+    window = finance_app.MainWindow(user_ids[0], "bench_user_0", db_manager)
+    app.processEvents()
+    
+    results = {}
+    for name, function, setup in build_benchmarks(window, work_dir):
+        if args.only and name not in args.only:
+            continue
+        results[name] = measure(function, args.repeat, setup)
+        app.processEvents()
+        print(f"{name:32} mediana {results[name]['median_s'] * 1000:10.2f} ms", file=sys.stderr)
+    
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "users": args.users,
+            "years": args.years,
+            "seed": args.seed,
+            "layout": args.layout,
+            "closed_years": args.closed_years,
+            "repeat": args.repeat,
+            "dataset": counts,
+            "generation_s": generation_s,
+        },
+        "results": results,
+    }
+    
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+    
+    window.close()
+    
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
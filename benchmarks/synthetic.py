@@ -0,0 +1,153 @@
+import datetime
+
+import numpy as np
+
+# Perfil de gastos por categoria: (lançamentos por mês, valor típico em R$, dispersão)
+EXPENSE_PROFILES = {
+    "Alimentação": (22, 38.0, 0.6),
+    "Transporte": (14, 22.0, 0.5),
+    "Moradia": (1, 1800.0, 0.1),
+    "Saúde": (2, 140.0, 0.8),
+    "Educação": (1, 450.0, 0.3),
+    "Lazer": (6, 75.0, 0.7),
+    "Outros": (3, 55.0, 0.9),
+}
+
+# Receitas: (lançamentos por mês, valor típico em R$, dispersão)
+INCOME_PROFILES = {
+    "Salário": (1, 6500.0, 0.05),
+    "Freelance": (0.6, 1200.0, 0.5),
+    "Investimentos": (1, 180.0, 0.4),
+}
+
+GOAL_TITLES = ["Reserva de Emergência", "Viagem", "Carro Novo", "Aposentadoria", "Reforma"]
+
+def month_starts(start, end):
+    current = datetime.date(start.year, start.month, 1)
+    while current <= end:
+        yield current
+        if current.month == 12:
+            current = datetime.date(current.year + 1, 1, 1)
+        else:
+            current = datetime.date(current.year, current.month + 1, 1)
+
+def days_in_month(first_day):
+    if first_day.month == 12:
+        return 31
+    next_month = datetime.date(first_day.year, first_day.month + 1, 1)
+    return (next_month - first_day).days
+
+def lognormal_amounts(rng, size, typical, sigma):
+    # Log-normal centrada no valor típico (mediana), arredondada em centavos
+    return np.round(rng.lognormal(np.log(typical), sigma, size), 2)
+
+def generate_user_transactions(rng, user_id, start, end, income_scale):
+    rows = []
+    
+    for first_day in month_starts(start, end):
+        month_days = days_in_month(first_day)
+        
+        for profiles, transaction_type, scale in ((EXPENSE_PROFILES, "Despesa", 1.0),
+                                                  (INCOME_PROFILES, "Receita", income_scale)):
+            for category, (per_month, typical, sigma) in profiles.items():
+                count = rng.poisson(per_month)
+                if count == 0:
+                    continue
+                
+                days = rng.integers(0, month_days, count)
+                amounts = lognormal_amounts(rng, count, typical * scale, sigma)
+                
+                for day, amount in zip(days, amounts):
+                    transaction_date = first_day + datetime.timedelta(days=int(day))
+                    if transaction_date > end:
+                        continue
+                    rows.append((user_id, transaction_type, category, float(amount),
+                                 f"{category} (sintético)", transaction_date.isoformat()))
+    
+    return rows
+
+def generate_user_budgets(rng, user_id, start, end):
+    rows = []
+    
+    for first_day in month_starts(start, end):
+        for category, (per_month, typical, _) in EXPENSE_PROFILES.items():
+            expected = per_month * typical
+            amount = round(float(expected * rng.uniform(0.8, 1.3)), 2)
+            rows.append((user_id, category, amount, first_day.month, first_day.year))
+    
+    return rows
+
+def generate_ledger(db_manager, users=10, years=5, seed=42, end_date=None, goals_per_user=3):
+    # Cria N usuários com M anos de transações, orçamentos mensais e metas
+    rng = np.random.default_rng(seed)
+    end = end_date or datetime.date.today()
+    start = datetime.date(end.year - years, end.month, 1)
+    
+    # Um único hash para todos os usuários (o KDF é caro e irrelevante aqui)
+    password_hash = db_manager.password_hasher.hash("benchmark")
+    
+    conn = db_manager.get_connection()
+    cursor = conn.cursor()
+    
+    counts = {"users": 0, "transactions": 0, "budgets": 0, "goals": 0, "goal_contributions": 0}
+    user_ids = []
+    
+    for index in range(users):
+        cursor.execute("INSERT INTO users (username, password, email) VALUES (?, ?, ?)",
+                       (f"bench_user_{index}", password_hash, f"bench_user_{index}@example.com"))
+        user_ids.append(cursor.lastrowid)
+    
+    conn.commit()
+    conn.close()
+    
+    for user_id in user_ids:
+        # No layout por usuário cada um escreve no próprio ledger
+        conn = db_manager.get_connection(user_id)
+        cursor = conn.cursor()
+        
+        transactions = generate_user_transactions(rng, user_id, start, end, rng.uniform(0.6, 1.8))
+        account_id = db_manager.default_account_id(cursor, user_id)
+        category_ids = {category: db_manager.categories.resolve(cursor, user_id, category)
+                        for category in [*EXPENSE_PROFILES, *INCOME_PROFILES]}
+        cursor.executemany("""
+            INSERT INTO transactions (user_id, type, category_id, amount, description, date, account_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(row_user, transaction_type, category_ids[category], amount, description, transaction_date, account_id) 
+              for row_user, transaction_type, category, amount, description, transaction_date in transactions])
+        
+        budgets = generate_user_budgets(rng, user_id, start, end)
+        cursor.executemany("""
+            INSERT INTO budgets (user_id, category_id, amount, month, year)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(row_user, category_ids[category], amount, month, year) 
+              for row_user, category, amount, month, year in budgets])
+        
+        for title in rng.choice(GOAL_TITLES, size=min(goals_per_user, len(GOAL_TITLES)), replace=False):
+            target = round(float(rng.uniform(2000, 50000)), 2)
+            deadline = end + datetime.timedelta(days=int(rng.integers(90, 365 * 5)))
+            cursor.execute("""
+                INSERT INTO goals (user_id, title, target_amount, current_amount, deadline)
+                VALUES (?, ?, ?, 0, ?)
+            """, (user_id, str(title), target, deadline.isoformat()))
+            goal_id = cursor.lastrowid
+            
+            # Contribuições mensais (o trigger mantém goals.current_amount)
+            contributions = [(goal_id, user_id, round(float(amount), 2), "Contribuição", first_day.isoformat())
+                             for first_day, amount in zip(month_starts(start, end),
+                                                          lognormal_amounts(rng, years * 12 + 1, target / 120, 0.3))]
+            cursor.executemany("""
+                INSERT INTO goal_contributions (goal_id, user_id, amount, description, date)
+                VALUES (?, ?, ?, ?, ?)
+            """, contributions)
+            
+            counts["goals"] += 1
+            counts["goal_contributions"] += len(contributions)
+        
+        counts["users"] += 1
+        counts["transactions"] += len(transactions)
+        counts["budgets"] += len(budgets)
+        
+        conn.commit()
+        conn.close()
+    
+    return user_ids, counts
@@ -1,15 +1,41 @@
 import sys
 import os
+import argparse
+import asyncio
+import queue
 import sqlite3
 import hashlib
+import hmac
+import secrets
+import time
 import datetime
+import io
+import re
+import contextlib
+import copy
+import functools
+import inspect
+import json
+import logging
+import traceback
+import tempfile
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import date, timedelta
 import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
 import pandas as pd
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+from reportlab.platypus import Image as ReportImage
+from reportlab.lib.units import inch
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
 from PyQt5 import QtWidgets, QtCore, QtGui
@@ -18,8 +44,9 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QTableWidget, QTableWidgetItem, QTabWidget,
                              QMessageBox, QComboBox, QDateEdit, QGroupBox,
                              QFormLayout, QDialog, QDialogButtonBox, QHeaderView,
-                             QFileDialog, QInputDialog, QProgressBar, QProgressDialog)
-from PyQt5.QtCore import Qt, QDate, pyqtSignal, QObject
+                             QFileDialog, QInputDialog, QProgressDialog,
+                             QSystemTrayIcon)
+from PyQt5.QtCore import Qt, QDate, QTimer, pyqtSignal, QObject
 from PyQt5.QtGui import QFont, QIcon, QPixmap
 import cloudinary
 import cloudinary.uploader
@@ -30,6 +57,8 @@ import threading
 # Carregar variáveis de ambiente
 load_dotenv()
 
+logger = logging.getLogger("finance_app")
+
 # Configuração do Cloudinary (para sincronização com nuvem)
 cloudinary.config(
     cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
@@ -43,9 +72,334 @@ class SyncSignals(QObject):
     finished = pyqtSignal()
     error = pyqtSignal(str)
 
+class WriteSignals(QObject):
+    committed = pyqtSignal(object)  # (future, on_committed, on_error)
+
+class PageSignals(QObject):
+    loaded = pyqtSignal(object)  # (geração, future da página)
+
+class AuthSignals(QObject):
+    finished = pyqtSignal(object)
+    error = pyqtSignal(str)
+
+# Custo do scrypt (ajustável por ambiente; hashes antigos são refeitos no login)
+PASSWORD_SCRYPT_N = int(os.getenv('FINANCE_SCRYPT_N', 2 ** 14))
+PASSWORD_SCRYPT_R = int(os.getenv('FINANCE_SCRYPT_R', 8))
+PASSWORD_SCRYPT_P = int(os.getenv('FINANCE_SCRYPT_P', 1))
+SESSION_TTL_SECONDS = int(os.getenv('FINANCE_SESSION_TTL', 30 * 60))
+
+class PasswordHasher:
+    def __init__(self, n=PASSWORD_SCRYPT_N, r=PASSWORD_SCRYPT_R, p=PASSWORD_SCRYPT_P):
+        self.n = n
+        self.r = r
+        self.p = p
+    
+    def derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, 
+                              maxmem=256 * n * r + 1024 * 1024, dklen=32)
+    
+    def hash(self, password):
+        # Formato: scrypt$n$r$p$salt$hash
+        salt = secrets.token_bytes(16)
+        key = self.derive(password, salt, self.n, self.r, self.p)
+        return f"scrypt${self.n}${self.r}${self.p}${salt.hex()}${key.hex()}"
+    
+    def verify(self, password, stored):
+        if stored.startswith("scrypt$"):
+            _, n, r, p, salt, key = stored.split("$")
+            derived = self.derive(password, bytes.fromhex(salt), int(n), int(r), int(p))
+            return hmac.compare_digest(derived.hex(), key)
+        
+        # Hash legado: SHA-256 sem sal
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+    
+    def needs_rehash(self, stored):
+        if not stored.startswith("scrypt$"):
+            return True
+        _, n, r, p, _, _ = stored.split("$")
+        return (int(n), int(r), int(p)) != (self.n, self.r, self.p)
+
+class SessionCache:
+    def __init__(self, ttl=SESSION_TTL_SECONDS):
+        self.ttl = ttl
+        self.secret = secrets.token_bytes(32)  # Nunca sai do processo
+        self.tokens = {}       # token -> (user_id, username, expira_em)
+        self.credentials = {}  # (usuário, hmac da senha) -> (user_id, username, hash, expira_em)
+        self.lock = threading.Lock()
+    
+    def credential_key(self, username, password):
+        digest = hmac.new(self.secret, password.encode(), hashlib.sha256).hexdigest()
+        return username, digest
+    
+    def lookup_credentials(self, username, password):
+        key = self.credential_key(username, password)
+        with self.lock:
+            entry = self.credentials.get(key)
+            if entry and entry[3] > time.monotonic():
+                return entry[:3]
+            self.credentials.pop(key, None)
+        return None
+    
+    def remember_credentials(self, username, password, user_id, stored_hash):
+        key = self.credential_key(username, password)
+        with self.lock:
+            self.credentials[key] = (user_id, username, stored_hash, time.monotonic() + self.ttl)
+    
+    def issue(self, user_id, username):
+        token = secrets.token_urlsafe(32)
+        with self.lock:
+            self.tokens[token] = (user_id, username, time.monotonic() + self.ttl)
+        return token
+    
+    def resolve(self, token):
+        with self.lock:
+            entry = self.tokens.get(token)
+            if entry and entry[2] > time.monotonic():
+                return entry[:2]
+            self.tokens.pop(token, None)
+        return None
+    
+    def revoke(self, token):
+        with self.lock:
+            self.tokens.pop(token, None)
+    
+    def forget_user(self, username):
+        with self.lock:
+            for key in [key for key in self.credentials if key[0] == username]:
+                del self.credentials[key]
+
+# Instrumentação de SQL (opcional): FINANCE_SQL_TRACE=1 e limite de consulta lenta em ms
+SQL_TRACE_ENABLED = os.getenv('FINANCE_SQL_TRACE', '0') == '1'
+SLOW_QUERY_MS = float(os.getenv('FINANCE_SLOW_QUERY_MS', 100))
+
+class QueryStats:
+    def __init__(self, slow_log_size=50):
+        self.lock = threading.Lock()
+        self.statements = {}  # sql normalizado -> [execuções, tempo total, tempo máximo, linhas]
+        self.slow_queries = deque(maxlen=slow_log_size)
+    
+    @staticmethod
+    def normalize(sql):
+        return re.sub(r"\s+", " ", sql).strip()
+    
+    def record_execution(self, sql):
+        with self.lock:
+            entry = self.statements.setdefault(sql, [0, 0.0, 0.0, 0])
+            entry[0] += 1
+    
+    def record_time(self, sql, elapsed, rows=0, execution_elapsed=None):
+        with self.lock:
+            entry = self.statements.setdefault(sql, [0, 0.0, 0.0, 0])
+            entry[1] += elapsed
+            entry[2] = max(entry[2], execution_elapsed if execution_elapsed is not None else elapsed)
+            entry[3] += rows
+    
+    def record_slow(self, sql, params, elapsed, plan):
+        with self.lock:
+            self.slow_queries.append({
+                "sql": sql,
+                "params": repr(params)[:200],
+                "elapsed_ms": elapsed * 1000,
+                "plan": plan,
+                "at": datetime.datetime.now().isoformat(timespec="seconds"),
+            })
+    
+    def snapshot(self):
+        # Lista ordenada pelo tempo total: (sql, execuções, total_s, máx_s, linhas)
+        with self.lock:
+            rows = [(sql, *entry) for sql, entry in self.statements.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+    
+    def slow_log(self):
+        with self.lock:
+            return list(self.slow_queries)
+    
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+            self.slow_queries.clear()
+
+class TracedCursor(sqlite3.Cursor):
+    # Mede execuções, tempo (incluindo o fetch) e linhas retornadas por instrução
+    trace_sql = None
+    trace_params = ()
+    trace_elapsed = 0.0
+    trace_logged = False
+    
+    def execute(self, sql, parameters=()):
+        self.trace_sql = QueryStats.normalize(sql)
+        self.trace_params = parameters
+        self.trace_elapsed = 0.0
+        self.trace_logged = False
+        self.connection.query_stats.record_execution(self.trace_sql)
+        
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.trace_time(time.perf_counter() - start)
+    
+    def executemany(self, sql, seq_of_parameters):
+        self.trace_sql = QueryStats.normalize(sql)
+        self.trace_params = ()
+        self.trace_elapsed = 0.0
+        self.trace_logged = True  # EXPLAIN não se aplica a lotes
+        self.connection.query_stats.record_execution(self.trace_sql)
+        
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.trace_time(time.perf_counter() - start)
+    
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.trace_time(time.perf_counter() - start, 1 if row is not None else 0)
+        return row
+    
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.trace_time(time.perf_counter() - start, len(rows))
+        return rows
+    
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.trace_time(time.perf_counter() - start, len(rows))
+        return rows
+    
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self.trace_time(time.perf_counter() - start)
+            raise
+        self.trace_time(time.perf_counter() - start, 1)
+        return row
+    
+    def trace_time(self, elapsed, rows=0):
+        if self.trace_sql is None:
+            return
+        
+        stats = self.connection.query_stats
+        self.trace_elapsed += elapsed
+        stats.record_time(self.trace_sql, elapsed, rows, self.trace_elapsed)
+        
+        if not self.trace_logged and self.trace_elapsed * 1000 >= self.connection.slow_query_ms:
+            self.trace_logged = True
+            plan = self.explain()
+            stats.record_slow(self.trace_sql, self.trace_params, self.trace_elapsed, plan)
+            logger.warning("Consulta lenta (%.1f ms): %s\n%s", self.trace_elapsed * 1000, 
+                           self.trace_sql, plan)
+    
+    def explain(self):
+        try:
+            # Cursor comum: o EXPLAIN não entra nas estatísticas
+            cursor = sqlite3.Cursor(self.connection)
+            cursor.execute("EXPLAIN QUERY PLAN " + self.trace_sql, self.trace_params)
+            return "\n".join(str(row[-1]) for row in cursor.fetchall())
+        except sqlite3.Error as e:
+            return f"(plano indisponível: {e})"
+
+class TracedConnection(sqlite3.Connection):
+    query_stats = None
+    slow_query_ms = SLOW_QUERY_MS
+    
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+# Layout do armazenamento: 'shared' (um arquivo para todos) ou 'per_user' (catálogo + um ledger por usuário)
+DB_LAYOUT = os.getenv('FINANCE_DB_LAYOUT', 'shared')
+LEDGER_TABLES = ["categories", "accounts", "transactions", "transfers", "budgets", "budget_alerts", "goals",
+                 "goal_contributions", "transactions_archive", "closed_periods", "closed_period_totals", "closed_daily_totals"]
+
+# Conta que recebe as transações lançadas sem conta (e as anteriores às contas)
+DEFAULT_ACCOUNT_NAME = "Conta Principal"
+
+# Categorias criadas para cada usuário: (nome, tipo de transação ou None para ambos)
+DEFAULT_CATEGORIES = [
+    ("Alimentação", "Despesa"), ("Transporte", "Despesa"), ("Moradia", "Despesa"),
+    ("Saúde", "Despesa"), ("Educação", "Despesa"), ("Lazer", "Despesa"),
+    ("Salário", "Receita"), ("Freelance", "Receita"), ("Investimentos", "Receita"),
+    ("Meta Financeira", "Despesa"), ("Outros", None),
+]
+GOAL_CATEGORY = "Meta Financeira"
+
+# Limiares de alerta (% do orçamento) quando o orçamento não define os seus
+DEFAULT_ALERT_THRESHOLDS = (80, 100)
+
+# Meses exibidos na grade de orçamentos
+BUDGET_GRID_MONTHS = [3, 6, 12]
+
+# Mês 'AAAA-MM' de um orçamento (colunas month/year)
+BUDGET_MONTH_SQL = "printf('%04d-%02d', {row}year, {row}month)"
+
+# Trecho dos triggers de orçamentos ({row}: NEW/OLD, {sign}: sentido do ajuste). Um orçamento no
+# primeiro mês do envelope ou antes dele muda o início: os saldos são descartados e recalculados
+BUDGET_ENVELOPE_SQL = """
+    DELETE FROM budget_envelopes WHERE category_id = {row}.category_id
+    AND printf('%04d-%02d', {row}.year, {row}.month) <= (SELECT MIN(month) FROM budget_envelopes 
+                                                         WHERE category_id = {row}.category_id);
+    UPDATE budget_envelopes SET balance = balance {sign} {row}.amount
+    WHERE category_id = {row}.category_id AND month >= printf('%04d-%02d', {row}.year, {row}.month);
+"""
+
+# Períodos fechados: transações arquivadas com estas colunas e escritas recusadas com esta mensagem
+ARCHIVED_TRANSACTION_COLUMNS = "id, user_id, type, category_id, amount, currency, account_id, description, date, created_at"
+CLOSED_PERIOD_ERROR = "Período fechado"
+
+# Colunas ordenáveis da listagem de transações (índice da coluna na tabela -> coluna SQL)
+TRANSACTION_SORT_KEYS = {5: "date", 3: "amount", 2: "category_id", 1: "type"}
+TRANSACTION_PAGE_SIZE = 200
+
+# Fila de escrita: agrupa operações em uma transação a cada N operações ou poucos ms
+WRITE_BATCH_SIZE = int(os.getenv('FINANCE_WRITE_BATCH_SIZE', 1000))
+WRITE_BATCH_DELAY_MS = float(os.getenv('FINANCE_WRITE_BATCH_DELAY_MS', 2))
+
+# Snapshots compactos mantidos por usuário (os mais antigos são apagados)
+SNAPSHOT_RETENTION = int(os.getenv('FINANCE_SNAPSHOT_RETENTION', 5))
+BACKUP_PAGES_PER_STEP = 256
+
+# Moeda dos totais e relatórios; as demais são convertidas pelas cotações locais
+BASE_CURRENCY = os.getenv('FINANCE_BASE_CURRENCY', 'BRL')
+FX_RATES_PATH = os.getenv('FINANCE_FX_RATES', 'fx_rates')
+CURRENCY_SYMBOLS = {"BRL": "R$", "USD": "US$", "EUR": "€", "GBP": "£", "JPY": "¥", "ARS": "AR$"}
+
+# Dia usado na conversão: linhas na moeda base não precisam de cotação e viram um único grupo
+FX_DAY_SQL = "CASE WHEN currency = ? THEN 0 ELSE CAST(julianday(date) - 2440587.5 AS INTEGER) END"
+
+def currency_symbol(currency=BASE_CURRENCY):
+    return CURRENCY_SYMBOLS.get(currency, currency)
+
+def format_money(value, currency=BASE_CURRENCY):
+    return f"{currency_symbol(currency)} {value:.2f}"
+
 class DatabaseManager:
-    def __init__(self):
-        self.db_name = "finance_manager.db"
+    def __init__(self, db_name="finance_manager.db", layout=None):
+        self.db_name = db_name
+        self.layout = layout or DB_LAYOUT
+        if self.layout not in ("shared", "per_user"):
+            raise ValueError(f"Layout de banco desconhecido: {self.layout}")
+        self.ledger_dir = os.path.splitext(db_name)[0] + "_ledgers"
+        self.snapshot_dir = os.path.splitext(db_name)[0] + "_snapshots"
+        self.snapshot_retention = SNAPSHOT_RETENTION
+        self.ready_ledgers = set()
+        self.ledger_lock = threading.Lock()
+        self.writer = None
+        self.password_hasher = PasswordHasher()
+        self.sessions = SessionCache()
+        self.query_stats = QueryStats()
+        self.trace_queries = SQL_TRACE_ENABLED
+        self.slow_query_ms = SLOW_QUERY_MS
+        self.fx_rates = FxRateTable(self)
+        self.currency_totals = CurrencyTotals(self)
+        self.periods = PeriodClosing(self)
+        self.categories = CategoryTree(self)
+        self.envelopes = BudgetEnvelopes(self)
+        self.budget_alerts = BudgetAlertEngine(self)
         self.init_db()
     
     def init_db(self):
@@ -63,35 +417,92 @@ class DatabaseManager:
             )
         ''')
         
-        # Tabela de transações
+        # Cotações (quanto vale uma unidade da moeda na moeda base), importadas de arquivos
         cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fx_rates (
+                currency TEXT NOT NULL,
+                date TEXT NOT NULL,
+                rate REAL NOT NULL,
+                PRIMARY KEY (currency, date)
+            )
+        ''')
+        
+        # No layout por usuário o arquivo principal guarda apenas o catálogo de usuários
+        if self.layout == "shared":
+            self.create_ledger_schema(cursor)
+            # Usuários anteriores ao cadastro de categorias (ou criados sem elas)
+            cursor.execute("SELECT id FROM users u WHERE NOT EXISTS (SELECT 1 FROM categories c WHERE c.user_id = u.id)")
+            for (user_id,) in cursor.fetchall():
+                self.categories.seed(cursor, user_id)
+        else:
+            os.makedirs(self.ledger_dir, exist_ok=True)
+        
+        conn.commit()
+        conn.close()
+    
+    def create_ledger_schema(self, cursor):
+        # Categorias de cada usuário; subcategorias apontam para a categoria pai
+        # (type: 'Receita', 'Despesa' ou NULL quando serve para ambos; rollover: orçamento em envelope)
+        # O nome é único por usuário, não por pai: a API, os filtros e a migração resolvem categorias pelo nome
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS categories (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                parent_id INTEGER,
+                type TEXT,
+                rollover INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                FOREIGN KEY (parent_id) REFERENCES categories (id),
+                UNIQUE(user_id, name)
+            )
+        ''')
+        self.migrate_category_rollover(cursor)
+        self.create_category_closure(cursor)
+        
+        # Tabela de transações
+        self.rename_legacy_category_table(cursor, "transactions")
+        cursor.execute(f'''
             CREATE TABLE IF NOT EXISTS transactions (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
                 type TEXT NOT NULL,
-                category TEXT NOT NULL,
+                category_id INTEGER NOT NULL,
                 amount REAL NOT NULL,
+                currency TEXT NOT NULL DEFAULT '{BASE_CURRENCY}',
+                account_id INTEGER,
                 description TEXT,
                 date TIMESTAMP NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                FOREIGN KEY (category_id) REFERENCES categories (id),
+                FOREIGN KEY (account_id) REFERENCES accounts (id)
             )
         ''')
+        self.migrate_transaction_currency(cursor)
+        self.migrate_category_ids(cursor, "transactions")
+        self.create_account_schema(cursor)
         
         # Tabela de orçamentos
+        self.rename_legacy_category_table(cursor, "budgets")
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS budgets (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
-                category TEXT NOT NULL,
+                category_id INTEGER NOT NULL,
                 amount REAL NOT NULL,
                 month INTEGER NOT NULL,
                 year INTEGER NOT NULL,
+                alert_thresholds TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (user_id) REFERENCES users (id),
-                UNIQUE(user_id, category, month, year)
+                FOREIGN KEY (category_id) REFERENCES categories (id),
+                UNIQUE(user_id, category_id, month, year)
             )
         ''')
+        self.migrate_category_ids(cursor, "budgets")
+        self.migrate_budget_thresholds(cursor)
         
         # Tabela de metas financeiras
         cursor.execute('''
@@ -107,197 +518,3138 @@ class DatabaseManager:
             )
         ''')
         
-        conn.commit()
-        conn.close()
-    
-    def get_connection(self):
-        return sqlite3.connect(self.db_name)
-
-class AuthDialog(QDialog):
-    def __init__(self, db_manager, parent=None):
-        super().__init__(parent)
-        self.db_manager = db_manager
-        self.setWindowTitle("Autenticação")
-        self.setModal(True)
-        self.setFixedSize(400, 300)
-        
-        # Aplicar estilo
-        self.setStyleSheet("""
-            QDialog {
-                background-color: #f5f5f5;
-            }
-            QLabel {
-                color: #333333;
-                font-weight: bold;
-            }
-            QLineEdit {
-                padding: 8px;
-                border: 1px solid #cccccc;
-                border-radius: 4px;
-                background-color: white;
-            }
-            QLineEdit:focus {
-                border: 2px solid #4CAF50;
-            }
-            QPushButton {
-                background-color: #4CAF50;
-                border: none;
-                color: white;
-                padding: 10px;
-                border-radius: 4px;
-                font-weight: bold;
-                margin-top: 10px;
-            }
-            QPushButton:hover {
-                background-color: #45a049;
-            }
-            QTabWidget::pane {
-                border: 1px solid #cccccc;
-                background-color: white;
-                border-radius: 4px;
-            }
-            QTabBar::tab {
-                background-color: #e0e0e0;
-                border: 1px solid #cccccc;
-                padding: 8px 16px;
-                margin-right: 2px;
-                border-top-left-radius: 4px;
-                border-top-right-radius: 4px;
-            }
-            QTabBar::tab:selected {
-                background-color: white;
-                border-bottom-color: white;
-            }
-        """)
+        # Contribuições para metas (cada uma ligada, quando houver, à transação gerada)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS goal_contributions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                goal_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                transaction_id INTEGER,
+                amount REAL NOT NULL,
+                description TEXT,
+                date TIMESTAMP NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (goal_id) REFERENCES goals (id),
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                FOREIGN KEY (transaction_id) REFERENCES transactions (id)
+            )
+        ''')
         
-        layout = QVBoxLayout()
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_goal_contributions_goal_date
+            ON goal_contributions (goal_id, date)
+        ''')
         
-        self.tab_widget = QTabWidget()
-        self.login_tab = QWidget()
-        self.register_tab = QWidget()
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_goal_contributions_transaction
+            ON goal_contributions (transaction_id)
+        ''')
         
-        self.setup_login_tab()
-        self.setup_register_tab()
+        # goals.current_amount é mantido pelos triggers a partir das contribuições
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_goal_contributions_insert
+            AFTER INSERT ON goal_contributions
+            BEGIN
+                UPDATE goals SET current_amount = current_amount + NEW.amount 
+                WHERE id = NEW.goal_id;
+            END
+        ''')
         
-        self.tab_widget.addTab(self.login_tab, "Login")
-        self.tab_widget.addTab(self.register_tab, "Registrar")
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_goal_contributions_delete
+            AFTER DELETE ON goal_contributions
+            BEGIN
+                UPDATE goals SET current_amount = current_amount - OLD.amount 
+                WHERE id = OLD.goal_id;
+            END
+        ''')
         
-        layout.addWidget(self.tab_widget)
-        self.setLayout(layout)
-    
-    def setup_login_tab(self):
-        layout = QFormLayout()
-        layout.setSpacing(15)
-        layout.setContentsMargins(20, 20, 20, 20)
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_goal_contributions_update
+            AFTER UPDATE OF amount, goal_id ON goal_contributions
+            BEGIN
+                UPDATE goals SET current_amount = current_amount - OLD.amount 
+                WHERE id = OLD.goal_id;
+                UPDATE goals SET current_amount = current_amount + NEW.amount 
+                WHERE id = NEW.goal_id;
+            END
+        ''')
         
-        self.login_username = QLineEdit()
-        self.login_username.setPlaceholderText("Digite seu usuário")
-        self.login_password = QLineEdit()
-        self.login_password.setEchoMode(QLineEdit.Password)
-        self.login_password.setPlaceholderText("Digite sua senha")
+        # Editar ou excluir a transação de uma contribuição reflete na meta
+        # (transações movidas para o arquivo não contam como exclusão; recriado por causa do WHEN)
+        cursor.execute("DROP TRIGGER IF EXISTS trg_transactions_delete_contribution")
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_transactions_update_contribution
+            AFTER UPDATE OF amount, date ON transactions
+            BEGIN
+                UPDATE goal_contributions SET amount = NEW.amount, date = NEW.date 
+                WHERE transaction_id = NEW.id;
+            END
+        ''')
         
-        layout.addRow("Usuário:", self.login_username)
-        layout.addRow("Senha:", self.login_password)
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_transactions_delete_contribution
+            AFTER DELETE ON transactions
+            WHEN NOT EXISTS (SELECT 1 FROM transactions_archive WHERE id = OLD.id)
+            BEGIN
+                DELETE FROM goal_contributions WHERE transaction_id = OLD.id;
+            END
+        ''')
         
-        login_btn = QPushButton("Login")
-        login_btn.clicked.connect(self.login)
-        layout.addRow(login_btn)
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_goals_delete_contributions
+            AFTER DELETE ON goals
+            BEGIN
+                DELETE FROM goal_contributions WHERE goal_id = OLD.id;
+            END
+        ''')
         
-        self.login_tab.setLayout(layout)
-    
-    def setup_register_tab(self):
-        layout = QFormLayout()
-        layout.setSpacing(15)
-        layout.setContentsMargins(20, 20, 20, 20)
+        self.migrate_goal_balances(cursor)
         
-        self.register_username = QLineEdit()
-        self.register_username.setPlaceholderText("Escolha um usuário")
-        self.register_email = QLineEdit()
-        self.register_email.setPlaceholderText("Digite seu email")
-        self.register_password = QLineEdit()
-        self.register_password.setEchoMode(QLineEdit.Password)
-        self.register_password.setPlaceholderText("Crie uma senha")
-        self.register_confirm_password = QLineEdit()
-        self.register_confirm_password.setEchoMode(QLineEdit.Password)
-        self.register_confirm_password.setPlaceholderText("Confirme a senha")
+        # Índice usado pelos totais por categoria/período (orçamentos e dashboard)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_user_type_category_date
+            ON transactions (user_id, type, category_id, date)
+        ''')
         
-        layout.addRow("Usuário:", self.register_username)
-        layout.addRow("Email:", self.register_email)
-        layout.addRow("Senha:", self.register_password)
-        layout.addRow("Confirmar Senha:", self.register_confirm_password)
+        # Totais por moeda/mês recalculados a cada invalidação
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_user_currency_date
+            ON transactions (user_id, currency, date)
+        ''')
         
-        register_btn = QPushButton("Registrar")
-        register_btn.clicked.connect(self.register)
-        layout.addRow(register_btn)
+        # Ordenações da listagem paginada: (coluna, id) como chave
+        for column in TRANSACTION_SORT_KEYS.values():
+            cursor.execute(f'''
+                CREATE INDEX IF NOT EXISTS idx_transactions_user_{column}_id
+                ON transactions (user_id, {column}, id)
+            ''')
         
-        self.register_tab.setLayout(layout)
+        self.create_closing_schema(cursor)
+        self.create_envelope_schema(cursor)
+        self.create_alert_schema(cursor)
     
-    def hash_password(self, password):
-        return hashlib.sha256(password.encode()).hexdigest()
-    
-    def login(self):
-        username = self.login_username.text()
-        password = self.login_password.text()
+    def create_category_closure(self, cursor):
+        # Fecho transitivo da árvore: uma linha por (ancestral, descendente), incluindo a própria
+        # categoria com depth 0; o total de um pai vira um único join com as transações
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS category_closure (
+                ancestor_id INTEGER NOT NULL,
+                descendant_id INTEGER NOT NULL,
+                depth INTEGER NOT NULL,
+                PRIMARY KEY (ancestor_id, descendant_id)
+            ) WITHOUT ROWID
+        ''')
         
-        if not username or not password:
-            QMessageBox.warning(self, "Erro", "Preencha todos os campos")
-            return
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_category_closure_descendant
+            ON category_closure (descendant_id, depth, ancestor_id)
+        ''')
         
-        hashed_password = self.hash_password(password)
+        # Nova categoria: ela mesma e os ancestrais do pai, um nível mais fundo
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_categories_closure_insert
+            AFTER INSERT ON categories
+            BEGIN
+                INSERT OR IGNORE INTO category_closure (ancestor_id, descendant_id, depth)
+                SELECT NEW.id, NEW.id, 0
+                UNION ALL
+                SELECT ancestor_id, NEW.id, depth + 1 FROM category_closure 
+                WHERE descendant_id = NEW.parent_id;
+            END
+        ''')
         
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, username FROM users WHERE username = ? AND password = ?", 
-                      (username, hashed_password))
-        user = cursor.fetchone()
-        conn.close()
+        # Troca de pai move a subárvore inteira: desliga dos ancestrais antigos e liga aos do novo pai
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_categories_closure_move
+            AFTER UPDATE OF parent_id ON categories
+            BEGIN
+                DELETE FROM category_closure
+                WHERE descendant_id IN (SELECT descendant_id FROM category_closure WHERE ancestor_id = NEW.id)
+                AND ancestor_id IN (SELECT ancestor_id FROM category_closure WHERE descendant_id = NEW.id AND depth > 0);
+                INSERT OR IGNORE INTO category_closure (ancestor_id, descendant_id, depth)
+                SELECT a.ancestor_id, d.descendant_id, a.depth + d.depth + 1
+                FROM category_closure a, category_closure d
+                WHERE a.descendant_id = NEW.parent_id AND d.ancestor_id = NEW.id;
+            END
+        ''')
         
-        if user:
-            self.user_id = user[0]
-            self.username = user[1]
-            self.accept()
-        else:
-            QMessageBox.warning(self, "Erro", "Usuário ou senha inválidos")
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_categories_closure_delete
+            AFTER DELETE ON categories
+            BEGIN
+                DELETE FROM category_closure WHERE descendant_id = OLD.id OR ancestor_id = OLD.id;
+            END
+        ''')
+        
+        self.migrate_category_closure(cursor)
     
-    def register(self):
-        username = self.register_username.text()
-        email = self.register_email.text()
-        password = self.register_password.text()
-        confirm_password = self.register_confirm_password.text()
+    def create_account_schema(self, cursor):
+        # Contas do usuário; o saldo vem das transações e transferências de cada uma
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS accounts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                currency TEXT NOT NULL DEFAULT '{BASE_CURRENCY}',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                UNIQUE(user_id, name)
+            )
+        ''')
         
-        if not username or not email or not password or not confirm_password:
-            QMessageBox.warning(self, "Erro", "Preencha todos os campos")
+        # Transferências entre contas (to_amount: valor creditado na moeda da conta de destino)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS transfers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                from_account_id INTEGER NOT NULL,
+                to_account_id INTEGER NOT NULL,
+                amount REAL NOT NULL,
+                to_amount REAL NOT NULL,
+                description TEXT,
+                date TIMESTAMP NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                FOREIGN KEY (from_account_id) REFERENCES accounts (id),
+                FOREIGN KEY (to_account_id) REFERENCES accounts (id)
+            )
+        ''')
+        
+        # Saldo de cada conta no fim de cada mês ('AAAA-MM'), mantido pelos triggers abaixo
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS account_checkpoints (
+                account_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                balance REAL NOT NULL,
+                PRIMARY KEY (account_id, month),
+                FOREIGN KEY (account_id) REFERENCES accounts (id)
+            )
+        ''')
+        
+        self.migrate_transaction_accounts(cursor)
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_account_date
+            ON transactions (account_id, date)
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transfers_from_date
+            ON transfers (from_account_id, date)
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transfers_to_date
+            ON transfers (to_account_id, date)
+        ''')
+        
+        # Alterações e exclusões ajustam os checkpoints do mês do movimento em diante;
+        # inserções passam por apply_account_movements (triggers de INSERT em transactions
+        # reduzem à metade a vazão das importações em lote). Um movimento em moeda diferente
+        # da conta não tem cotação no SQL: os checkpoints a partir do mês são descartados e
+        # refeitos com conversão por extend_checkpoints
+        cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'trg_transactions_update_checkpoint'")
+        trigger = cursor.fetchone()
+        if trigger and "NEW.currency" not in trigger[0]:
+            # Checkpoints anteriores à conversão somaram valores de outras moedas sem cotação
+            cursor.execute("DELETE FROM account_checkpoints")
+        cursor.execute("DROP TRIGGER IF EXISTS trg_transactions_update_checkpoint")
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_transactions_update_checkpoint
+            AFTER UPDATE OF type, amount, currency, date, account_id ON transactions
+            BEGIN
+                UPDATE account_checkpoints 
+                SET balance = balance - (CASE WHEN OLD.type = 'Receita' THEN OLD.amount ELSE -OLD.amount END)
+                WHERE account_id = OLD.account_id AND month >= strftime('%Y-%m', OLD.date)
+                AND OLD.currency = (SELECT currency FROM accounts WHERE id = OLD.account_id);
+                DELETE FROM account_checkpoints 
+                WHERE account_id = OLD.account_id AND month >= strftime('%Y-%m', OLD.date)
+                AND OLD.currency != (SELECT currency FROM accounts WHERE id = OLD.account_id);
+                UPDATE account_checkpoints 
+                SET balance = balance + (CASE WHEN NEW.type = 'Receita' THEN NEW.amount ELSE -NEW.amount END)
+                WHERE account_id = NEW.account_id AND month >= strftime('%Y-%m', NEW.date)
+                AND NEW.currency = (SELECT currency FROM accounts WHERE id = NEW.account_id);
+                DELETE FROM account_checkpoints 
+                WHERE account_id = NEW.account_id AND month >= strftime('%Y-%m', NEW.date)
+                AND NEW.currency != (SELECT currency FROM accounts WHERE id = NEW.account_id);
+            END
+        ''')
+        
+        cursor.execute("DROP TRIGGER IF EXISTS trg_transactions_delete_checkpoint")
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_transactions_delete_checkpoint
+            AFTER DELETE ON transactions
+            WHEN NOT EXISTS (SELECT 1 FROM transactions_archive WHERE id = OLD.id)
+            BEGIN
+                UPDATE account_checkpoints 
+                SET balance = balance - (CASE WHEN OLD.type = 'Receita' THEN OLD.amount ELSE -OLD.amount END)
+                WHERE account_id = OLD.account_id AND month >= strftime('%Y-%m', OLD.date)
+                AND OLD.currency = (SELECT currency FROM accounts WHERE id = OLD.account_id);
+                DELETE FROM account_checkpoints 
+                WHERE account_id = OLD.account_id AND month >= strftime('%Y-%m', OLD.date)
+                AND OLD.currency != (SELECT currency FROM accounts WHERE id = OLD.account_id);
+            END
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_transfers_update_checkpoint
+            AFTER UPDATE OF amount, to_amount, date, from_account_id, to_account_id ON transfers
+            BEGIN
+                UPDATE account_checkpoints SET balance = balance + OLD.amount
+                WHERE account_id = OLD.from_account_id AND month >= strftime('%Y-%m', OLD.date);
+                UPDATE account_checkpoints SET balance = balance - OLD.to_amount
+                WHERE account_id = OLD.to_account_id AND month >= strftime('%Y-%m', OLD.date);
+                UPDATE account_checkpoints SET balance = balance - NEW.amount
+                WHERE account_id = NEW.from_account_id AND month >= strftime('%Y-%m', NEW.date);
+                UPDATE account_checkpoints SET balance = balance + NEW.to_amount
+                WHERE account_id = NEW.to_account_id AND month >= strftime('%Y-%m', NEW.date);
+            END
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_transfers_delete_checkpoint
+            AFTER DELETE ON transfers
+            BEGIN
+                UPDATE account_checkpoints SET balance = balance + OLD.amount
+                WHERE account_id = OLD.from_account_id AND month >= strftime('%Y-%m', OLD.date);
+                UPDATE account_checkpoints SET balance = balance - OLD.to_amount
+                WHERE account_id = OLD.to_account_id AND month >= strftime('%Y-%m', OLD.date);
+            END
+        ''')
+    
+    def create_envelope_schema(self, cursor):
+        # Saldo acumulado no fim de cada mês ('AAAA-MM') dos envelopes (categorias com rollover),
+        # desde o primeiro mês orçado: soma de (orçado - gasto) de cada mês, subcategorias incluídas
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS budget_envelopes (
+                category_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                balance REAL NOT NULL,
+                PRIMARY KEY (category_id, month),
+                FOREIGN KEY (category_id) REFERENCES categories (id)
+            )
+        ''')
+        
+        # Como nos checkpoints de contas: alterações e exclusões ajustam os saldos do mês do gasto
+        # em diante nos envelopes da categoria e dos ancestrais (gastos anteriores ao primeiro mês
+        # do envelope não contam); inserções passam por BudgetEnvelopes.apply_spending. Os saldos
+        # ficam na moeda base e o SQL não tem cotação: um gasto em outra moeda descarta os saldos
+        # a partir do mês, refeitos com conversão por BudgetEnvelopes.extend
+        cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'trg_transactions_update_envelope'")
+        trigger = cursor.fetchone()
+        if trigger and f"'{BASE_CURRENCY}'" not in trigger[0]:
+            # Saldos gravados antes da conversão (ou com outra moeda base) somaram valores sem cotação
+            cursor.execute("DELETE FROM budget_envelopes")
+        cursor.execute("DROP TRIGGER IF EXISTS trg_transactions_update_envelope")
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_transactions_update_envelope
+            AFTER UPDATE OF type, category_id, amount, currency, date ON transactions
+            BEGIN
+                UPDATE budget_envelopes SET balance = balance + OLD.amount
+                WHERE OLD.type = 'Despesa' AND OLD.currency = '{BASE_CURRENCY}' AND month >= strftime('%Y-%m', OLD.date)
+                AND category_id IN (SELECT ancestor_id FROM category_closure WHERE descendant_id = OLD.category_id)
+                AND strftime('%Y-%m', OLD.date) >= (SELECT MIN(month) FROM budget_envelopes e 
+                                                     WHERE e.category_id = budget_envelopes.category_id);
+                DELETE FROM budget_envelopes 
+                WHERE OLD.type = 'Despesa' AND OLD.currency != '{BASE_CURRENCY}' AND month >= strftime('%Y-%m', OLD.date)
+                AND category_id IN (SELECT ancestor_id FROM category_closure WHERE descendant_id = OLD.category_id);
+                UPDATE budget_envelopes SET balance = balance - NEW.amount
+                WHERE NEW.type = 'Despesa' AND NEW.currency = '{BASE_CURRENCY}' AND month >= strftime('%Y-%m', NEW.date)
+                AND category_id IN (SELECT ancestor_id FROM category_closure WHERE descendant_id = NEW.category_id)
+                AND strftime('%Y-%m', NEW.date) >= (SELECT MIN(month) FROM budget_envelopes e 
+                                                     WHERE e.category_id = budget_envelopes.category_id);
+                DELETE FROM budget_envelopes 
+                WHERE NEW.type = 'Despesa' AND NEW.currency != '{BASE_CURRENCY}' AND month >= strftime('%Y-%m', NEW.date)
+                AND category_id IN (SELECT ancestor_id FROM category_closure WHERE descendant_id = NEW.category_id);
+            END
+        ''')
+        
+        cursor.execute("DROP TRIGGER IF EXISTS trg_transactions_delete_envelope")
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_transactions_delete_envelope
+            AFTER DELETE ON transactions
+            WHEN OLD.type = 'Despesa' AND NOT EXISTS (SELECT 1 FROM transactions_archive WHERE id = OLD.id)
+            BEGIN
+                UPDATE budget_envelopes SET balance = balance + OLD.amount
+                WHERE OLD.currency = '{BASE_CURRENCY}' AND month >= strftime('%Y-%m', OLD.date)
+                AND category_id IN (SELECT ancestor_id FROM category_closure WHERE descendant_id = OLD.category_id)
+                AND strftime('%Y-%m', OLD.date) >= (SELECT MIN(month) FROM budget_envelopes e 
+                                                     WHERE e.category_id = budget_envelopes.category_id);
+                DELETE FROM budget_envelopes 
+                WHERE OLD.currency != '{BASE_CURRENCY}' AND month >= strftime('%Y-%m', OLD.date)
+                AND category_id IN (SELECT ancestor_id FROM category_closure WHERE descendant_id = OLD.category_id);
+            END
+        ''')
+        
+        # Orçamentos: o valor entra/sai dos saldos do mês em diante; um orçamento anterior ao
+        # primeiro mês do envelope (ou a exclusão desse primeiro mês) faz o envelope ser recalculado
+        for event, row in (("INSERT", "NEW"), ("DELETE", "OLD")):
+            sign = "+" if row == "NEW" else "-"
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_budgets_{event.lower()}_envelope
+                AFTER {event} ON budgets
+                BEGIN
+                    {BUDGET_ENVELOPE_SQL.format(row=row, sign=sign)}
+                END
+            ''')
+        
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_budgets_update_envelope
+            AFTER UPDATE OF category_id, amount, month, year ON budgets
+            BEGIN
+                {BUDGET_ENVELOPE_SQL.format(row="OLD", sign="-")}
+                {BUDGET_ENVELOPE_SQL.format(row="NEW", sign="+")}
+            END
+        ''')
+        
+        # Ligar/desligar o rollover ou mover categorias muda o que cada envelope soma: recalcula
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_categories_update_envelope
+            AFTER UPDATE OF parent_id, rollover ON categories
+            WHEN OLD.parent_id IS NOT NEW.parent_id OR OLD.rollover != NEW.rollover
+            BEGIN
+                DELETE FROM budget_envelopes 
+                WHERE category_id IN (SELECT id FROM categories WHERE user_id = NEW.user_id);
+            END
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_categories_delete_envelope
+            AFTER DELETE ON categories
+            BEGIN
+                DELETE FROM budget_envelopes WHERE category_id = OLD.id;
+            END
+        ''')
+    
+    def create_alert_schema(self, cursor):
+        # Alertas de orçamento já enviados: um por (orçamento, limiar), o que evita repeti-los;
+        # serve também de histórico (spent/amount: consumo e limite no momento do alerta)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS budget_alerts (
+                budget_id INTEGER NOT NULL,
+                threshold INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                spent REAL NOT NULL,
+                amount REAL NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (budget_id, threshold),
+                FOREIGN KEY (budget_id) REFERENCES budgets (id),
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_budget_alerts_user_created
+            ON budget_alerts (user_id, created_at)
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_budgets_delete_alerts
+            AFTER DELETE ON budgets
+            BEGIN
+                DELETE FROM budget_alerts WHERE budget_id = OLD.id;
+            END
+        ''')
+    
+    def create_closing_schema(self, cursor):
+        # Último mês fechado ('AAAA-MM') de cada usuário; meses fechados não aceitam escritas
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS closed_periods (
+                user_id INTEGER PRIMARY KEY,
+                closed_through TEXT NOT NULL,
+                closed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        
+        # Transações dos períodos fechados, fora da tabela lida pelo dashboard
+        self.rename_legacy_category_table(cursor, "transactions_archive")
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS transactions_archive (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                type TEXT NOT NULL,
+                category_id INTEGER NOT NULL,
+                amount REAL NOT NULL,
+                currency TEXT NOT NULL DEFAULT '{BASE_CURRENCY}',
+                account_id INTEGER REFERENCES accounts (id),
+                description TEXT,
+                date TIMESTAMP NOT NULL,
+                created_at TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                FOREIGN KEY (category_id) REFERENCES categories (id)
+            )
+        ''')
+        self.migrate_category_ids(cursor, "transactions_archive")
+        
+        # Totais congelados no fechamento, já na moeda base: por mês/categoria e por dia
+        self.rename_legacy_category_table(cursor, "closed_period_totals")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS closed_period_totals (
+                user_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                type TEXT NOT NULL,
+                category_id INTEGER NOT NULL,
+                amount REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (user_id, month, type, category_id)
+            )
+        ''')
+        self.migrate_category_ids(cursor, "closed_period_totals")
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS closed_daily_totals (
+                user_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                income REAL NOT NULL,
+                expense REAL NOT NULL,
+                PRIMARY KEY (user_id, date)
+            )
+        ''')
+        
+        # Relatórios, listagem e saldos de contas leem o histórico completo por esta view
+        # (recriada sempre: as colunas acompanham ARCHIVED_TRANSACTION_COLUMNS)
+        cursor.execute("DROP VIEW IF EXISTS all_transactions")
+        cursor.execute(f'''
+            CREATE VIEW IF NOT EXISTS all_transactions AS
+            SELECT {ARCHIVED_TRANSACTION_COLUMNS} FROM transactions
+            UNION ALL
+            SELECT {ARCHIVED_TRANSACTION_COLUMNS} FROM transactions_archive
+        ''')
+        
+        # Os mesmos índices da tabela quente: a view combina as duas por MERGE
+        for column in TRANSACTION_SORT_KEYS.values():
+            cursor.execute(f'''
+                CREATE INDEX IF NOT EXISTS idx_transactions_archive_user_{column}_id
+                ON transactions_archive (user_id, {column}, id)
+            ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_archive_account_date
+            ON transactions_archive (account_id, date)
+        ''')
+        
+        # O arquivo é imutável
+        for event in ("UPDATE", "DELETE"):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_transactions_archive_{event.lower()}
+                BEFORE {event} ON transactions_archive
+                BEGIN
+                    SELECT RAISE(ABORT, '{CLOSED_PERIOD_ERROR}');
+                END
+            ''')
+        
+        # Alterações não podem levar uma transação para um mês fechado; inserções são
+        # verificadas por PeriodClosing.check_open (um trigger de INSERT custaria a vazão em lote)
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_transactions_closed_update
+            BEFORE UPDATE OF date ON transactions
+            WHEN strftime('%Y-%m', NEW.date) <= (SELECT closed_through FROM closed_periods WHERE user_id = NEW.user_id)
+            BEGIN
+                SELECT RAISE(ABORT, '{CLOSED_PERIOD_ERROR}');
+            END
+        ''')
+        
+        # Transferências ficam na tabela original, mas as de meses fechados também congelam
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_transfers_closed_update
+            BEFORE UPDATE ON transfers
+            WHEN min(strftime('%Y-%m', OLD.date), strftime('%Y-%m', NEW.date)) 
+                 <= (SELECT closed_through FROM closed_periods WHERE user_id = OLD.user_id)
+            BEGIN
+                SELECT RAISE(ABORT, '{CLOSED_PERIOD_ERROR}');
+            END
+        ''')
+        
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_transfers_closed_delete
+            BEFORE DELETE ON transfers
+            WHEN strftime('%Y-%m', OLD.date) <= (SELECT closed_through FROM closed_periods WHERE user_id = OLD.user_id)
+            BEGIN
+                SELECT RAISE(ABORT, '{CLOSED_PERIOD_ERROR}');
+            END
+        ''')
+    
+    def rename_legacy_category_table(self, cursor, table):
+        # Tabelas anteriores ao cadastro de categorias guardavam o nome em cada linha: a tabela
+        # antiga sai do caminho para ser recriada com category_id (migrate_category_ids copia as linhas)
+        cursor.execute(f"PRAGMA table_info({table})")
+        if "category" not in [row[1] for row in cursor.fetchall()]:
             return
         
-        if password != confirm_password:
-            QMessageBox.warning(self, "Erro", "As senhas não coincidem")
+        # No modo legado o RENAME não reescreve triggers, views e chaves estrangeiras de outras
+        # tabelas: elas continuam apontando para o nome original, que passa a ser a tabela nova
+        cursor.execute("PRAGMA legacy_alter_table = ON")
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+        cursor.execute("PRAGMA legacy_alter_table = OFF")
+    
+    def migrate_category_ids(self, cursor, table):
+        legacy = f"{table}_legacy"
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (legacy,))
+        if cursor.fetchone() is None:
+            return
+        
+        cursor.execute(f"PRAGMA table_info({legacy})")
+        legacy_columns = {row[1] for row in cursor.fetchall()}
+        cursor.execute(f"PRAGMA table_info({table})")
+        columns = [row[1] for row in cursor.fetchall() if row[1] in legacy_columns]
+        
+        # Cada nome usado vira uma categoria do usuário (as padrão primeiro, para manter o tipo)
+        cursor.execute(f"SELECT DISTINCT user_id FROM {legacy}")
+        for (user_id,) in cursor.fetchall():
+            self.categories.seed(cursor, user_id)
+        cursor.execute(f"INSERT OR IGNORE INTO categories (user_id, name) SELECT DISTINCT user_id, category FROM {legacy}")
+        
+        cursor.execute(f"""
+            INSERT INTO {table} ({", ".join(columns)}, category_id)
+            SELECT {", ".join("l." + column for column in columns)}, c.id
+            FROM {legacy} l JOIN categories c ON c.user_id = l.user_id AND c.name = l.category
+        """)
+        
+        # Ids já usados (inclusive por linhas arquivadas) não podem voltar a ser gerados
+        cursor.execute("SELECT MAX(seq) FROM sqlite_sequence WHERE name IN (?, ?)", (table, legacy))
+        sequence = cursor.fetchone()[0]
+        if sequence is not None:
+            cursor.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, sequence))
+        
+        # Índices e triggers foram junto com a tabela antiga e são recriados pelo schema
+        cursor.execute(f"DROP TABLE {legacy}")
+    
+    def migrate_budget_thresholds(self, cursor):
+        # Orçamentos anteriores aos limiares configuráveis usam os padrão (NULL)
+        cursor.execute("PRAGMA table_info(budgets)")
+        if "alert_thresholds" not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE budgets ADD COLUMN alert_thresholds TEXT")
+    
+    def migrate_category_rollover(self, cursor):
+        # Categorias anteriores aos envelopes: orçamentos independentes por mês
+        cursor.execute("PRAGMA table_info(categories)")
+        if "rollover" not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE categories ADD COLUMN rollover INTEGER NOT NULL DEFAULT 0")
+    
+    def migrate_category_closure(self, cursor):
+        # Categorias anteriores ao fecho (ou copiadas fora de ordem): reconstrói a partir de parent_id
+        cursor.execute("""
+            SELECT 1 FROM categories c 
+            WHERE NOT EXISTS (SELECT 1 FROM category_closure cc WHERE cc.ancestor_id = c.id AND cc.descendant_id = c.id)
+            LIMIT 1
+        """)
+        if cursor.fetchone() is None:
             return
         
-        hashed_password = self.hash_password(password)
+        cursor.execute("DELETE FROM category_closure")
+        cursor.execute("""
+            WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+                SELECT id, id, 0 FROM categories
+                UNION ALL
+                SELECT t.ancestor_id, c.id, t.depth + 1 
+                FROM tree t JOIN categories c ON c.parent_id = t.descendant_id
+            )
+            INSERT OR IGNORE INTO category_closure (ancestor_id, descendant_id, depth)
+            SELECT ancestor_id, descendant_id, depth FROM tree
+        """)
+    
+    def migrate_transaction_accounts(self, cursor):
+        # Transações anteriores às contas (ou copiadas sem conta) ficam na conta principal de cada usuário
+        cursor.execute("PRAGMA table_info(transactions)")
+        if "account_id" not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE transactions ADD COLUMN account_id INTEGER REFERENCES accounts (id)")
+        
+        cursor.execute("""
+            INSERT OR IGNORE INTO accounts (user_id, name, currency)
+            SELECT DISTINCT user_id, ?, ? FROM transactions WHERE account_id IS NULL
+        """, (DEFAULT_ACCOUNT_NAME, BASE_CURRENCY))
+        cursor.execute("""
+            UPDATE transactions SET account_id = (
+                SELECT a.id FROM accounts a WHERE a.user_id = transactions.user_id AND a.name = ?
+            ) WHERE account_id IS NULL
+        """, (DEFAULT_ACCOUNT_NAME,))
+    
+    def migrate_transaction_currency(self, cursor):
+        # Bancos anteriores à coluna de moeda: tudo era lançado na moeda base
+        cursor.execute("PRAGMA table_info(transactions)")
+        if "currency" not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE transactions ADD COLUMN currency TEXT NOT NULL DEFAULT '{BASE_CURRENCY}'")
+    
+    def migrate_goal_balances(self, cursor):
+        # Metas criadas antes do histórico de contribuições: o valor atual vira o saldo inicial
+        cursor.execute('''
+            INSERT INTO goal_contributions (goal_id, user_id, amount, description, date)
+            SELECT id, user_id, current_amount, 'Saldo inicial', date(created_at)
+            FROM goals g
+            WHERE current_amount <> 0
+            AND NOT EXISTS (SELECT 1 FROM goal_contributions c WHERE c.goal_id = g.id)
+        ''')
+        
+        if cursor.rowcount > 0:
+            # Os triggers somaram o saldo inicial de novo: recalcula a partir do histórico
+            cursor.execute('''
+                UPDATE goals SET current_amount = (
+                    SELECT COALESCE(SUM(amount), 0) FROM goal_contributions c 
+                    WHERE c.goal_id = goals.id
+                )
+            ''')
+    
+    def ledger_path(self, user_id):
+        # Arquivo com os dados financeiros do usuário (o próprio banco no layout compartilhado)
+        if self.layout == "shared":
+            return self.db_name
+        return os.path.join(self.ledger_dir, f"user_{int(user_id)}.db")
+    
+    def ensure_ledger(self, user_id, seed=True):
+        path = self.ledger_path(user_id)
+        with self.ledger_lock:
+            if path in self.ready_ledgers:
+                return path
+            
+            conn = sqlite3.connect(path)
+            cursor = conn.cursor()
+            self.create_ledger_schema(cursor)
+            # Ledger novo (ou anterior ao cadastro de categorias): categorias padrão do usuário
+            cursor.execute("SELECT 1 FROM categories WHERE user_id = ? LIMIT 1", (user_id,))
+            if seed and cursor.fetchone() is None:
+                self.categories.seed(cursor, user_id)
+            conn.commit()
+            conn.close()
+            self.ready_ledgers.add(path)
+        return path
+    
+    def connect(self, path, check_same_thread=True):
+        if not self.trace_queries:
+            return sqlite3.connect(path, check_same_thread=check_same_thread)
+        
+        conn = sqlite3.connect(path, factory=TracedConnection, check_same_thread=check_same_thread)
+        conn.query_stats = self.query_stats
+        conn.slow_query_ms = self.slow_query_ms
+        return conn
+    
+    def get_connection(self, user_id=None, check_same_thread=True):
+        # Sem user_id: catálogo de usuários; com user_id: dados financeiros do usuário
+        if self.layout == "shared" or user_id is None:
+            return self.connect(self.db_name, check_same_thread)
+        
+        conn = self.connect(self.ensure_ledger(user_id), check_same_thread)
+        # O catálogo fica anexado para consultas que precisem da tabela users
+        conn.execute("ATTACH DATABASE ? AS catalog", (self.db_name,))
+        return conn
+    
+    def split_into_ledgers(self, source_db=None):
+        # Copia os dados de cada usuário do arquivo compartilhado para o seu ledger;
+        # as tabelas de origem ficam intactas para permitir voltar ao layout compartilhado
+        if self.layout != "per_user":
+            raise ValueError("A divisão exige o layout 'per_user'")
+        
+        source_db = source_db or self.db_name
+        conn = sqlite3.connect(source_db)
+        cursor = conn.cursor()
+        
+        if source_db != self.db_name:
+            # Catálogo novo: copia os usuários mantendo os ids
+            cursor.execute("ATTACH DATABASE ? AS catalog", (self.db_name,))
+            cursor.execute("INSERT OR IGNORE INTO catalog.users SELECT * FROM main.users")
+            conn.commit()
+            cursor.execute("DETACH DATABASE catalog")
+        
+        cursor.execute("SELECT id FROM users ORDER BY id")
+        user_ids = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        
+        migrated = {}
+        for user_id in user_ids:
+            path = self.ledger_path(user_id)
+            if os.path.exists(path):
+                logger.warning("Ledger do usuário %s já existe, ignorado: %s", user_id, path)
+                continue
+            
+            # As categorias vêm da origem com os ids originais: nada de categorias padrão antes da cópia
+            migrated[user_id] = self.copy_user_ledger(source_db, self.ensure_ledger(user_id, seed=False), user_id)
+        
+        return migrated
+    
+    def copy_user_ledger(self, source_db, target_path, user_id):
+        # Copia as linhas do usuário para um arquivo com o schema de ledger
+        ledger = sqlite3.connect(target_path)
+        ledger_cursor = ledger.cursor()
+        self.create_ledger_schema(ledger_cursor)
+        ledger_cursor.execute("ATTACH DATABASE ? AS source", (source_db,))
+        ledger_cursor.execute("SELECT name FROM source.sqlite_master WHERE type = 'table'")
+        source_tables = {row[0] for row in ledger_cursor.fetchall()}
+        
+        counts = {}
+        for table in LEDGER_TABLES:
+            if table not in source_tables:
+                continue
+            ledger_cursor.execute(f"PRAGMA source.table_info({table})")
+            source_columns = [row[1] for row in ledger_cursor.fetchall()]
+            ledger_cursor.execute(f"PRAGMA main.table_info({table})")
+            target_columns = {row[1] for row in ledger_cursor.fetchall()}
+            columns = [column for column in source_columns if column in target_columns]
+            values = list(columns)
+            
+            if "category" in source_columns and "category_id" in target_columns:
+                # Origem anterior ao cadastro de categorias: os nomes viram categorias do ledger
+                self.categories.seed(ledger_cursor, user_id)
+                ledger_cursor.execute(f"""
+                    INSERT OR IGNORE INTO main.categories (user_id, name) 
+                    SELECT DISTINCT user_id, category FROM source.{table} WHERE user_id = ?
+                """, (user_id,))
+                columns.append("category_id")
+                values.append("(SELECT c.id FROM main.categories c WHERE c.user_id = s.user_id AND c.name = s.category)")
+            
+            ledger_cursor.execute(f"""
+                INSERT INTO main.{table} ({", ".join(columns)}) 
+                SELECT {", ".join(values)} FROM source.{table} s WHERE user_id = ?
+            """, (user_id,))
+            counts[table] = ledger_cursor.rowcount
+        
+        self.migrate_transaction_accounts(ledger_cursor)
+        
+        # Os triggers montaram o fecho na ordem da cópia (um pai copiado depois do filho fica de fora)
+        ledger_cursor.execute("DELETE FROM category_closure")
+        self.migrate_category_closure(ledger_cursor)
+        
+        # Ids de transações arquivadas não podem voltar a ser gerados na tabela quente
+        ledger_cursor.execute("""
+            SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM transactions_archive 
+                                 UNION ALL SELECT seq FROM sqlite_sequence WHERE name = 'transactions')
+        """)
+        sequence = ledger_cursor.fetchone()[0]
+        if sequence is not None:
+            ledger_cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'transactions'")
+            ledger_cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('transactions', ?)", (sequence,))
+        
+        # Os triggers somaram as contribuições copiadas: recalcula a partir do histórico
+        self.migrate_goal_balances(ledger_cursor)
+        ledger_cursor.execute('''
+            UPDATE goals SET current_amount = (
+                SELECT COALESCE(SUM(amount), 0) FROM goal_contributions c 
+                WHERE c.goal_id = goals.id
+            )
+        ''')
+        
+        ledger.commit()
+        ledger_cursor.execute("DETACH DATABASE source")
+        ledger.close()
+        return counts
+    
+    def backup(self, target_path, user_id=None, progress=None, pages=BACKUP_PAGES_PER_STEP):
+        # Backup online em passos de N páginas: outras conexões continuam lendo e gravando entre os passos
+        source_path = self.ledger_path(user_id) if user_id is not None else self.db_name
+        building_path = None
+        if user_id is not None and self.layout == "shared":
+            # O arquivo compartilhado tem dados de outros usuários: o backup parte de uma cópia só com os do usuário
+            handle, building_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(target_path)))
+            os.close(handle)
+            try:
+                self.copy_user_ledger(self.db_name, building_path, user_id)
+                self.check_user_ledger(building_path, user_id)
+            except Exception:
+                os.remove(building_path)
+                raise
+            source_path = building_path
+        
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path)
+        
+        def report(status, remaining, total):
+            if progress and total:
+                progress(int((total - remaining) * 100 / total))
+        
+        try:
+            source.backup(target, pages=pages, progress=report)
+        finally:
+            target.close()
+            source.close()
+            if building_path:
+                os.remove(building_path)
+        return target_path
+    
+    def check_user_ledger(self, path, user_id):
+        # Garante que uma cópia por usuário não levou linhas de outros usuários nem a tabela de senhas
+        conn = sqlite3.connect(path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+            tables = {row[0] for row in cursor.fetchall()}
+            if "users" in tables:
+                raise ValueError("A cópia do usuário contém a tabela de usuários")
+            for table in LEDGER_TABLES:
+                if table not in tables:
+                    continue
+                cursor.execute(f"SELECT 1 FROM {table} WHERE user_id != ? LIMIT 1", (user_id,))
+                if cursor.fetchone():
+                    raise ValueError(f"A cópia do usuário contém linhas de outros usuários ({table})")
+        finally:
+            conn.close()
+    
+    def snapshot(self, user_id=None):
+        # Cópia compacta e consistente (VACUUM INTO), com rotação dos snapshots antigos
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        prefix = f"user_{int(user_id)}" if user_id is not None else "catalog"
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        path = os.path.join(self.snapshot_dir, f"{prefix}_{timestamp}.db")
+        self.compact_copy(path, user_id)
+        self.rotate_snapshots(prefix)
+        return path
+    
+    def compact_copy(self, path, user_id=None):
+        # VACUUM INTO um arquivo novo (ou vazio), fora da rotação dos snapshots
+        source_path = self.ledger_path(user_id) if user_id is not None else self.db_name
+        building_path = None
+        if user_id is not None and self.layout == "shared":
+            # O arquivo compartilhado tem dados de outros usuários: copia só as linhas do usuário
+            handle, building_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(path)))
+            os.close(handle)
+            source_path = building_path
+        
+        try:
+            if building_path:
+                self.copy_user_ledger(self.db_name, building_path, user_id)
+                self.check_user_ledger(building_path, user_id)
+            conn = sqlite3.connect(source_path)
+            try:
+                conn.execute("VACUUM INTO ?", (path,))
+            finally:
+                conn.close()
+        finally:
+            if building_path:
+                os.remove(building_path)
+        return path
+    
+    def list_snapshots(self, user_id=None):
+        prefix = f"user_{int(user_id)}" if user_id is not None else "catalog"
+        if not os.path.isdir(self.snapshot_dir):
+            return []
+        # O timestamp no nome ordena cronologicamente
+        return sorted(os.path.join(self.snapshot_dir, name) for name in os.listdir(self.snapshot_dir)
+                      if name.startswith(prefix + "_") and name.endswith(".db"))
+    
+    def rotate_snapshots(self, prefix):
+        snapshots = sorted(name for name in os.listdir(self.snapshot_dir)
+                           if name.startswith(prefix + "_") and name.endswith(".db"))
+        for name in snapshots[:max(len(snapshots) - self.snapshot_retention, 0)]:
+            os.remove(os.path.join(self.snapshot_dir, name))
+    
+    def authenticate(self, username, password):
+        # Retorna (user_id, username) ou None; o KDF é custoso, rode fora da GUI
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, username, password FROM users WHERE username = ?", (username,))
+        user = cursor.fetchone()
+        
+        if not user:
+            conn.close()
+            return None
+        
+        user_id, username, stored_hash = user
+        
+        # Credenciais já verificadas neste processo (e senha não alterada desde então)
+        cached = self.sessions.lookup_credentials(username, password)
+        if cached and cached[2] == stored_hash:
+            conn.close()
+            return user_id, username
+        
+        if not self.password_hasher.verify(password, stored_hash):
+            conn.close()
+            return None
+        
+        # Rehash oportunista quando o formato ou o custo mudou
+        if self.password_hasher.needs_rehash(stored_hash):
+            stored_hash = self.password_hasher.hash(password)
+            cursor.execute("UPDATE users SET password = ? WHERE id = ?", (stored_hash, user_id))
+            conn.commit()
+        
+        conn.close()
+        self.sessions.remember_credentials(username, password, user_id, stored_hash)
+        return user_id, username
+    
+    def get_writer(self):
+        # Escritor único compartilhado pela janela, pela API e por importações
+        with self.ledger_lock:
+            if self.writer is None:
+                self.writer = WriteQueue(self)
+            return self.writer
+    
+    def close_writer(self):
+        with self.ledger_lock:
+            writer, self.writer = self.writer, None
+        if writer is not None:
+            writer.stop()
+    
+    def default_account_id(self, cursor, user_id):
+        # Conta principal do usuário, criada na primeira vez
+        cursor.execute("INSERT OR IGNORE INTO accounts (user_id, name, currency) VALUES (?, ?, ?)", 
+                       (user_id, DEFAULT_ACCOUNT_NAME, BASE_CURRENCY))
+        cursor.execute("SELECT id FROM accounts WHERE user_id = ? AND name = ?", (user_id, DEFAULT_ACCOUNT_NAME))
+        return cursor.fetchone()[0]
+    
+    def apply_account_movements(self, cursor, movements):
+        # movements: (account_id, data, variação[, moeda]) de linhas inseridas com conta; variações em
+        # outra moeda são convertidas para a da conta pela cotação do dia.
+        # Uma atualização de checkpoints por (conta, mês), não por linha
+        account_ids = {movement[0] for movement in movements if len(movement) > 3}
+        currencies = {}
+        if account_ids:
+            cursor.execute(f"SELECT id, currency FROM accounts WHERE id IN ({', '.join('?' * len(account_ids))})",
+                           list(account_ids))
+            currencies = dict(cursor.fetchall())
+        
+        changes = {}
+        for account_id, movement_date, change, *currency in movements:
+            if currency and currency[0] != currencies[account_id]:
+                change = self.fx_rates.convert(change, currency[0], currencies[account_id], movement_date)
+            key = (account_id, movement_date[:7])
+            changes[key] = changes.get(key, 0) + change
+        cursor.executemany("""
+            UPDATE account_checkpoints SET balance = balance + ? 
+            WHERE account_id = ? AND month >= ?
+        """, [(change, account_id, month) for (account_id, month), change in changes.items()])
+    
+    def insert_transactions(self, user_id, rows):
+        # rows: (type, category, amount, description, date[, currency]); sem moeda, a moeda base.
+        # Uma única operação na fila
+        rows = [(*row[:5], row[5] if len(row) > 5 else BASE_CURRENCY) for row in rows]
+        
+        def insert(cursor):
+            self.periods.check_open(cursor, user_id, [row[4] for row in rows])
+            # Conta e categorias resolvidas uma vez para o lote inteiro
+            account_id = self.default_account_id(cursor, user_id)
+            category_ids = {name: self.categories.resolve(cursor, user_id, name) for name in {row[1] for row in rows}}
+            cursor.executemany("""
+                INSERT INTO transactions (user_id, type, category_id, amount, currency, description, date, account_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(user_id, transaction_type, category_ids[category], amount, currency, description, transaction_date, 
+                   account_id) 
+                  for transaction_type, category, amount, description, transaction_date, currency in rows])
+            self.apply_account_movements(cursor, [
+                (account_id, transaction_date, amount if transaction_type == "Receita" else -amount, currency)
+                for transaction_type, _, amount, _, transaction_date, currency in rows
+            ])
+            self.envelopes.apply_spending(cursor, [
+                (transaction_type, category_ids[category], transaction_date, amount, currency)
+                for transaction_type, category, amount, _, transaction_date, currency in rows
+            ])
+            return len(rows)
+        return self.get_writer().submit(user_id, insert)
+    
+    def get_totals(self, user_id):
+        # (receitas, despesas) de todo o histórico do usuário, na moeda base
+        return self.currency_totals.totals(user_id)
+    
+    def load_fx_rates(self, path):
+        # Arquivo CSV (ou pasta de CSVs) com as colunas date, currency, rate
+        if os.path.isdir(path):
+            files = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".csv")]
+        else:
+            files = [path]
+        if not files:
+            return 0
+        
+        rates = pd.concat([pd.read_csv(file_path) for file_path in files])
+        missing = {"date", "currency", "rate"} - set(rates.columns)
+        if missing:
+            raise ValueError(f"Colunas ausentes nas cotações: {', '.join(sorted(missing))}")
+        
+        rates = pd.DataFrame({
+            "currency": rates["currency"].astype(str).str.strip().str.upper(),
+            "date": pd.to_datetime(rates["date"]).dt.strftime("%Y-%m-%d"),
+            "rate": rates["rate"].astype(float),
+        })
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO fx_rates (currency, date, rate) VALUES (?, ?, ?)
+            ON CONFLICT (currency, date) DO UPDATE SET rate = excluded.rate WHERE rate != excluded.rate
+        ''', rates.itertuples(index=False, name=None))
+        changed = cursor.rowcount
+        conn.commit()
+        cursor.execute("SELECT id FROM users")
+        user_ids = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        
+        # Totais já convertidos usaram as cotações antigas
+        self.fx_rates.invalidate()
+        self.currency_totals.invalidate()
+        if changed:
+            # Assim como os checkpoints das contas e os saldos dos envelopes com valores em outra
+            # moeda (refeitos sob demanda)
+            writer = self.get_writer()
+            for future in [writer.submit(user_id, lambda cursor, user_id=user_id: 
+                                         self.drop_converted_balances(cursor, user_id)) for user_id in user_ids]:
+                future.result()
+        return len(rates)
+    
+    def drop_converted_balances(self, cursor, user_id):
+        cursor.execute('''
+            DELETE FROM account_checkpoints WHERE account_id IN (
+                SELECT DISTINCT a.id FROM accounts a JOIN all_transactions t ON t.account_id = a.id
+                WHERE a.user_id = ? AND t.currency != a.currency
+            )
+        ''', (user_id,))
+        # Meses fechados usam os totais congelados: só as transações abertas dependem das cotações
+        cursor.execute('''
+            DELETE FROM budget_envelopes WHERE category_id IN (
+                SELECT DISTINCT cc.ancestor_id FROM category_closure cc JOIN transactions t ON t.category_id = cc.descendant_id
+                WHERE t.user_id = ? AND t.type = 'Despesa' AND t.currency != ?
+            )
+        ''', (user_id, BASE_CURRENCY))
+    
+    def export_excel(self, user_id, file_path):
+        conn = self.get_connection(user_id)
+        
+        # Transações
+        transactions_df = pd.read_sql_query(
+            """SELECT t.type, c.name AS category, t.amount, t.currency, t.description, t.date 
+               FROM all_transactions t JOIN categories c ON c.id = t.category_id 
+               WHERE t.user_id = ?""", 
+            conn, params=[user_id]
+        )
+        
+        # Orçamentos
+        budgets_df = pd.read_sql_query(
+            """SELECT c.name AS category, b.amount, b.month, b.year 
+               FROM budgets b JOIN categories c ON c.id = b.category_id 
+               WHERE b.user_id = ?""", 
+            conn, params=[user_id]
+        )
+        
+        # Metas
+        goals_df = pd.read_sql_query(
+            "SELECT title, target_amount, current_amount, deadline FROM goals WHERE user_id = ?", 
+            conn, params=[user_id]
+        )
+        
+        # Contas e transferências
+        accounts_df = pd.read_sql_query(
+            "SELECT name, currency FROM accounts WHERE user_id = ? ORDER BY name", 
+            conn, params=[user_id]
+        )
+        transfers_df = pd.read_sql_query("""
+            SELECT f.name AS from_account, t.name AS to_account, tr.amount, tr.to_amount, 
+                   tr.description, tr.date
+            FROM transfers tr
+            JOIN accounts f ON f.id = tr.from_account_id
+            JOIN accounts t ON t.id = tr.to_account_id
+            WHERE tr.user_id = ?
+            ORDER BY tr.date
+        """, conn, params=[user_id])
+        
+        conn.close()
+        
+        # Criar arquivo Excel com múltiplas abas
+        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
+            transactions_df.to_excel(writer, sheet_name='Transações', index=False)
+            budgets_df.to_excel(writer, sheet_name='Orçamentos', index=False)
+            goals_df.to_excel(writer, sheet_name='Metas', index=False)
+            accounts_df.to_excel(writer, sheet_name='Contas', index=False)
+            transfers_df.to_excel(writer, sheet_name='Transferências', index=False)
+        return file_path
+    
+    def register_user(self, username, email, password):
+        # Lança sqlite3.IntegrityError se o usuário ou email já existir
+        hashed_password = self.password_hasher.hash(password)
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("INSERT INTO users (username, password, email) VALUES (?, ?, ?)",
+                          (username, hashed_password, email))
+            user_id = cursor.lastrowid
+            if self.layout == "shared":
+                # Categorias padrão gravadas junto com o usuário (no outro layout, ao criar o ledger)
+                self.categories.seed(cursor, user_id)
+            conn.commit()
+        finally:
+            conn.close()
+        
+        if self.layout == "per_user":
+            self.ensure_ledger(user_id)
+        return user_id
+
+class WriteQueue:
+    # Todas as escritas passam por uma única thread, que agrupa as operações pendentes
+    # em uma transação; cada operação roda num SAVEPOINT para falhar sozinha
+    def __init__(self, db_manager, max_batch=WRITE_BATCH_SIZE, max_delay_ms=WRITE_BATCH_DELAY_MS):
+        self.db_manager = db_manager
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.queue = queue.Queue()
+        self.connections = {}
+        self.batches = 0
+        self.operations = 0
+        self.thread = threading.Thread(target=self.run, name="write-queue")
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def submit(self, user_id, function):
+        # function(cursor) roda no escritor; o Future recebe o retorno ou a exceção após o commit
+        future = Future()
+        self.queue.put((user_id, function, future))
+        return future
+    
+    def connection(self, user_id):
+        path = self.db_manager.ledger_path(user_id) if user_id is not None else self.db_manager.db_name
+        conn = self.connections.get(path)
+        if conn is None:
+            conn = self.db_manager.get_connection(user_id)
+            conn.isolation_level = None  # BEGIN/COMMIT controlados pelo lote
+            # WAL: leitores não bloqueiam o escritor e o commit custa um fsync a menos
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.connections[path] = conn
+        return conn
+    
+    def run(self):
+        running = True
+        while running:
+            item = self.queue.get()
+            if item is None:
+                break
+            
+            # Junta o que chegar até completar o lote ou estourar a janela de espera
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            
+            self.apply(batch)
+        
+        for conn in self.connections.values():
+            conn.close()
+    
+    def apply(self, batch):
+        touched = {}
+        outcomes = []
+        
+        for user_id, function, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            
+            try:
+                conn = self.connection(user_id)
+                cursor = conn.cursor()
+                if not conn.in_transaction:
+                    cursor.execute("BEGIN")
+                touched[id(conn)] = conn
+                
+                cursor.execute("SAVEPOINT write_operation")
+                try:
+                    result = function(cursor)
+                    cursor.execute("RELEASE write_operation")
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write_operation")
+                    cursor.execute("RELEASE write_operation")
+                    outcomes.append((future, None, e))
+            except Exception as e:
+                outcomes.append((future, None, e))
+        
+        try:
+            for conn in touched.values():
+                conn.execute("COMMIT")
+        except Exception as e:
+            for conn in touched.values():
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            outcomes = [(future, None, error or e) for future, result, error in outcomes]
+        
+        self.batches += 1
+        self.operations += len(outcomes)
+        
+        # Só agora os resultados ficam visíveis para quem espera
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+    
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+def month_bounds(month, year):
+    first_day = date(year, month, 1)
+    if month < 12:
+        last_day = date(year, month + 1, 1) - timedelta(days=1)
+    else:
+        last_day = date(year, 12, 31)
+    return first_day.isoformat(), last_day.isoformat()
+
+def parse_thresholds(text):
+    # "80, 100" -> (80, 100); vazio usa os limiares padrão
+    thresholds = sorted({int(value) for value in re.findall(r"\d+", text or "") if int(value) > 0})
+    return tuple(thresholds) or DEFAULT_ALERT_THRESHOLDS
+
+class BudgetStatusService:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        # (user_id, month, year) -> [(budget_id, category, amount, spent, carry, limiares)],
+        # carry: saldo trazido do mês anterior nos envelopes (None nos orçamentos sem rollover)
+        self.cache = {}
+        self.positions = {}  # mesma chave -> {categoria: índice da linha} (um orçamento por categoria/mês)
+        self.loaded = {}  # mesma chave -> relógio lógico ao fim da leitura
+        self.clock = 0
+        self.lock = threading.Lock()
+    
+    def tick(self):
+        # Relógio lógico: quem vai escrever marca o momento antes de enviar a escrita
+        with self.lock:
+            self.clock += 1
+            return self.clock
+    
+    def get_status(self, user_id, month, year):
+        key = (user_id, month, year)
+        with self.lock:
+            if key in self.cache:
+                return self.cache[key]
+        
+        budget_month = f"{year:04d}-{month:02d}"
+        
+        conn = self.db_manager.get_connection(user_id)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT b.id, g.name, b.amount, g.rollover, b.category_id, b.alert_thresholds
+            FROM budgets b JOIN categories g ON g.id = b.category_id
+            WHERE b.user_id = ? AND b.month = ? AND b.year = ?
+            ORDER BY g.name
+        """, (user_id, month, year))
+        budgets = cursor.fetchall()
+        
+        # Consumo de todos os orçamentos do mês (subcategorias incluídas) na moeda base, com a mesma
+        # consulta da grade e dos envelopes; mês fechado lido dos totais congelados
+        envelopes = self.db_manager.envelopes
+        spending = envelopes.spending(cursor, user_id, [row[4] for row in budgets], budget_month, budget_month) if budgets else {}
+        status = [(budget_id, category, amount, spending.get((category_id, budget_month), 0), 
+                   envelopes.carry_in(cursor, user_id, category_id, budget_month) if rollover else None,
+                   parse_thresholds(thresholds))
+                  for budget_id, category, amount, rollover, category_id, thresholds in budgets]
+        conn.close()
+        
+        with self.lock:
+            self.clock += 1
+            self.cache[key] = status
+            self.positions[key] = {row[1]: index for index, row in enumerate(status)}
+            self.loaded[key] = self.clock
+        return status
+    
+    def apply_transaction(self, user_id, transaction_date, category, currency, spent, started):
+        # Soma a variação de gasto de uma escrita já confirmada ao consumo em cache do mês, sem
+        # reconsultar os orçamentos; devolve as linhas afetadas (orçamentos da categoria e dos
+        # ancestrais). started: tick() tirado antes de enviar a escrita; um mês lido depois
+        # disso pode já conter a transação e é relido
+        if not spent:
+            return []
+        if currency != BASE_CURRENCY:
+            spent = self.db_manager.fx_rates.convert(spent, currency, BASE_CURRENCY, transaction_date)
+        transaction_date = date.fromisoformat(transaction_date[:10])
+        month = (transaction_date.year, transaction_date.month)
+        key = (user_id, transaction_date.month, transaction_date.year)
+        categories = self.db_manager.categories.ancestors(user_id, category)
+        
+        with self.lock:
+            # Nos envelopes o saldo trazido dos meses seguintes também muda
+            for later in [later for later in self.cache if later[0] == user_id and (later[2], later[1]) > month]:
+                if any(row[1] in categories and row[4] is not None for row in self.cache[later]):
+                    self.drop(later)
+            
+            status = self.cache.get(key)
+            if status is not None and self.loaded[key] < started:
+                status = list(status)
+                changed = []
+                for name in categories:
+                    index = self.positions[key].get(name)
+                    if index is not None:
+                        budget_id, name, amount, previous, carry, thresholds = status[index]
+                        status[index] = (budget_id, name, amount, previous + spent, carry, thresholds)
+                        changed.append(status[index])
+                self.cache[key] = status
+                return changed
+            self.drop(key)
+        
+        return [row for row in self.get_status(user_id, key[1], key[2]) if row[1] in categories]
+    
+    def drop(self, key):
+        # Chamado com o lock
+        self.cache.pop(key, None)
+        self.positions.pop(key, None)
+        self.loaded.pop(key, None)
+    
+    def invalidate_transaction(self, user_id, transaction_date, category):
+        # Só descarta o mês afetado e apenas se a categoria (ou um ancestral dela) tiver orçamento;
+        # nos envelopes o saldo trazido muda também nos meses seguintes
+        transaction_date = date.fromisoformat(transaction_date[:10])
+        month = (transaction_date.year, transaction_date.month)
+        categories = self.db_manager.categories.ancestors(user_id, category)
+        
+        with self.lock:
+            for key in [key for key in self.cache if key[0] == user_id and (key[2], key[1]) >= month]:
+                if any(row[1] in categories and ((key[2], key[1]) == month or row[4] is not None) 
+                       for row in self.cache[key]):
+                    self.drop(key)
+    
+    def invalidate_budgets(self, user_id, month=None, year=None):
+        with self.lock:
+            if month is not None and year is not None:
+                self.drop((user_id, month, year))
+                return
+            for key in [key for key in self.cache if key[0] == user_id]:
+                self.drop(key)
+
+class BudgetAlertEngine:
+    # Avalia os limiares de alerta (80%, 100%...) a cada escrita de transação a partir do consumo em
+    # cache; cada limiar avisa uma vez por orçamento (budget_alerts) e é rearmado se o consumo
+    # voltar a ficar abaixo dele
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.sent = {}  # user_id -> {budget_id: {limiares já avisados}}
+        self.lock = threading.Lock()
+    
+    def reached(self, row):
+        budget_id, category, amount, spent, carry, thresholds = row
+        limit = amount + (carry or 0)
+        if limit <= 0:
+            return set(thresholds) if spent > 0 else set()
+        percentage = spent / limit * 100
+        return {threshold for threshold in thresholds if percentage >= threshold}
+    
+    def load(self, user_id):
+        with self.lock:
+            if user_id in self.sent:
+                return self.sent[user_id]
+        
+        conn = self.db_manager.get_connection(user_id)
+        cursor = conn.cursor()
+        cursor.execute("SELECT budget_id, threshold FROM budget_alerts WHERE user_id = ?", (user_id,))
+        sent = {}
+        for budget_id, threshold in cursor.fetchall():
+            sent.setdefault(budget_id, set()).add(threshold)
+        conn.close()
+        
+        with self.lock:
+            return self.sent.setdefault(user_id, sent)
+    
+    def evaluate(self, user_id, rows):
+        # Só vai ao escritor quando algum limiar foi cruzado (em qualquer sentido); devolve o
+        # future com os avisos novos ou None
+        sent = self.load(user_id)
+        with self.lock:
+            rows = [row for row in rows if self.reached(row) != sent.get(row[0], set())]
+        if not rows:
+            return None
+        
+        future = self.db_manager.get_writer().submit(user_id, lambda cursor: self.record(cursor, user_id, rows))
+        future.add_done_callback(lambda future: future.exception() and self.invalidate_user(user_id))
+        return future
+    
+    def record(self, cursor, user_id, rows):
+        # Roda no escritor; o INSERT OR IGNORE garante um único aviso por limiar mesmo com
+        # avaliações concorrentes do mesmo orçamento
+        alerts = []
+        changes = {}
+        for row in rows:
+            budget_id, category, amount, spent, carry, thresholds = row
+            reached = self.reached(row)
+            cursor.execute("SELECT threshold FROM budget_alerts WHERE budget_id = ?", (budget_id,))
+            rearmed = [(budget_id, threshold) for threshold, in cursor.fetchall() if threshold not in reached]
+            cursor.executemany("DELETE FROM budget_alerts WHERE budget_id = ? AND threshold = ?", rearmed)
+            
+            new = []
+            for threshold in sorted(reached):
+                cursor.execute("""
+                    INSERT OR IGNORE INTO budget_alerts (budget_id, threshold, user_id, spent, amount)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (budget_id, threshold, user_id, spent, amount + (carry or 0)))
+                if cursor.rowcount == 1:
+                    new.append(threshold)
+            if new:
+                # Vários limiares cruzados de uma vez geram só o aviso do mais alto
+                alerts.append((budget_id, category, max(new), spent, amount + (carry or 0)))
+                logger.info("Orçamento %s (%s) atingiu %s%%", budget_id, category, max(new))
+            changes[budget_id] = reached
+        
+        with self.lock:
+            if user_id in self.sent:
+                self.sent[user_id].update(changes)
+        return alerts
+    
+    def invalidate_user(self, user_id):
+        with self.lock:
+            self.sent.pop(user_id, None)
+
+class FxRateTable:
+    # Cotações em memória por moeda: dias (desde 1970-01-01) ordenados e taxas
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.rates = {}
+        self.lock = threading.Lock()
+    
+    def get_rates(self, currency):
+        with self.lock:
+            rates = self.rates.get(currency)
+        if rates is not None:
+            return rates
+        
+        conn = self.db_manager.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT CAST(julianday(date) - 2440587.5 AS INTEGER), rate 
+            FROM fx_rates WHERE currency = ? ORDER BY date
+        """, (currency,))
+        rows = cursor.fetchall()
+        conn.close()
+        
+        table = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        rates = (table[:, 0].astype(np.int32), table[:, 1])
+        with self.lock:
+            self.rates[currency] = rates
+        return rates
+    
+    def multipliers(self, currencies, days):
+        # Taxa de cada linha pela cotação vigente no dia (as-of), uma busca binária por moeda
+        result = np.ones(len(currencies))
+        for currency in pd.unique(currencies):
+            if currency == BASE_CURRENCY:
+                continue
+            
+            rate_days, rates = self.get_rates(currency)
+            if not len(rates):
+                logger.warning("Sem cotação para %s; valores somados sem conversão", currency)
+                continue
+            
+            mask = currencies == currency
+            # Última cotação até a data; antes da primeira, vale a mais antiga
+            index = np.searchsorted(rate_days, days[mask], side='right') - 1
+            result[mask] = rates[np.maximum(index, 0)]
+        return result
+    
+    def convert(self, amount, currency, target, on_date):
+        # Valor de uma moeda para outra pela cotação do dia, via moeda base
+        day = np.array([(date.fromisoformat(on_date[:10]) - date(1970, 1, 1)).days])
+        rates = self.multipliers(np.array([currency, target], dtype=object), np.repeat(day, 2))
+        return amount * rates[0] / rates[1]
+    
+    def invalidate(self):
+        with self.lock:
+            self.rates.clear()
+
+def convert_to_currency(fx_rates, rows, currency):
+    # rows: (chave, moeda, dia, valor) -> {chave: soma na moeda indicada}, pela cotação do dia via moeda base
+    frame = pd.DataFrame(rows, columns=["key", "currency", "day", "amount"])
+    if frame.empty:
+        return {}
+    
+    # Só as linhas em outra moeda consultam cotações
+    foreign = (frame["currency"] != currency).to_numpy()
+    if foreign.any():
+        days = frame["day"].to_numpy()[foreign]
+        rates = (fx_rates.multipliers(frame["currency"].to_numpy()[foreign], days) / 
+                 fx_rates.multipliers(np.full(len(days), currency, dtype=object), days))
+        amounts = frame["amount"].to_numpy(dtype=np.float64, copy=True)
+        amounts[foreign] *= rates
+        frame["amount"] = amounts
+    return frame.groupby("key", sort=True)["amount"].sum().to_dict()
+
+def convert_grouped(fx_rates, rows, values):
+    # rows: (chave, moeda, dia, *valores) agrupadas no SQL -> somas por chave na moeda base
+    frame = pd.DataFrame(rows, columns=["key", "currency", "day", *values])
+    if frame.empty:
+        return frame.set_index("key")[values]
+    
+    rates = fx_rates.multipliers(frame["currency"].to_numpy(), frame["day"].to_numpy())
+    frame[values] = frame[values].to_numpy(dtype=np.float64) * rates[:, None]
+    return frame.groupby("key", sort=True)[values].sum()
+
+class CurrencyTotals:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        # (user_id, moeda, 'AAAA-MM') -> (receitas, despesas) já na moeda base
+        self.cache = {}
+        self.loaded_users = set()
+        self.stale = {}  # user_id -> {(moeda, 'AAAA-MM')} a recalcular
+        self.lock = threading.Lock()
+    
+    def fetch(self, user_id, currency=None, month=None):
+        # Somas por dia (a cotação é diária); na moeda base, uma linha por mês
+        query = f"""
+            SELECT currency, strftime('%Y-%m', date) AS month, {FX_DAY_SQL} AS day,
+                   SUM(CASE WHEN type = 'Receita' THEN amount ELSE 0 END),
+                   SUM(CASE WHEN type = 'Despesa' THEN amount ELSE 0 END)
+            FROM transactions 
+            WHERE user_id = ?
+        """
+        params = [BASE_CURRENCY, user_id]
+        if currency is not None:
+            year, month_number = map(int, month.split("-"))
+            query += " AND currency = ? AND date BETWEEN ? AND ?"
+            params += [currency, *month_bounds(month_number, year)]
+        query += " GROUP BY currency, month, day"
+        
+        conn = self.db_manager.get_connection(user_id)
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        if currency is None:
+            # Meses fechados: totais congelados, já na moeda base
+            cursor.execute("""
+                SELECT ?, substr(date, 1, 7) AS month, 0, SUM(income), SUM(expense)
+                FROM closed_daily_totals WHERE user_id = ? GROUP BY month
+            """, (BASE_CURRENCY, user_id))
+            rows += cursor.fetchall()
+        conn.close()
+        
+        if not rows:
+            return {}
+        
+        frame = pd.DataFrame(rows, columns=["currency", "month", "day", "income", "expense"])
+        rates = self.db_manager.fx_rates.multipliers(frame["currency"].to_numpy(), frame["day"].to_numpy())
+        frame["income"] *= rates
+        frame["expense"] *= rates
+        sums = frame.groupby(["currency", "month"])[["income", "expense"]].sum()
+        return {(user_id, currency, month): tuple(values) 
+                for (currency, month), values in zip(sums.index, sums.to_numpy().tolist())}
+    
+    def monthly(self, user_id):
+        with self.lock:
+            loaded = user_id in self.loaded_users
+            stale = self.stale.pop(user_id, set())
+        
+        if not loaded:
+            entries = self.fetch(user_id)
+            with self.lock:
+                for key in [key for key in self.cache if key[0] == user_id]:
+                    del self.cache[key]
+                self.cache.update(entries)
+                self.loaded_users.add(user_id)
+        
+        # Só os pares (moeda, mês) alterados são recalculados
+        for currency, month in stale if loaded else ():
+            entries = self.fetch(user_id, currency, month)
+            with self.lock:
+                self.cache.pop((user_id, currency, month), None)
+                self.cache.update(entries)
+        
+        with self.lock:
+            return {key[1:]: value for key, value in self.cache.items() if key[0] == user_id}
+    
+    def totals(self, user_id):
+        months = self.monthly(user_id).values()
+        return (sum(income for income, _ in months), sum(expense for _, expense in months))
+    
+    def invalidate_transaction(self, user_id, transaction_date, currency):
+        with self.lock:
+            if user_id in self.loaded_users:
+                self.stale.setdefault(user_id, set()).add((currency, transaction_date[:7]))
+    
+    def invalidate(self, user_id=None):
+        with self.lock:
+            if user_id is None:
+                self.cache.clear()
+                self.loaded_users.clear()
+                self.stale.clear()
+                return
+            self.loaded_users.discard(user_id)
+            self.stale.pop(user_id, None)
+
+def add_months(month, count):
+    # 'AAAA-MM' deslocado de count meses
+    year, month_number = map(int, month.split("-"))
+    index = year * 12 + month_number - 1 + count
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+class AccountBalanceIndex:
+    # Saldo em uma data = checkpoint do fim do mês anterior + movimentos do próprio mês
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    def balances(self, user_id, as_of=None):
+        # [(id, nome, moeda, saldo)] de todas as contas do usuário
+        as_of = as_of or date.today().isoformat()
+        # Checkpoints só até o mês passado: o mês corrente ainda muda
+        until_month = min(add_months(as_of[:7], -1), add_months(date.today().isoformat()[:7], -1))
+        
+        conn = self.db_manager.get_connection(user_id)
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name, currency FROM accounts WHERE user_id = ? ORDER BY name", (user_id,))
+        accounts = cursor.fetchall()
+        
+        balances = []
+        for account_id, name, currency in accounts:
+            balance, checkpoint = self.balance_as_of(cursor, account_id, currency, as_of)
+            balances.append((account_id, name, currency, balance))
+            if checkpoint is None or checkpoint < until_month:
+                # Enquanto faltar checkpoint, a varredura fica maior; a fila de escrita completa o índice
+                self.extend_checkpoints(user_id, account_id, until_month)
+        conn.close()
+        return balances
+    
+    def balance_as_of(self, cursor, account_id, currency, as_of):
+        cursor.execute("""
+            SELECT month, balance FROM account_checkpoints 
+            WHERE account_id = ? AND month < ? 
+            ORDER BY month DESC LIMIT 1
+        """, (account_id, as_of[:7]))
+        checkpoint = cursor.fetchone()
+        
+        start = add_months(checkpoint[0], 1) + "-01" if checkpoint else ""
+        end = (date.fromisoformat(as_of[:10]) + timedelta(days=1)).isoformat()
+        balance = (checkpoint[1] if checkpoint else 0) + self.movements(cursor, account_id, currency, start, end)
+        return balance, checkpoint[0] if checkpoint else None
+    
+    def movements(self, cursor, account_id, currency, start, end):
+        # Variação do saldo entre start (inclusive) e end (exclusive), na moeda da conta
+        cursor.execute(f"""
+            SELECT 0, currency, {FX_DAY_SQL} AS day, SUM(CASE WHEN type = 'Receita' THEN amount ELSE -amount END)
+            FROM all_transactions WHERE account_id = ? AND date >= ? AND date < ?
+            GROUP BY currency, day
+        """, (currency, account_id, start, end))
+        total = convert_to_currency(self.db_manager.fx_rates, cursor.fetchall(), currency).get(0, 0)
+        cursor.execute("""
+            SELECT COALESCE(SUM(to_amount), 0) FROM transfers 
+            WHERE to_account_id = ? AND date >= ? AND date < ?
+        """, (account_id, start, end))
+        total += cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT COALESCE(SUM(amount), 0) FROM transfers 
+            WHERE from_account_id = ? AND date >= ? AND date < ?
+        """, (account_id, start, end))
+        return total - cursor.fetchone()[0]
+    
+    def extend_checkpoints(self, user_id, account_id, until_month):
+        # Roda no escritor: o cálculo e a gravação ficam na mesma transação que os triggers
+        def build(cursor):
+            cursor.execute("SELECT currency FROM accounts WHERE id = ?", (account_id,))
+            currency = cursor.fetchone()[0]
+            cursor.execute("""
+                SELECT month, balance FROM account_checkpoints 
+                WHERE account_id = ? AND month <= ? ORDER BY month DESC LIMIT 1
+            """, (account_id, until_month))
+            last = cursor.fetchone()
+            if last:
+                first_month, balance = add_months(last[0], 1), last[1]
+            else:
+                cursor.execute("""
+                    SELECT MIN(first_date) FROM (
+                        SELECT MIN(date) AS first_date FROM all_transactions WHERE account_id = ?
+                        UNION ALL SELECT MIN(date) FROM transfers WHERE from_account_id = ?
+                        UNION ALL SELECT MIN(date) FROM transfers WHERE to_account_id = ?
+                    )
+                """, (account_id, account_id, account_id))
+                first_date = cursor.fetchone()[0]
+                # Sem movimentos até until_month (conta vazia ou só com o mês corrente): um checkpoint
+                # zerado marca o índice como completo e as leituras seguintes não voltam à fila
+                first_month = min(first_date[:7], until_month) if first_date else until_month
+                balance = 0
+            
+            if first_month > until_month:
+                return 0
+            
+            # Variação de cada mês do intervalo em uma passada por tabela; transações em outra
+            # moeda convertidas pela cotação do dia (transferências já estão na moeda de cada conta)
+            start, end = first_month + "-01", add_months(until_month, 1) + "-01"
+            cursor.execute(f"""
+                SELECT strftime('%Y-%m', date) AS month, currency, {FX_DAY_SQL} AS day,
+                       SUM(CASE WHEN type = 'Receita' THEN amount ELSE -amount END)
+                FROM all_transactions WHERE account_id = ? AND date >= ? AND date < ?
+                GROUP BY month, currency, day
+            """, (currency, account_id, start, end))
+            changes = convert_to_currency(self.db_manager.fx_rates, cursor.fetchall(), currency)
+            cursor.execute("""
+                SELECT strftime('%Y-%m', date) AS month, SUM(to_amount)
+                FROM transfers WHERE to_account_id = ? AND date >= ? AND date < ?
+                GROUP BY month
+                UNION ALL
+                SELECT strftime('%Y-%m', date) AS month, -SUM(amount)
+                FROM transfers WHERE from_account_id = ? AND date >= ? AND date < ?
+                GROUP BY month
+            """, (account_id, start, end) * 2)
+            for month, change in cursor.fetchall():
+                changes[month] = changes.get(month, 0) + change
+            
+            checkpoints = []
+            month = first_month
+            while month <= until_month:
+                balance += changes.get(month, 0)
+                checkpoints.append((account_id, month, balance))
+                month = add_months(month, 1)
+            
+            cursor.executemany("INSERT OR REPLACE INTO account_checkpoints (account_id, month, balance) VALUES (?, ?, ?)", 
+                               checkpoints)
+            return len(checkpoints)
+        
+        return self.db_manager.get_writer().submit(user_id, build)
+
+class BudgetEnvelopes:
+    # Envelopes: nas categorias com rollover, a sobra (ou o estouro) de cada mês passa para o seguinte.
+    # Saldo trazido para um mês = saldo gravado mais recente + meses ainda sem saldo gravado
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    def first_month(self, cursor, user_id, category_id):
+        # O envelope começa no primeiro mês orçado da categoria
+        cursor.execute(f"""
+            SELECT MIN({BUDGET_MONTH_SQL.format(row="")}) FROM budgets WHERE user_id = ? AND category_id = ?
+        """, (user_id, category_id))
+        return cursor.fetchone()[0]
+    
+    def carry_in(self, cursor, user_id, category_id, month):
+        # Saldo do envelope no fim do mês anterior a month
+        first_month = self.first_month(cursor, user_id, category_id)
+        if first_month is None or first_month >= month:
+            return 0
+        
+        cursor.execute("""
+            SELECT month, balance FROM budget_envelopes 
+            WHERE category_id = ? AND month < ? 
+            ORDER BY month DESC LIMIT 1
+        """, (category_id, month))
+        saved = cursor.fetchone()
+        
+        previous_month = add_months(month, -1)
+        balance = saved[1] if saved else 0
+        start = add_months(saved[0], 1) if saved else first_month
+        if start <= previous_month:
+            # Enquanto faltar saldo gravado, os meses restantes são somados; a fila de escrita completa o envelope
+            balance += sum(self.monthly_changes(cursor, user_id, category_id, start, previous_month).values())
+            self.extend(user_id, category_id, previous_month)
+        return balance
+    
+    def allocations(self, cursor, user_id, category_ids, first_month, last_month):
+        # {(category_id, 'AAAA-MM'): valor orçado}
+        cursor.execute(f"""
+            SELECT category_id, {BUDGET_MONTH_SQL.format(row="")} AS budget_month, amount FROM budgets
+            WHERE user_id = ? AND category_id IN ({", ".join("?" * len(category_ids))})
+            AND budget_month BETWEEN ? AND ?
+        """, (user_id, *category_ids, first_month, last_month))
+        return {(category_id, month): amount for category_id, month, amount in cursor.fetchall()}
+    
+    def spending(self, cursor, user_id, category_ids, first_month, last_month):
+        # {(category_id, 'AAAA-MM'): gasto da categoria e das subcategorias}, meses fechados incluídos,
+        # na moeda base: transações em outra moeda pela cotação do dia, como os totais congelados
+        placeholders = ", ".join("?" * len(category_ids))
+        cursor.execute(f"""
+            SELECT cc.ancestor_id, strftime('%Y-%m', t.date) AS spent_month, t.currency, {FX_DAY_SQL} AS day, 
+                   SUM(t.amount)
+            FROM category_closure cc JOIN transactions t 
+                ON t.user_id = ? AND t.type = 'Despesa' AND t.category_id = cc.descendant_id
+                AND t.date >= ? AND t.date < ?
+            WHERE cc.ancestor_id IN ({placeholders})
+            GROUP BY cc.ancestor_id, spent_month, t.currency, day
+        """, (BASE_CURRENCY, user_id, first_month + "-01", add_months(last_month, 1) + "-01", *category_ids))
+        spending = convert_to_currency(self.db_manager.fx_rates, 
+                                       [((category_id, month), currency, day, amount) 
+                                        for category_id, month, currency, day, amount in cursor.fetchall()], 
+                                       BASE_CURRENCY)
+        cursor.execute(f"""
+            SELECT cc.ancestor_id, c.month, SUM(c.amount)
+            FROM category_closure cc JOIN closed_period_totals c 
+                ON c.user_id = ? AND c.type = 'Despesa' AND c.category_id = cc.descendant_id
+                AND c.month BETWEEN ? AND ?
+            WHERE cc.ancestor_id IN ({placeholders})
+            GROUP BY cc.ancestor_id, c.month
+        """, (user_id, first_month, last_month, *category_ids))
+        for category_id, month, amount in cursor.fetchall():
+            spending[(category_id, month)] = spending.get((category_id, month), 0) + amount
+        return spending
+    
+    def monthly_changes(self, cursor, user_id, category_id, first_month, last_month):
+        # {'AAAA-MM': orçado - gasto} de um envelope, em uma passada por tabela
+        changes = {}
+        for (_, month), amount in self.allocations(cursor, user_id, [category_id], first_month, last_month).items():
+            changes[month] = changes.get(month, 0) + amount
+        for (_, month), amount in self.spending(cursor, user_id, [category_id], first_month, last_month).items():
+            changes[month] = changes.get(month, 0) - amount
+        return changes
+    
+    def extend(self, user_id, category_id, until_month):
+        # Roda no escritor: o cálculo e a gravação ficam na mesma transação que os triggers
+        def build(cursor):
+            cursor.execute("SELECT rollover FROM categories WHERE id = ?", (category_id,))
+            row = cursor.fetchone()
+            if row is None or not row[0]:
+                return 0
+            
+            cursor.execute("""
+                SELECT month, balance FROM budget_envelopes 
+                WHERE category_id = ? ORDER BY month DESC LIMIT 1
+            """, (category_id,))
+            last = cursor.fetchone()
+            if last:
+                first_month, balance = add_months(last[0], 1), last[1]
+            else:
+                first_month, balance = self.first_month(cursor, user_id, category_id), 0
+                if first_month is None:
+                    return 0
+            
+            if first_month > until_month:
+                return 0
+            
+            changes = self.monthly_changes(cursor, user_id, category_id, first_month, until_month)
+            balances = []
+            month = first_month
+            while month <= until_month:
+                balance += changes.get(month, 0)
+                balances.append((category_id, month, balance))
+                month = add_months(month, 1)
+            
+            cursor.executemany("INSERT OR REPLACE INTO budget_envelopes (category_id, month, balance) VALUES (?, ?, ?)", 
+                               balances)
+            return len(balances)
+        
+        return self.db_manager.get_writer().submit(user_id, build)
+    
+    def apply_spending(self, cursor, rows):
+        # rows: (tipo, category_id, data, valor[, moeda]) de transações inseridas; valores em outra
+        # moeda entram convertidos para a moeda base. Uma atualização por (categoria, mês) nos
+        # envelopes da categoria e dos ancestrais
+        changes = {}
+        for transaction_type, category_id, transaction_date, amount, *currency in rows:
+            if transaction_type == "Despesa":
+                if currency and currency[0] != BASE_CURRENCY:
+                    amount = self.db_manager.fx_rates.convert(amount, currency[0], BASE_CURRENCY, transaction_date)
+                key = (category_id, transaction_date[:7])
+                changes[key] = changes.get(key, 0) + amount
+        cursor.executemany("""
+            UPDATE budget_envelopes SET balance = balance - ?
+            WHERE month >= ? 
+            AND category_id IN (SELECT ancestor_id FROM category_closure WHERE descendant_id = ?)
+            AND ? >= (SELECT MIN(month) FROM budget_envelopes e WHERE e.category_id = budget_envelopes.category_id)
+        """, [(amount, month, category_id, month) for (category_id, month), amount in changes.items()])
+    
+    def grid(self, user_id, first_month, last_month):
+        # Grade de vários meses: (meses, [(category_id, nome, rollover, [(orçado, gasto, saldo trazido)])]);
+        # orçado é None nos meses sem orçamento
+        months = [first_month]
+        while months[-1] < last_month:
+            months.append(add_months(months[-1], 1))
+        
+        conn = self.db_manager.get_connection(user_id)
+        cursor = conn.cursor()
+        
+        # Categorias orçadas no intervalo e envelopes abertos antes dele
+        cursor.execute(f"""
+            SELECT c.id, c.name, c.rollover FROM categories c
+            WHERE c.user_id = ? AND EXISTS (
+                SELECT 1 FROM budgets b WHERE b.user_id = c.user_id AND b.category_id = c.id
+                AND {BUDGET_MONTH_SQL.format(row="b.")} <= ?
+                AND (c.rollover = 1 OR {BUDGET_MONTH_SQL.format(row="b.")} >= ?)
+            )
+            ORDER BY c.name
+        """, (user_id, last_month, first_month))
+        categories = cursor.fetchall()
+        if not categories:
+            conn.close()
+            return months, []
+        
+        category_ids = [row[0] for row in categories]
+        allocations = self.allocations(cursor, user_id, category_ids, first_month, last_month)
+        spending = self.spending(cursor, user_id, category_ids, first_month, last_month)
+        
+        rows = []
+        for category_id, name, rollover in categories:
+            carry = self.carry_in(cursor, user_id, category_id, first_month) if rollover else 0
+            start = self.first_month(cursor, user_id, category_id)
+            cells = []
+            for month in months:
+                allocated = allocations.get((category_id, month))
+                spent = spending.get((category_id, month), 0)
+                cells.append((allocated, spent, carry))
+                if rollover and month >= start:
+                    carry += (allocated or 0) - spent
+            rows.append((category_id, name, bool(rollover), cells))
+        
+        conn.close()
+        return months, rows
+
+class ClosedPeriodError(sqlite3.IntegrityError):
+    pass
+
+class PeriodClosing:
+    # Fechamento de período: os meses até closed_through saem da tabela de transações para
+    # transactions_archive e seus totais (na moeda base) são gravados uma única vez
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    def closed_through(self, cursor, user_id):
+        cursor.execute("SELECT closed_through FROM closed_periods WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    
+    def check_open(self, cursor, user_id, dates):
+        # Chamado pelas inserções antes de gravar (roda no escritor)
+        closed_through = self.closed_through(cursor, user_id)
+        if closed_through is not None and dates and min(dates)[:7] <= closed_through:
+            raise ClosedPeriodError(f"{CLOSED_PERIOD_ERROR} até {closed_through}")
+    
+    def close(self, cursor, user_id, through_month):
+        # Roda no escritor: totais, cópia e exclusão na mesma transação
+        if through_month >= date.today().isoformat()[:7]:
+            raise ValueError("Só é possível fechar meses já encerrados")
+        
+        previous = self.closed_through(cursor, user_id)
+        if previous is not None and through_month <= previous:
+            raise ValueError(f"Os meses até {previous} já estão fechados")
+        
+        start = add_months(previous, 1) + "-01" if previous else ""
+        end = add_months(through_month, 1) + "-01"
+        
+        cursor.execute("""
+            SELECT strftime('%Y-%m', date), date(date), type, category_id, currency,
+                   CAST(julianday(date) - 2440587.5 AS INTEGER), SUM(amount), COUNT(*)
+            FROM transactions 
+            WHERE user_id = ? AND date >= ? AND date < ?
+            GROUP BY 1, 2, 3, 4, 5
+        """, (user_id, start, end))
+        frame = pd.DataFrame(cursor.fetchall(), 
+                             columns=["month", "day", "type", "category_id", "currency", "fx_day", "amount", "count"])
+        
+        if not frame.empty:
+            # Cotação da data de cada transação, congelada junto com os totais
+            frame["amount"] *= self.db_manager.fx_rates.multipliers(frame["currency"].to_numpy(), 
+                                                                    frame["fx_day"].to_numpy())
+            
+            monthly = frame.groupby(["month", "type", "category_id"])[["amount", "count"]].sum()
+            cursor.executemany("""
+                INSERT INTO closed_period_totals (user_id, month, type, category_id, amount, count)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(user_id, *key, float(amount), int(count)) 
+                  for key, (amount, count) in zip(monthly.index, monthly.to_numpy().tolist())])
+            
+            frame["income"] = frame["amount"].where(frame["type"] == "Receita", 0)
+            frame["expense"] = frame["amount"].where(frame["type"] == "Despesa", 0)
+            daily = frame.groupby("day")[["income", "expense"]].sum()
+            cursor.executemany("""
+                INSERT INTO closed_daily_totals (user_id, date, income, expense) VALUES (?, ?, ?, ?)
+            """, [(user_id, day, income, expense) 
+                  for day, (income, expense) in zip(daily.index, daily.to_numpy().tolist())])
+        
+        # Copia antes de excluir: os triggers de exclusão ignoram ids já arquivados
+        cursor.execute(f"""
+            INSERT INTO transactions_archive ({ARCHIVED_TRANSACTION_COLUMNS})
+            SELECT {ARCHIVED_TRANSACTION_COLUMNS} FROM transactions
+            WHERE user_id = ? AND date >= ? AND date < ?
+        """, (user_id, start, end))
+        archived = cursor.rowcount
+        cursor.execute("DELETE FROM transactions WHERE user_id = ? AND date >= ? AND date < ?", 
+                       (user_id, start, end))
+        
+        cursor.execute("""
+            INSERT OR REPLACE INTO closed_periods (user_id, closed_through, closed_at) 
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+        """, (user_id, through_month))
+        return archived
+
+class CategoryTree:
+    # Categorias do usuário em memória: alimentam os combos e traduzem category_id -> nome
+    # nas leituras; criações passam pelo escritor
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        # user_id -> ([(id, nome, parent_id, tipo)], {id: [ids da raiz até a categoria]}),
+        # pais antes dos filhos e irmãos por nome; os caminhos vêm do fecho da árvore
+        self.cache = {}
+        self.lock = threading.Lock()
+    
+    def get(self, user_id):
+        return self.load(user_id)[0]
+    
+    def load(self, user_id):
+        with self.lock:
+            cached = self.cache.get(user_id)
+        if cached is not None:
+            return cached
+        
+        # Só leitura: as categorias padrão são gravadas no cadastro do usuário ou na migração
+        conn = self.db_manager.get_connection(user_id)
+        cursor = conn.cursor()
+        rows, paths = self.fetch(cursor, user_id)
+        conn.close()
+        
+        children = {}
+        for row in sorted(rows, key=lambda row: row[1]):
+            children.setdefault(row[2], []).append(row)
+        ordered, stack = [], list(reversed(children.get(None, [])))
+        while stack:
+            row = stack.pop()
+            ordered.append(row)
+            stack.extend(reversed(children.get(row[0], [])))
+        
+        with self.lock:
+            self.cache[user_id] = (ordered, paths)
+        return ordered, paths
+    
+    def fetch(self, cursor, user_id):
+        cursor.execute("SELECT id, name, parent_id, type FROM categories WHERE user_id = ?", (user_id,))
+        rows = cursor.fetchall()
+        cursor.execute("""
+            SELECT cc.descendant_id, cc.ancestor_id 
+            FROM categories c JOIN category_closure cc ON cc.descendant_id = c.id
+            WHERE c.user_id = ?
+            ORDER BY cc.descendant_id, cc.depth DESC
+        """, (user_id,))
+        paths = {}
+        for descendant_id, ancestor_id in cursor.fetchall():
+            paths.setdefault(descendant_id, []).append(ancestor_id)
+        return rows, paths
+    
+    def names(self, user_id, category_ids=()):
+        # Ids desconhecidos (categoria criada depois da leitura) recarregam a lista uma vez
+        names = {row[0]: row[1] for row in self.get(user_id)}
+        if any(category_id not in names for category_id in category_ids):
+            self.invalidate(user_id)
+            names = {row[0]: row[1] for row in self.get(user_id)}
+        return names
+    
+    def ids(self, user_id):
+        return {row[1]: row[0] for row in self.get(user_id)}
+    
+    def choices(self, user_id, transaction_type=None):
+        # (rótulo com o caminho na árvore, nome) para os combos, filtrado pelo tipo quando informado
+        rows, paths = self.load(user_id)
+        names = {row[0]: row[1] for row in rows}
+        return [(" / ".join(names[ancestor_id] for ancestor_id in paths.get(category_id, [category_id])), name)
+                for category_id, name, parent_id, category_type in rows
+                if transaction_type is None or category_type in (None, transaction_type)]
+    
+    def label(self, user_id, category_id):
+        rows, paths = self.load(user_id)
+        names = {row[0]: row[1] for row in rows}
+        return " / ".join(names[ancestor_id] for ancestor_id in paths.get(category_id, [category_id]))
+    
+    def ancestors(self, user_id, name):
+        # Nomes da categoria e de todos os seus ancestrais (os totais deles incluem a categoria)
+        rows, paths = self.load(user_id)
+        ids = {row[1]: row[0] for row in rows}
+        if name not in ids:
+            return {name}
+        names = {row[0]: row[1] for row in rows}
+        return {names[ancestor_id] for ancestor_id in paths.get(ids[name], [ids[name]])}
+    
+    def children(self, user_id, parent_id):
+        return [row for row in self.get(user_id) if row[2] == parent_id]
+    
+    def parent(self, user_id, category_id):
+        return next((row[2] for row in self.get(user_id) if row[0] == category_id), None)
+    
+    def seed(self, cursor, user_id):
+        cursor.executemany("INSERT OR IGNORE INTO categories (user_id, name, type) VALUES (?, ?, ?)", 
+                           [(user_id, name, category_type) for name, category_type in DEFAULT_CATEGORIES])
+    
+    def resolve(self, cursor, user_id, name):
+        # Roda no escritor: id da categoria pelo nome, criando-a se ainda não existir
+        cursor.execute("SELECT id FROM categories WHERE user_id = ? AND name = ?", (user_id, name))
+        row = cursor.fetchone()
+        if row is not None:
+            return row[0]
+        
+        self.seed(cursor, user_id)
+        cursor.execute("INSERT OR IGNORE INTO categories (user_id, name) VALUES (?, ?)", (user_id, name))
+        cursor.execute("SELECT id FROM categories WHERE user_id = ? AND name = ?", (user_id, name))
+        self.invalidate(user_id)
+        return cursor.fetchone()[0]
+    
+    def invalidate(self, user_id):
+        with self.lock:
+            self.cache.pop(user_id, None)
+
+# Cache colunar das transações em memória (FINANCE_COLUMNAR_CACHE=0 desativa)
+COLUMNAR_CACHE_ENABLED = os.getenv('FINANCE_COLUMNAR_CACHE', '1') == '1'
+
+class TransactionColumns:
+    # Colunas ordenadas por (dia, id); categoria e tipo codificados por dicionário
+    # Linhas no formato (id, tipo, categoria, centavos, descrição, dias desde 1970-01-01, moeda);
+    # com category_names a categoria vem como category_id e é traduzida só nos valores distintos
+    def __init__(self, rows, category_names=None):
+        table = np.array(rows, dtype=object).reshape(-1, 7)
+        ids = table[:, 0].astype(np.int64)
+        days = table[:, 5].astype(np.int32)
+        order = np.lexsort((ids, days))
+        
+        type_column, self.types = pd.factorize(table[:, 1])
+        category_column, self.categories = pd.factorize(table[:, 2])
+        currency_column, self.currencies = pd.factorize(table[:, 6])
+        self.types = list(self.types)
+        self.categories = list(self.categories)
+        if category_names is not None:
+            self.categories = [category_names.get(category_id) for category_id in self.categories]
+        self.currencies = list(self.currencies)
+        self.type_codes = {value: code for code, value in enumerate(self.types)}
+        self.category_codes = {value: code for code, value in enumerate(self.categories)}
+        self.currency_codes = {value: code for code, value in enumerate(self.currencies)}
+        
+        self.ids = ids[order]
+        self.days = days[order]
+        self.cents = table[:, 3].astype(np.int64)[order]
+        self.category_column = category_column.astype(np.int32)[order]
+        self.type_column = type_column.astype(np.int8)[order]
+        self.currency_column = currency_column.astype(np.int16)[order]
+        self.descriptions = table[order, 4]
+    
+    def encode_category(self, category):
+        code = self.category_codes.get(category)
+        if code is None:
+            code = self.category_codes[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+    
+    def encode_type(self, transaction_type):
+        code = self.type_codes.get(transaction_type)
+        if code is None:
+            code = self.type_codes[transaction_type] = len(self.types)
+            self.types.append(transaction_type)
+        return code
+    
+    def encode_currency(self, currency):
+        code = self.currency_codes.get(currency)
+        if code is None:
+            code = self.currency_codes[currency] = len(self.currencies)
+            self.currencies.append(currency)
+        return code
+    
+    def position_of(self, transaction_id):
+        positions = np.flatnonzero(self.ids == transaction_id)
+        return positions[0] if len(positions) else None
+    
+    def remove(self, transaction_id):
+        position = self.position_of(transaction_id)
+        if position is None:
+            return
+        
+        self.ids = np.delete(self.ids, position)
+        self.days = np.delete(self.days, position)
+        self.cents = np.delete(self.cents, position)
+        self.category_column = np.delete(self.category_column, position)
+        self.type_column = np.delete(self.type_column, position)
+        self.currency_column = np.delete(self.currency_column, position)
+        self.descriptions = np.delete(self.descriptions, position)
+    
+    def upsert(self, transaction_id, transaction_type, category, amount, description, transaction_date, currency):
+        self.remove(transaction_id)
+        
+        day = np.datetime64(transaction_date[:10], 'D').astype(np.int32)
+        # Mantém a ordenação por (dia, id) com busca binária
+        start = np.searchsorted(self.days, day, side='left')
+        end = np.searchsorted(self.days, day, side='right')
+        position = start + np.searchsorted(self.ids[start:end], transaction_id)
+        
+        self.ids = np.insert(self.ids, position, transaction_id)
+        self.days = np.insert(self.days, position, day)
+        self.cents = np.insert(self.cents, position, round(amount * 100))
+        self.category_column = np.insert(self.category_column, position, self.encode_category(category))
+        self.type_column = np.insert(self.type_column, position, self.encode_type(transaction_type))
+        self.currency_column = np.insert(self.currency_column, position, self.encode_currency(currency))
+        self.descriptions = np.insert(self.descriptions, position, description)
+    
+    def query(self, start_date, end_date, transaction_type=None, category=None):
+        # Mais recentes primeiro, como o ORDER BY date DESC da consulta
+        return self.rows(self.select(start_date, end_date, transaction_type, category))
+    
+    def select(self, start_date=None, end_date=None, transaction_type=None, category=None,
+               sort_key="date", descending=True):
+        # Intervalo de datas por busca binária; tipo e categoria por máscara
+        lo = 0 if start_date is None else np.searchsorted(
+            self.days, np.datetime64(start_date, 'D').astype(np.int32), side='left')
+        hi = len(self.days) if end_date is None else np.searchsorted(
+            self.days, np.datetime64(end_date, 'D').astype(np.int32), side='right')
+        mask = np.ones(hi - lo, dtype=bool)
+        
+        if transaction_type is not None:
+            mask &= self.type_column[lo:hi] == self.type_codes.get(transaction_type, -1)
+        if category is not None:
+            mask &= self.category_column[lo:hi] == self.category_codes.get(category, -1)
+        
+        selected = lo + np.flatnonzero(mask)
+        if sort_key != "date":
+            # As colunas já estão em (dia, id); para as demais ordena por (valor, id)
+            if sort_key == "amount":
+                values = self.cents[selected]
+            else:
+                labels = self.categories if sort_key == "category_id" else self.types
+                codes = self.category_column if sort_key == "category_id" else self.type_column
+                # Posição de cada código na ordem alfabética dos rótulos
+                ranks = np.argsort(np.argsort(np.array(labels, dtype=object))) if labels else np.zeros(0, dtype=np.int64)
+                values = ranks[codes[selected]]
+            selected = selected[np.lexsort((self.ids[selected], values))]
+        
+        return selected[::-1] if descending else selected
+    
+    def rows(self, selected):
+        types = np.array(self.types + [None], dtype=object)
+        categories = np.array(self.categories + [None], dtype=object)
+        currencies = np.array(self.currencies + [None], dtype=object)
+        dates = np.datetime_as_string(self.days[selected].astype('datetime64[D]'))
+        
+        return list(zip(self.ids[selected].tolist(),
+                        types[self.type_column[selected]].tolist(),
+                        categories[self.category_column[selected]].tolist(),
+                        (self.cents[selected] / 100).tolist(),
+                        self.descriptions[selected].tolist(),
+                        dates.tolist(),
+                        currencies[self.currency_column[selected]].tolist()))
+
+def fetch_transaction_columns(db_manager, user_id):
+    conn = db_manager.get_connection(user_id)
+    cursor = conn.cursor()
+    # Centavos e dias já convertidos pelo SQLite
+    cursor.execute("""
+        SELECT id, type, category_id, CAST(ROUND(amount * 100) AS INTEGER), description,
+               CAST(julianday(date) - 2440587.5 AS INTEGER), currency
+        FROM all_transactions 
+        WHERE user_id = ?
+    """, (user_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    return TransactionColumns(rows, db_manager.categories.names(user_id, {row[2] for row in rows}))
+
+class TransactionColumnCache:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        # user_id -> TransactionColumns
+        self.columns = {}
+        self.lock = threading.Lock()
+    
+    def get_columns(self, user_id):
+        with self.lock:
+            columns = self.columns.get(user_id)
+        if columns is not None:
+            return columns
+        
+        columns = fetch_transaction_columns(self.db_manager, user_id)
+        with self.lock:
+            self.columns[user_id] = columns
+        return columns
+    
+    def query(self, user_id, start_date, end_date, transaction_type=None, category=None):
+        columns = self.get_columns(user_id)
+        with self.lock:
+            return columns.query(start_date, end_date, transaction_type, category)
+    
+    def snapshot(self, user_id):
+        # Cópia rasa: as atualizações trocam os arrays, então a cópia continua consistente
+        columns = self.get_columns(user_id)
+        with self.lock:
+            return copy.copy(columns)
+    
+    def upsert(self, user_id, transaction_id, transaction_type, category, amount, description, 
+               transaction_date, currency):
+        # Só atualiza usuários já carregados; os demais são lidos na próxima consulta
+        with self.lock:
+            columns = self.columns.get(user_id)
+            if columns is not None:
+                columns.upsert(transaction_id, transaction_type, category, amount, description, 
+                               transaction_date, currency)
+    
+    def remove(self, user_id, transaction_id):
+        with self.lock:
+            columns = self.columns.get(user_id)
+            if columns is not None:
+                columns.remove(transaction_id)
+    
+    def invalidate_user(self, user_id):
+        with self.lock:
+            self.columns.pop(user_id, None)
+
+class TransactionPager:
+    # Páginas da listagem de transações com ordenação feita no banco (ou no cache colunar)
+    def __init__(self, db_manager, user_id, filters=None, sort_key="date", descending=True,
+                 page_size=TRANSACTION_PAGE_SIZE, transaction_cache=None):
+        self.db_manager = db_manager
+        self.user_id = user_id
+        self.filters = filters or {}
+        self.sort_key = sort_key
+        self.descending = descending
+        self.page_size = page_size
+        self.transaction_cache = transaction_cache
+        self.exhausted = False
+        # Chave (valor da coluna, id) da última linha entregue
+        self.last_key = None
+        # Caminho em memória: posições ordenadas e deslocamento
+        self.columns = None
+        self.positions = None
+        self.offset = 0
+    
+    def next_page(self):
+        if self.exhausted:
+            return []
+        rows = self.next_cached_page() if self.transaction_cache is not None else self.next_sql_page()
+        self.exhausted = len(rows) < self.page_size
+        return rows
+    
+    def next_cached_page(self):
+        if self.positions is None:
+            self.columns = self.transaction_cache.snapshot(self.user_id)
+            self.positions = self.columns.select(
+                self.filters.get("start"), self.filters.get("end"), self.filters.get("type"),
+                self.filters.get("category"), self.sort_key, self.descending)
+        
+        page = self.positions[self.offset:self.offset + self.page_size]
+        self.offset += len(page)
+        return self.columns.rows(page)
+    
+    def next_sql_page(self):
+        categories = self.db_manager.categories
+        category = self.filters.get("category")
+        # Filtro por nome: uma categoria inexistente não casa com nenhum id
+        category_id = categories.ids(self.user_id).get(category, 0) if category is not None else None
+        
+        conn = self.db_manager.get_connection(self.user_id)
+        cursor = conn.cursor()
+        if self.sort_key != "category_id":
+            rows = self.fetch_sql_page(cursor, category_id, self.page_size)
+        else:
+            # Ordem alfabética dos nomes, não dos ids: percorre as categorias nessa ordem,
+            # cada uma pelo índice (user_id, category_id, id)
+            names = categories.names(self.user_id)
+            ordered = sorted(names, key=names.get, reverse=self.descending)
+            if category_id is not None:
+                ordered = [category_id] if category_id in names else []
+            if self.last_key is not None:
+                ordered = ordered[ordered.index(self.last_key[0]):]
+            
+            rows = []
+            for current in ordered:
+                if self.last_key is not None and self.last_key[0] != current:
+                    self.last_key = None
+                rows += self.fetch_sql_page(cursor, current, self.page_size - len(rows))
+                if len(rows) == self.page_size:
+                    break
+        conn.close()
+        
+        names = categories.names(self.user_id, {row[2] for row in rows})
+        return [(row[0], row[1], names.get(row[2]), *row[3:]) for row in rows]
+    
+    def fetch_sql_page(self, cursor, category_id, limit):
+        query = """
+            SELECT id, type, category_id, amount, description, date, currency 
+            FROM all_transactions 
+            WHERE user_id = ?
+        """
+        params = [self.user_id]
+        for field, condition, value in (("type", "type = ?", self.filters.get("type")), 
+                                        ("category", "category_id = ?", category_id),
+                                        ("start", "date >= ?", self.filters.get("start")), 
+                                        ("end", "date <= ?", self.filters.get("end"))):
+            if value is not None:
+                query += f" AND {condition}"
+                params.append(value)
+        
+        # Keyset: continua depois da última linha em vez de usar OFFSET
+        column = self.sort_key
+        comparison = "<" if self.descending else ">"
+        if self.last_key is not None:
+            query += f" AND ({column} {comparison} ? OR ({column} = ? AND id {comparison} ?))"
+            params += [self.last_key[0], self.last_key[0], self.last_key[1]]
+        
+        direction = "DESC" if self.descending else "ASC"
+        query += f" ORDER BY {column} {direction}, id {direction} LIMIT ?"
+        params.append(limit)
+        
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        
+        if rows:
+            position = {"type": 1, "category_id": 2, "amount": 3, "date": 5}[column]
+            self.last_key = (rows[-1][position], rows[-1][0])
+        return rows
+
+# Dimensões e métricas disponíveis na aba de análises
+PIVOT_DIMENSIONS = {
+    "Mês": "month",
+    "Semana": "week",
+    "Ano": "year",
+    "Categoria": "category",
+    "Tipo": "type",
+}
+PIVOT_METRICS = {
+    "Soma": "sum",
+    "Quantidade": "count",
+    "Média": "mean",
+}
+
+def pivot_dimension(columns, dimension):
+    # Rótulos vetorizados a partir das colunas do cache
+    if dimension == "category":
+        return pd.Categorical.from_codes(columns.category_column, columns.categories)
+    if dimension == "type":
+        return pd.Categorical.from_codes(columns.type_column, columns.types)
+    
+    # Períodos agrupados como inteiros; só os rótulos do resultado viram texto
+    days = columns.days
+    if dimension == "week":
+        # 1970-01-01 foi uma quinta; a semana começa na segunda-feira
+        return days - (days + 3) % 7
+    unit = 'M' if dimension == "month" else 'Y'
+    return days.astype('datetime64[D]').astype(f'datetime64[{unit}]').astype(np.int64)
+
+def pivot_labels(dimension, values):
+    units = {"week": 'D', "month": 'M', "year": 'Y'}
+    if dimension not in units:
+        return [str(value) for value in values]
+    return np.datetime_as_string(np.asarray(values, dtype=np.int64).astype(f'datetime64[{units[dimension]}]')).tolist()
+
+class PivotService:
+    def __init__(self, db_manager, transaction_cache=None, max_entries=32):
+        self.db_manager = db_manager
+        self.transaction_cache = transaction_cache
+        self.max_entries = max_entries
+        # user_id -> versão dos dados; muda a cada alteração nas transações
+        self.versions = {}
+        # (user_id, versão, linhas, colunas, métrica) -> DataFrame
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get_columns(self, user_id):
+        if self.transaction_cache is not None:
+            return self.transaction_cache.get_columns(user_id)
+        return fetch_transaction_columns(self.db_manager, user_id)
+    
+    def pivot(self, user_id, rows, columns=None, metric="sum"):
+        with self.lock:
+            key = (user_id, self.versions.get(user_id, 0), rows, columns, metric)
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        
+        result = self.compute(self.get_columns(user_id), rows, columns, metric)
+        
+        with self.lock:
+            self.cache[key] = result
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        return result
+    
+    def compute(self, transaction_columns, rows, columns, metric):
+        frame = pd.DataFrame({
+            "value": transaction_columns.cents / 100,
+            rows: pivot_dimension(transaction_columns, rows),
+        })
+        keys = [rows]
+        if columns and columns != rows:
+            frame[columns] = pivot_dimension(transaction_columns, columns)
+            keys.append(columns)
+        
+        grouped = frame.groupby(keys, observed=True)["value"].agg(metric)
+        if len(keys) == 1:
+            table = grouped.to_frame(next(name for name, key in PIVOT_METRICS.items() if key == metric))
+        else:
+            table = grouped.unstack(fill_value=0)
+            table.columns = pivot_labels(columns, table.columns)
+            table = table[sorted(table.columns)]
+            # Total da linha calculado sobre os dados, não sobre as células (vale para média)
+            table["Total"] = frame.groupby(rows, observed=True)["value"].agg(metric)
+        # Rótulos de período em ISO ordenam cronologicamente
+        table.index = pivot_labels(rows, table.index)
+        table = table.sort_index()
+        
+        if rows == "month":
+            # Variação em relação ao mês anterior
+            for column in list(table.columns):
+                table[f"Δ {column}"] = table[column].diff()
+        return table
+    
+    def invalidate_user(self, user_id):
+        with self.lock:
+            self.versions[user_id] = self.versions.get(user_id, 0) + 1
+            for key in [key for key in self.cache if key[0] == user_id]:
+                del self.cache[key]
+
+class AuthDialog(QDialog):
+    def __init__(self, db_manager, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.setWindowTitle("Autenticação")
+        self.setModal(True)
+        self.setFixedSize(400, 300)
+        
+        # Aplicar estilo
+        self.setStyleSheet("""
+            QDialog {
+                background-color: #f5f5f5;
+            }
+            QLabel {
+                color: #333333;
+                font-weight: bold;
+            }
+            QLineEdit {
+                padding: 8px;
+                border: 1px solid #cccccc;
+                border-radius: 4px;
+                background-color: white;
+            }
+            QLineEdit:focus {
+                border: 2px solid #4CAF50;
+            }
+            QPushButton {
+                background-color: #4CAF50;
+                border: none;
+                color: white;
+                padding: 10px;
+                border-radius: 4px;
+                font-weight: bold;
+                margin-top: 10px;
+            }
+            QPushButton:hover {
+                background-color: #45a049;
+            }
+            QTabWidget::pane {
+                border: 1px solid #cccccc;
+                background-color: white;
+                border-radius: 4px;
+            }
+            QTabBar::tab {
+                background-color: #e0e0e0;
+                border: 1px solid #cccccc;
+                padding: 8px 16px;
+                margin-right: 2px;
+                border-top-left-radius: 4px;
+                border-top-right-radius: 4px;
+            }
+            QTabBar::tab:selected {
+                background-color: white;
+                border-bottom-color: white;
+            }
+        """)
+        
+        layout = QVBoxLayout()
+        
+        self.tab_widget = QTabWidget()
+        self.login_tab = QWidget()
+        self.register_tab = QWidget()
+        
+        self.setup_login_tab()
+        self.setup_register_tab()
+        
+        self.tab_widget.addTab(self.login_tab, "Login")
+        self.tab_widget.addTab(self.register_tab, "Registrar")
+        
+        layout.addWidget(self.tab_widget)
+        self.setLayout(layout)
+    
+    def setup_login_tab(self):
+        layout = QFormLayout()
+        layout.setSpacing(15)
+        layout.setContentsMargins(20, 20, 20, 20)
+        
+        self.login_username = QLineEdit()
+        self.login_username.setPlaceholderText("Digite seu usuário")
+        self.login_password = QLineEdit()
+        self.login_password.setEchoMode(QLineEdit.Password)
+        self.login_password.setPlaceholderText("Digite sua senha")
+        
+        layout.addRow("Usuário:", self.login_username)
+        layout.addRow("Senha:", self.login_password)
+        
+        self.login_btn = QPushButton("Login")
+        self.login_btn.clicked.connect(self.login)
+        layout.addRow(self.login_btn)
+        
+        self.login_tab.setLayout(layout)
+    
+    def setup_register_tab(self):
+        layout = QFormLayout()
+        layout.setSpacing(15)
+        layout.setContentsMargins(20, 20, 20, 20)
+        
+        self.register_username = QLineEdit()
+        self.register_username.setPlaceholderText("Escolha um usuário")
+        self.register_email = QLineEdit()
+        self.register_email.setPlaceholderText("Digite seu email")
+        self.register_password = QLineEdit()
+        self.register_password.setEchoMode(QLineEdit.Password)
+        self.register_password.setPlaceholderText("Crie uma senha")
+        self.register_confirm_password = QLineEdit()
+        self.register_confirm_password.setEchoMode(QLineEdit.Password)
+        self.register_confirm_password.setPlaceholderText("Confirme a senha")
+        
+        layout.addRow("Usuário:", self.register_username)
+        layout.addRow("Email:", self.register_email)
+        layout.addRow("Senha:", self.register_password)
+        layout.addRow("Confirmar Senha:", self.register_confirm_password)
+        
+        self.register_btn = QPushButton("Registrar")
+        self.register_btn.clicked.connect(self.register)
+        layout.addRow(self.register_btn)
+        
+        self.register_tab.setLayout(layout)
+    
+    def hash_password(self, password):
+        return self.db_manager.password_hasher.hash(password)
+    
+    def run_in_worker(self, function, on_finished):
+        # O KDF roda em uma thread para não congelar o diálogo
+        self.set_busy(True)
+        self.auth_signals = AuthSignals()
+        self.auth_signals.finished.connect(on_finished)
+        self.auth_signals.error.connect(self.auth_error)
+        
+        def worker(signals=self.auth_signals):
+            try:
+                signals.finished.emit(function())
+            except Exception as e:
+                signals.error.emit(str(e))
+        
+        self.auth_thread = threading.Thread(target=worker)
+        self.auth_thread.daemon = True
+        self.auth_thread.start()
+    
+    def set_busy(self, busy):
+        self.login_btn.setEnabled(not busy)
+        self.register_btn.setEnabled(not busy)
+        if busy:
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+        else:
+            QApplication.restoreOverrideCursor()
+    
+    def auth_error(self, error_msg):
+        self.set_busy(False)
+        QMessageBox.warning(self, "Erro", error_msg)
+    
+    def login(self):
+        username = self.login_username.text()
+        password = self.login_password.text()
+        
+        if not username or not password:
+            QMessageBox.warning(self, "Erro", "Preencha todos os campos")
+            return
+        
+        self.run_in_worker(lambda: self.db_manager.authenticate(username, password), 
+                           self.login_finished)
+    
+    def login_finished(self, user):
+        self.set_busy(False)
+        
+        if user:
+            self.user_id = user[0]
+            self.username = user[1]
+            self.accept()
+        else:
+            QMessageBox.warning(self, "Erro", "Usuário ou senha inválidos")
+    
+    def register(self):
+        username = self.register_username.text()
+        email = self.register_email.text()
+        password = self.register_password.text()
+        confirm_password = self.register_confirm_password.text()
+        
+        if not username or not email or not password or not confirm_password:
+            QMessageBox.warning(self, "Erro", "Preencha todos os campos")
+            return
+        
+        if password != confirm_password:
+            QMessageBox.warning(self, "Erro", "As senhas não coincidem")
+            return
+        
+        def register_user():
+            try:
+                return self.db_manager.register_user(username, email, password)
+            except sqlite3.IntegrityError:
+                return None
+        
+        self.run_in_worker(register_user, self.register_finished)
+    
+    def register_finished(self, user_id):
+        self.set_busy(False)
+        
+        if user_id:
+            QMessageBox.information(self, "Sucesso", "Usuário registrado com sucesso")
+            self.tab_widget.setCurrentIndex(0)  # Volta para a aba de login
+        else:
+            QMessageBox.warning(self, "Erro", "Usuário ou email já existe")
+
+class TransactionDialog(QDialog):
+    def __init__(self, user_id, db_manager, transaction_id=None, parent=None):
+        super().__init__(parent)
+        self.user_id = user_id
+        self.db_manager = db_manager
+        self.transaction_id = transaction_id
+        self.setWindowTitle("Adicionar Transação" if not transaction_id else "Editar Transação")
+        self.setModal(True)
+        self.setFixedSize(400, 450)
+        
+        # Aplicar estilo
+        self.setStyleSheet("""
+            QDialog {
+                background-color: #f5f5f5;
+            }
+            QLabel {
+                color: #333333;
+                font-weight: bold;
+            }
+            QLineEdit, QComboBox, QDateEdit {
+                padding: 8px;
+                border: 1px solid #cccccc;
+                border-radius: 4px;
+                background-color: white;
+            }
+            QLineEdit:focus, QComboBox:focus, QDateEdit:focus {
+                border: 2px solid #4CAF50;
+            }
+            QPushButton {
+                background-color: #4CAF50;
+                border: none;
+                color: white;
+                padding: 10px;
+                border-radius: 4px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #45a049;
+            }
+        """)
+        
+        layout = QFormLayout()
+        layout.setSpacing(15)
+        layout.setContentsMargins(20, 20, 20, 20)
+        
+        self.type_combo = QComboBox()
+        self.type_combo.addItems(["Receita", "Despesa"])
+        
+        self.category_combo = QComboBox()
+        self.update_categories()
+        
+        self.amount_input = QLineEdit()
+        self.amount_input.setValidator(QtGui.QDoubleValidator(0, 1000000, 2))
+        self.amount_input.setPlaceholderText("0.00")
+        
+        # Moedas conhecidas e as que têm cotação importada; outras podem ser digitadas
+        self.currency_combo = QComboBox()
+        self.currency_combo.setEditable(True)
+        self.currency_combo.addItems(self.available_currencies())
+        self.currency_combo.setCurrentText(BASE_CURRENCY)
+        
+        # Conta da transação; a moeda acompanha a da conta escolhida
+        self.account_combo = QComboBox()
+        self.account_currencies = {}
+        for account_id, name, currency in self.load_accounts():
+            self.account_combo.addItem(name, account_id)
+            self.account_currencies[account_id] = currency
+        if self.account_combo.count() == 0:
+            self.account_combo.addItem(DEFAULT_ACCOUNT_NAME, None)
+        self.account_combo.currentIndexChanged.connect(self.on_account_changed)
+        
+        self.description_input = QLineEdit()
+        self.description_input.setPlaceholderText("Descrição da transação")
+        
+        self.date_input = QDateEdit()
+        self.date_input.setDate(QDate.currentDate())
+        self.date_input.setCalendarPopup(True)
+        
+        layout.addRow("Tipo:", self.type_combo)
+        layout.addRow("Categoria:", self.category_combo)
+        layout.addRow("Conta:", self.account_combo)
+        layout.addRow("Valor:", self.amount_input)
+        layout.addRow("Moeda:", self.currency_combo)
+        layout.addRow("Descrição:", self.description_input)
+        layout.addRow("Data:", self.date_input)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        
+        layout.addRow(buttons)
+        
+        self.setLayout(layout)
+        
+        # Se estiver editando, carregue os dados
+        if transaction_id:
+            self.load_transaction_data()
+    
+    def update_categories(self):
+        # Lista em cache; o combo mostra o caminho na árvore e guarda o nome
+        self.category_combo.clear()
+        for label, name in self.db_manager.categories.choices(self.user_id):
+            self.category_combo.addItem(label, name)
+    
+    def load_accounts(self):
+        conn = self.db_manager.get_connection(self.user_id)
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name, currency FROM accounts WHERE user_id = ? ORDER BY name", (self.user_id,))
+        accounts = cursor.fetchall()
+        conn.close()
+        return accounts
+    
+    def on_account_changed(self, index):
+        currency = self.account_currencies.get(self.account_combo.itemData(index))
+        if currency:
+            self.currency_combo.setCurrentText(currency)
+    
+    def available_currencies(self):
+        conn = self.db_manager.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT currency FROM fx_rates")
+        currencies = {row[0] for row in cursor.fetchall()}
+        conn.close()
+        return [BASE_CURRENCY] + sorted((currencies | set(CURRENCY_SYMBOLS)) - {BASE_CURRENCY})
+    
+    def load_transaction_data(self):
+        conn = self.db_manager.get_connection(self.user_id)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT t.type, c.name, t.amount, t.description, t.date, t.currency, t.account_id 
+            FROM transactions t JOIN categories c ON c.id = t.category_id 
+            WHERE t.id = ?
+        """, (self.transaction_id,))
+        transaction = cursor.fetchone()
+        conn.close()
+        
+        if transaction:
+            type_index = 0 if transaction[0] == "Receita" else 1
+            self.type_combo.setCurrentIndex(type_index)
+            
+            category_index = self.category_combo.findData(transaction[1])
+            if category_index >= 0:
+                self.category_combo.setCurrentIndex(category_index)
+            
+            self.amount_input.setText(str(transaction[2]))
+            self.description_input.setText(transaction[3] if transaction[3] else "")
+            
+            date = QDate.fromString(transaction[4], "yyyy-MM-dd")
+            self.date_input.setDate(date)
+            account_index = self.account_combo.findData(transaction[6])
+            if account_index >= 0:
+                self.account_combo.setCurrentIndex(account_index)
+            self.currency_combo.setCurrentText(transaction[5])
+    
+    def get_data(self):
+        return {
+            "type": self.type_combo.currentText(),
+            "category": self.category_combo.currentData(),
+            "amount": float(self.amount_input.text()),
+            "currency": self.currency_combo.currentText().strip().upper() or BASE_CURRENCY,
+            "account_id": self.account_combo.currentData(),
+            "description": self.description_input.text(),
+            "date": self.date_input.date().toString("yyyy-MM-dd")
+        }
+
+class BudgetDialog(QDialog):
+    def __init__(self, user_id, db_manager, budget_id=None, parent=None):
+        super().__init__(parent)
+        self.user_id = user_id
+        self.db_manager = db_manager
+        self.budget_id = budget_id
+        self.setWindowTitle("Adicionar Orçamento" if not budget_id else "Editar Orçamento")
+        self.setModal(True)
+        self.setFixedSize(400, 350)
+        
+        # Aplicar estilo
+        self.setStyleSheet("""
+            QDialog {
+                background-color: #f5f5f5;
+            }
+            QLabel {
+                color: #333333;
+                font-weight: bold;
+            }
+            QLineEdit, QComboBox {
+                padding: 8px;
+                border: 1px solid #cccccc;
+                border-radius: 4px;
+                background-color: white;
+            }
+            QLineEdit:focus, QComboBox:focus {
+                border: 2px solid #4CAF50;
+            }
+            QPushButton {
+                background-color: #4CAF50;
+                border: none;
+                color: white;
+                padding: 10px;
+                border-radius: 4px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #45a049;
+            }
+        """)
+        
+        layout = QFormLayout()
+        layout.setSpacing(15)
+        layout.setContentsMargins(20, 20, 20, 20)
+        
+        # Orçamentos valem para categorias de despesa
+        self.category_combo = QComboBox()
+        for label, name in self.db_manager.categories.choices(user_id, "Despesa"):
+            self.category_combo.addItem(label, name)
+        
+        self.amount_input = QLineEdit()
+        self.amount_input.setValidator(QtGui.QDoubleValidator(0, 1000000, 2))
+        self.amount_input.setPlaceholderText("0.00")
+        
+        current_date = QDate.currentDate()
+        self.month_combo = QComboBox()
+        months = ["Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
+                 "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"]
+        self.month_combo.addItems(months)
+        self.month_combo.setCurrentIndex(current_date.month() - 1)
+        
+        self.year_input = QLineEdit()
+        self.year_input.setValidator(QtGui.QIntValidator(2000, 2100))
+        self.year_input.setText(str(current_date.year()))
+        
+        # Envelope: vale para a categoria em todos os meses
+        self.rollover_checkbox = QtWidgets.QCheckBox("Envelope (sobra ou estouro passa para o mês seguinte)")
+        self.category_combo.currentIndexChanged.connect(self.load_rollover)
+        self.load_rollover()
+        
+        # Percentuais que disparam notificação; vazio usa os limiares padrão
+        self.thresholds_input = QLineEdit()
+        self.thresholds_input.setPlaceholderText(", ".join(map(str, DEFAULT_ALERT_THRESHOLDS)))
+        
+        layout.addRow("Categoria:", self.category_combo)
+        layout.addRow("Valor:", self.amount_input)
+        layout.addRow("Mês:", self.month_combo)
+        layout.addRow("Ano:", self.year_input)
+        layout.addRow(self.rollover_checkbox)
+        layout.addRow("Alertas em (%):", self.thresholds_input)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        
+        layout.addRow(buttons)
+        
+        self.setLayout(layout)
+        
+        # Se estiver editando, carregue os dados
+        if budget_id:
+            self.load_budget_data()
+    
+    def load_budget_data(self):
+        conn = self.db_manager.get_connection(self.user_id)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT c.name, b.amount, b.month, b.year, b.alert_thresholds 
+            FROM budgets b JOIN categories c ON c.id = b.category_id 
+            WHERE b.id = ?
+        """, (self.budget_id,))
+        budget = cursor.fetchone()
+        conn.close()
+        
+        if budget:
+            category_index = self.category_combo.findData(budget[0])
+            if category_index >= 0:
+                self.category_combo.setCurrentIndex(category_index)
+            
+            self.amount_input.setText(str(budget[1]))
+            self.month_combo.setCurrentIndex(budget[2] - 1)
+            self.year_input.setText(str(budget[3]))
+            self.thresholds_input.setText(budget[4] or "")
+    
+    def load_rollover(self):
+        conn = self.db_manager.get_connection(self.user_id)
+        cursor = conn.cursor()
+        cursor.execute("SELECT rollover FROM categories WHERE user_id = ? AND name = ?", 
+                       (self.user_id, self.category_combo.currentData()))
+        row = cursor.fetchone()
+        conn.close()
+        self.rollover_checkbox.setChecked(bool(row and row[0]))
+    
+    def get_data(self):
+        return {
+            "category": self.category_combo.currentData(),
+            "amount": float(self.amount_input.text()),
+            "month": self.month_combo.currentIndex() + 1,
+            "year": int(self.year_input.text()),
+            "rollover": self.rollover_checkbox.isChecked(),
+            "alert_thresholds": ", ".join(map(str, parse_thresholds(self.thresholds_input.text())))
+                                if self.thresholds_input.text().strip() else None
+        }
+
+class CategoryDialog(QDialog):
+    def __init__(self, user_id, db_manager, parent=None):
+        super().__init__(parent)
+        self.user_id = user_id
+        self.db_manager = db_manager
+        self.setWindowTitle("Nova Categoria")
+        self.setModal(True)
+        self.setFixedSize(400, 250)
+        
+        # Aplicar estilo
+        self.setStyleSheet("""
+            QDialog {
+                background-color: #f5f5f5;
+            }
+            QLabel {
+                color: #333333;
+                font-weight: bold;
+            }
+            QLineEdit, QComboBox {
+                padding: 8px;
+                border: 1px solid #cccccc;
+                border-radius: 4px;
+                background-color: white;
+            }
+            QLineEdit:focus, QComboBox:focus {
+                border: 2px solid #4CAF50;
+            }
+            QPushButton {
+                background-color: #4CAF50;
+                border: none;
+                color: white;
+                padding: 10px;
+                border-radius: 4px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #45a049;
+            }
+        """)
+        
+        layout = QFormLayout()
+        layout.setSpacing(15)
+        layout.setContentsMargins(20, 20, 20, 20)
+        
+        self.name_input = QLineEdit()
+        self.name_input.setPlaceholderText("Ex: Aluguel, Mercado, Streaming")
+        
+        # Subcategoria: escolhe a categoria pai
+        self.parent_combo = QComboBox()
+        self.parent_combo.addItem("(nenhuma)", None)
+        ids = self.db_manager.categories.ids(user_id)
+        for label, name in self.db_manager.categories.choices(user_id):
+            self.parent_combo.addItem(label, ids[name])
+        
+        self.type_combo = QComboBox()
+        self.type_combo.addItem("Receita e Despesa", None)
+        self.type_combo.addItem("Receita", "Receita")
+        self.type_combo.addItem("Despesa", "Despesa")
+        
+        layout.addRow("Nome:", self.name_input)
+        layout.addRow("Categoria pai:", self.parent_combo)
+        layout.addRow("Tipo:", self.type_combo)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
         
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
+        layout.addRow(buttons)
         
-        try:
-            cursor.execute("INSERT INTO users (username, password, email) VALUES (?, ?, ?)",
-                          (username, hashed_password, email))
-            conn.commit()
-            QMessageBox.information(self, "Sucesso", "Usuário registrado com sucesso")
-            self.tab_widget.setCurrentIndex(0)  # Volta para a aba de login
-        except sqlite3.IntegrityError:
-            QMessageBox.warning(self, "Erro", "Usuário ou email já existe")
-        finally:
-            conn.close()
+        self.setLayout(layout)
+    
+    def get_data(self):
+        return {
+            "name": self.name_input.text().strip(),
+            "parent_id": self.parent_combo.currentData(),
+            "type": self.type_combo.currentData()
+        }
 
-class TransactionDialog(QDialog):
-    def __init__(self, user_id, db_manager, transaction_id=None, parent=None):
+class AccountDialog(QDialog):
+    def __init__(self, user_id, db_manager, parent=None):
         super().__init__(parent)
         self.user_id = user_id
         self.db_manager = db_manager
-        self.transaction_id = transaction_id
-        self.setWindowTitle("Adicionar Transação" if not transaction_id else "Editar Transação")
+        self.setWindowTitle("Nova Conta")
         self.setModal(True)
-        self.setFixedSize(400, 350)
+        self.setFixedSize(400, 200)
         
         # Aplicar estilo
         self.setStyleSheet("""
@@ -308,13 +3660,13 @@ class TransactionDialog(QDialog):
                 color: #333333;
                 font-weight: bold;
             }
-            QLineEdit, QComboBox, QDateEdit {
+            QLineEdit, QComboBox {
                 padding: 8px;
                 border: 1px solid #cccccc;
                 border-radius: 4px;
                 background-color: white;
             }
-            QLineEdit:focus, QComboBox:focus, QDateEdit:focus {
+            QLineEdit:focus, QComboBox:focus {
                 border: 2px solid #4CAF50;
             }
             QPushButton {
@@ -334,28 +3686,15 @@ class TransactionDialog(QDialog):
         layout.setSpacing(15)
         layout.setContentsMargins(20, 20, 20, 20)
         
-        self.type_combo = QComboBox()
-        self.type_combo.addItems(["Receita", "Despesa"])
-        
-        self.category_combo = QComboBox()
-        self.update_categories()
-        
-        self.amount_input = QLineEdit()
-        self.amount_input.setValidator(QtGui.QDoubleValidator(0, 1000000, 2))
-        self.amount_input.setPlaceholderText("0.00")
-        
-        self.description_input = QLineEdit()
-        self.description_input.setPlaceholderText("Descrição da transação")
+        self.name_input = QLineEdit()
+        self.name_input.setPlaceholderText("Ex: Conta Corrente, Cartão, Corretora")
         
-        self.date_input = QDateEdit()
-        self.date_input.setDate(QDate.currentDate())
-        self.date_input.setCalendarPopup(True)
+        self.currency_combo = QComboBox()
+        self.currency_combo.setEditable(True)
+        self.currency_combo.addItems([BASE_CURRENCY] + sorted(set(CURRENCY_SYMBOLS) - {BASE_CURRENCY}))
         
-        layout.addRow("Tipo:", self.type_combo)
-        layout.addRow("Categoria:", self.category_combo)
-        layout.addRow("Valor:", self.amount_input)
-        layout.addRow("Descrição:", self.description_input)
-        layout.addRow("Data:", self.date_input)
+        layout.addRow("Nome:", self.name_input)
+        layout.addRow("Moeda:", self.currency_combo)
         
         buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         buttons.accepted.connect(self.accept)
@@ -364,57 +3703,21 @@ class TransactionDialog(QDialog):
         layout.addRow(buttons)
         
         self.setLayout(layout)
-        
-        # Se estiver editando, carregue os dados
-        if transaction_id:
-            self.load_transaction_data()
-    
-    def update_categories(self):
-        categories = ["Alimentação", "Transporte", "Moradia", "Saúde", "Educação", 
-                     "Lazer", "Salário", "Freelance", "Investimentos", "Outros"]
-        self.category_combo.clear()
-        self.category_combo.addItems(categories)
-    
-    def load_transaction_data(self):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT type, category, amount, description, date FROM transactions WHERE id = ?", 
-                      (self.transaction_id,))
-        transaction = cursor.fetchone()
-        conn.close()
-        
-        if transaction:
-            type_index = 0 if transaction[0] == "Receita" else 1
-            self.type_combo.setCurrentIndex(type_index)
-            
-            category_index = self.category_combo.findText(transaction[1])
-            if category_index >= 0:
-                self.category_combo.setCurrentIndex(category_index)
-            
-            self.amount_input.setText(str(transaction[2]))
-            self.description_input.setText(transaction[3] if transaction[3] else "")
-            
-            date = QDate.fromString(transaction[4], "yyyy-MM-dd")
-            self.date_input.setDate(date)
     
     def get_data(self):
         return {
-            "type": self.type_combo.currentText(),
-            "category": self.category_combo.currentText(),
-            "amount": float(self.amount_input.text()),
-            "description": self.description_input.text(),
-            "date": self.date_input.date().toString("yyyy-MM-dd")
+            "name": self.name_input.text().strip(),
+            "currency": self.currency_combo.currentText().strip().upper() or BASE_CURRENCY
         }
 
-class BudgetDialog(QDialog):
-    def __init__(self, user_id, db_manager, budget_id=None, parent=None):
+class TransferDialog(QDialog):
+    def __init__(self, user_id, db_manager, parent=None):
         super().__init__(parent)
         self.user_id = user_id
         self.db_manager = db_manager
-        self.budget_id = budget_id
-        self.setWindowTitle("Adicionar Orçamento" if not budget_id else "Editar Orçamento")
+        self.setWindowTitle("Transferência entre Contas")
         self.setModal(True)
-        self.setFixedSize(400, 300)
+        self.setFixedSize(400, 400)
         
         # Aplicar estilo
         self.setStyleSheet("""
@@ -425,13 +3728,13 @@ class BudgetDialog(QDialog):
                 color: #333333;
                 font-weight: bold;
             }
-            QLineEdit, QComboBox {
+            QLineEdit, QComboBox, QDateEdit {
                 padding: 8px;
                 border: 1px solid #cccccc;
                 border-radius: 4px;
                 background-color: white;
             }
-            QLineEdit:focus, QComboBox:focus {
+            QLineEdit:focus, QComboBox:focus, QDateEdit:focus {
                 border: 2px solid #4CAF50;
             }
             QPushButton {
@@ -451,30 +3754,42 @@ class BudgetDialog(QDialog):
         layout.setSpacing(15)
         layout.setContentsMargins(20, 20, 20, 20)
         
-        self.category_combo = QComboBox()
-        categories = ["Alimentação", "Transporte", "Moradia", "Saúde", "Educação", 
-                     "Lazer", "Outros"]
-        self.category_combo.addItems(categories)
+        conn = self.db_manager.get_connection(self.user_id)
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name, currency FROM accounts WHERE user_id = ? ORDER BY name", (self.user_id,))
+        accounts = cursor.fetchall()
+        conn.close()
+        
+        self.from_combo = QComboBox()
+        self.to_combo = QComboBox()
+        for account_id, name, currency in accounts:
+            self.from_combo.addItem(f"{name} ({currency})", account_id)
+            self.to_combo.addItem(f"{name} ({currency})", account_id)
+        if len(accounts) > 1:
+            self.to_combo.setCurrentIndex(1)
         
         self.amount_input = QLineEdit()
         self.amount_input.setValidator(QtGui.QDoubleValidator(0, 1000000, 2))
         self.amount_input.setPlaceholderText("0.00")
         
-        current_date = QDate.currentDate()
-        self.month_combo = QComboBox()
-        months = ["Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
-                 "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"]
-        self.month_combo.addItems(months)
-        self.month_combo.setCurrentIndex(current_date.month() - 1)
+        # Só para contas em moedas diferentes
+        self.to_amount_input = QLineEdit()
+        self.to_amount_input.setValidator(QtGui.QDoubleValidator(0, 1000000, 2))
+        self.to_amount_input.setPlaceholderText("Igual ao valor enviado")
         
-        self.year_input = QLineEdit()
-        self.year_input.setValidator(QtGui.QIntValidator(2000, 2100))
-        self.year_input.setText(str(current_date.year()))
+        self.description_input = QLineEdit()
+        self.description_input.setPlaceholderText("Descrição da transferência")
         
-        layout.addRow("Categoria:", self.category_combo)
+        self.date_input = QDateEdit()
+        self.date_input.setDate(QDate.currentDate())
+        self.date_input.setCalendarPopup(True)
+        
+        layout.addRow("De:", self.from_combo)
+        layout.addRow("Para:", self.to_combo)
         layout.addRow("Valor:", self.amount_input)
-        layout.addRow("Mês:", self.month_combo)
-        layout.addRow("Ano:", self.year_input)
+        layout.addRow("Valor creditado:", self.to_amount_input)
+        layout.addRow("Descrição:", self.description_input)
+        layout.addRow("Data:", self.date_input)
         
         buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         buttons.accepted.connect(self.accept)
@@ -483,34 +3798,16 @@ class BudgetDialog(QDialog):
         layout.addRow(buttons)
         
         self.setLayout(layout)
-        
-        # Se estiver editando, carregue os dados
-        if budget_id:
-            self.load_budget_data()
-    
-    def load_budget_data(self):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT category, amount, month, year FROM budgets WHERE id = ?", 
-                      (self.budget_id,))
-        budget = cursor.fetchone()
-        conn.close()
-        
-        if budget:
-            category_index = self.category_combo.findText(budget[0])
-            if category_index >= 0:
-                self.category_combo.setCurrentIndex(category_index)
-            
-            self.amount_input.setText(str(budget[1]))
-            self.month_combo.setCurrentIndex(budget[2] - 1)
-            self.year_input.setText(str(budget[3]))
     
     def get_data(self):
+        amount = float(self.amount_input.text())
         return {
-            "category": self.category_combo.currentText(),
-            "amount": float(self.amount_input.text()),
-            "month": self.month_combo.currentIndex() + 1,
-            "year": int(self.year_input.text())
+            "from_account_id": self.from_combo.currentData(),
+            "to_account_id": self.to_combo.currentData(),
+            "amount": amount,
+            "to_amount": float(self.to_amount_input.text()) if self.to_amount_input.text() else amount,
+            "description": self.description_input.text(),
+            "date": self.date_input.date().toString("yyyy-MM-dd")
         }
 
 class GoalDialog(QDialog):
@@ -592,7 +3889,7 @@ class GoalDialog(QDialog):
             self.load_goal_data()
     
     def load_goal_data(self):
-        conn = self.db_manager.get_connection()
+        conn = self.db_manager.get_connection(self.user_id)
         cursor = conn.cursor()
         cursor.execute("SELECT title, target_amount, current_amount, deadline FROM goals WHERE id = ?", 
                       (self.goal_id,))
@@ -615,68 +3912,783 @@ class GoalDialog(QDialog):
             "deadline": self.deadline_input.date().toString("yyyy-MM-dd")
         }
 
+class QueryStatsDialog(QDialog):
+    def __init__(self, db_manager, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.setWindowTitle("Estatísticas SQL")
+        self.resize(900, 600)
+        
+        layout = QVBoxLayout(self)
+        
+        options_layout = QHBoxLayout()
+        self.trace_checkbox = QtWidgets.QCheckBox("Registrar consultas")
+        self.trace_checkbox.setChecked(db_manager.trace_queries)
+        self.trace_checkbox.toggled.connect(self.toggle_trace)
+        
+        self.slow_threshold_input = QtWidgets.QDoubleSpinBox()
+        self.slow_threshold_input.setRange(0, 60000)
+        self.slow_threshold_input.setSuffix(" ms")
+        self.slow_threshold_input.setValue(db_manager.slow_query_ms)
+        self.slow_threshold_input.valueChanged.connect(self.change_threshold)
+        
+        refresh_btn = QPushButton("Atualizar")
+        refresh_btn.clicked.connect(self.refresh)
+        reset_btn = QPushButton("Zerar")
+        reset_btn.clicked.connect(self.reset)
+        
+        options_layout.addWidget(self.trace_checkbox)
+        options_layout.addWidget(QLabel("Consulta lenta a partir de:"))
+        options_layout.addWidget(self.slow_threshold_input)
+        options_layout.addStretch()
+        options_layout.addWidget(refresh_btn)
+        options_layout.addWidget(reset_btn)
+        
+        self.stats_table = QTableWidget()
+        self.stats_table.setColumnCount(6)
+        self.stats_table.setHorizontalHeaderLabels(["SQL", "Execuções", "Total (ms)", 
+                                                    "Média (ms)", "Máx (ms)", "Linhas"])
+        self.stats_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        
+        self.slow_log = QtWidgets.QPlainTextEdit()
+        self.slow_log.setReadOnly(True)
+        
+        layout.addLayout(options_layout)
+        layout.addWidget(self.stats_table, 2)
+        layout.addWidget(QLabel("Consultas lentas (com EXPLAIN QUERY PLAN):"))
+        layout.addWidget(self.slow_log, 1)
+        
+        self.refresh()
+    
+    def toggle_trace(self, enabled):
+        self.db_manager.trace_queries = enabled
+    
+    def change_threshold(self, value):
+        self.db_manager.slow_query_ms = value
+    
+    def refresh(self):
+        stats = self.db_manager.query_stats.snapshot()
+        self.stats_table.setRowCount(len(stats))
+        
+        for row, (sql, count, total, maximum, rows) in enumerate(stats):
+            values = [sql, str(count), f"{total * 1000:.2f}", 
+                      f"{total * 1000 / count:.2f}" if count else "0.00",
+                      f"{maximum * 1000:.2f}", str(rows)]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setFlags(item.flags() ^ Qt.ItemIsEditable)
+                if col == 0:
+                    item.setToolTip(sql)
+                self.stats_table.setItem(row, col, item)
+        
+        entries = []
+        for entry in reversed(self.db_manager.query_stats.slow_log()):
+            entries.append(f"[{entry['at']}] {entry['elapsed_ms']:.1f} ms\n{entry['sql']}\n"
+                           f"params: {entry['params']}\n{entry['plan']}\n")
+        self.slow_log.setPlainText("\n".join(entries))
+    
+    def reset(self):
+        self.db_manager.query_stats.reset()
+        self.refresh()
+
+# Perfil da interface (opcional): FINANCE_PROFILE=<arquivo.json> grava um trace do Chrome
+PROFILE_OUTPUT = os.getenv('FINANCE_PROFILE')
+PROFILE_STALL_MS = float(os.getenv('FINANCE_PROFILE_STALL_MS', 200))
+
+class UIProfiler:
+    def __init__(self, output_path=None, stall_threshold_ms=PROFILE_STALL_MS):
+        self.enabled = bool(output_path)
+        self.output_path = output_path
+        self.stall_threshold_ms = stall_threshold_ms
+        self.events = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.main_thread_id = threading.get_ident()
+        self.heartbeat_timer = None
+        self.last_heartbeat = None
+        self.stall_reported = False
+    
+    @classmethod
+    def from_environment(cls):
+        output_path = PROFILE_OUTPUT
+        if output_path == '1':
+            output_path = "finance_trace.json"
+        return cls(output_path)
+    
+    def timestamp_us(self, moment=None):
+        return ((moment if moment is not None else time.perf_counter()) - self.origin) * 1e6
+    
+    def add_event(self, event):
+        event.setdefault("pid", self.pid)
+        event.setdefault("tid", threading.get_ident())
+        with self.lock:
+            self.events.append(event)
+    
+    def span(self, name, category="phase", **args):
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self.record_span(name, category, args)
+    
+    @contextlib.contextmanager
+    def record_span(self, name, category, args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.add_event({"name": name, "cat": category, "ph": "X",
+                            "ts": self.timestamp_us(start), "dur": (end - start) * 1e6,
+                            "args": args})
+    
+    def wrap(self, function, name):
+        # Repassa só os argumentos que o método aceita (sinais do Qt enviam extras)
+        parameters = inspect.signature(function).parameters.values()
+        if any(p.kind == p.VAR_POSITIONAL for p in parameters):
+            max_args = None
+        else:
+            max_args = sum(1 for p in parameters 
+                           if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD))
+        
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.span(name, "slot"):
+                return function(*args[:max_args], **kwargs)
+        return wrapper
+    
+    def instrument(self, obj, method_names):
+        # Precisa rodar antes de conectar os sinais aos métodos
+        if not self.enabled:
+            return
+        for method_name in method_names:
+            wrapped = self.wrap(getattr(obj, method_name), f"{type(obj).__name__}.{method_name}")
+            setattr(obj, method_name, wrapped)
+    
+    def start_stall_watchdog(self, interval_ms=50):
+        if not self.enabled or self.heartbeat_timer is not None:
+            return
+        
+        # Batimento no loop de eventos + thread que percebe travamentos em andamento
+        self.last_heartbeat = time.perf_counter()
+        self.heartbeat_interval = interval_ms / 1000
+        self.heartbeat_timer = QTimer()
+        self.heartbeat_timer.timeout.connect(self.heartbeat)
+        self.heartbeat_timer.start(interval_ms)
+        
+        watchdog = threading.Thread(target=self.watchdog_loop, name="stall-watchdog")
+        watchdog.daemon = True
+        watchdog.start()
+    
+    def heartbeat(self):
+        now = time.perf_counter()
+        stall = now - self.last_heartbeat - self.heartbeat_interval
+        
+        if stall * 1000 >= self.stall_threshold_ms:
+            self.add_event({"name": "Travamento do loop de eventos", "cat": "stall", "ph": "X",
+                            "ts": self.timestamp_us(self.last_heartbeat + self.heartbeat_interval),
+                            "dur": stall * 1e6, "args": {"ms": round(stall * 1000, 1)}})
+        
+        self.last_heartbeat = now
+        self.stall_reported = False
+    
+    def watchdog_loop(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            blocked = time.perf_counter() - self.last_heartbeat - self.heartbeat_interval
+            
+            if blocked * 1000 >= self.stall_threshold_ms and not self.stall_reported:
+                self.stall_reported = True
+                # Pilha da thread principal no momento do travamento
+                frame = sys._current_frames().get(self.main_thread_id)
+                stack = "".join(traceback.format_stack(frame)) if frame else ""
+                self.add_event({"name": "Travamento detectado", "cat": "stall", "ph": "i", "s": "g",
+                                "ts": self.timestamp_us(), "tid": self.main_thread_id,
+                                "args": {"stack": stack}})
+                logger.warning("Loop de eventos travado há %.0f ms\n%s", blocked * 1000, stack)
+    
+    def write(self, path=None):
+        path = path or self.output_path
+        if not self.enabled or not path:
+            return None
+        
+        with self.lock:
+            events = list(self.events)
+        metadata = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": self.main_thread_id,
+                     "args": {"name": "GUI"}}]
+        
+        with open(path, "w", encoding="utf-8") as trace_file:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, trace_file)
+        return path
+
+# Número máximo de pontos desenhados por série nos gráficos de linha
+CHART_MAX_POINTS = 1000
+
+# Estilo aplicado apenas às figuras do aplicativo (sem alterar o pyplot global)
+CHART_STYLE = 'seaborn-v0_8'
+
+# rcParams é global: serializa o uso do estilo entre a GUI e o renderizador
+CHART_STYLE_LOCK = threading.RLock()
+
+@contextlib.contextmanager
+def chart_style():
+    with CHART_STYLE_LOCK, plt.style.context(CHART_STYLE):
+        yield
+
+def lttb_downsample(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: preserva a forma visual da série
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+    
+    every = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_start = end
+        next_end = min(int((i + 2) * every) + 1, n)
+        
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) -
+                      (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        indices[i + 1] = a
+    
+    return x[indices], y[indices]
+
+def minmax_downsample(x, y, threshold):
+    # Mantém o mínimo e o máximo de cada intervalo (preserva picos)
+    n = len(x)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 2:
+        return x, y
+    
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    indices = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end <= start:
+            continue
+        bucket = y[start:end]
+        indices.extend(sorted((start + int(bucket.argmin()), start + int(bucket.argmax()))))
+    
+    indices = np.unique(np.asarray(indices, dtype=np.int64))
+    return x[indices], y[indices]
+
+# Gráficos disponíveis no dashboard e nos relatórios
+CHART_KINDS = ['expenses', 'cashflow_month', 'cashflow_week', 'balance']
+CHART_TITLES = {
+    'expenses': 'Despesas por Categoria',
+    'cashflow_month': 'Receitas x Despesas (Mensal)',
+    'cashflow_week': 'Receitas x Despesas (Semanal)',
+    'balance': 'Saldo Acumulado',
+}
+
+def expense_ylim_top(values):
+    # Folga para os rótulos acima da barra mais alta
+    return max(max(values), 1) * 1.15
+
+def draw_empty_message(ax, message):
+    ax.text(0.5, 0.5, message, 
+            horizontalalignment='center', verticalalignment='center',
+            transform=ax.transAxes, fontsize=12)
+
+def draw_expense_bars(ax, data, animated=False):
+    categories = list(data.keys())
+    values = list(data.values())
+    
+    # Cores para as barras
+    colors = plt.cm.Set3(range(len(categories)))
+    
+    bars = list(ax.bar(categories, values, color=colors, animated=animated))
+    ax.set_xlabel('Categorias')
+    ax.set_ylabel(f'Valor ({currency_symbol()})')
+    ax.set_title(CHART_TITLES['expenses'])
+    
+    # Rotacionar labels para melhor visualização
+    ax.tick_params(axis='x', labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
+    
+    # Adicionar valores nas barras
+    labels = []
+    for bar in bars:
+        height = bar.get_height()
+        labels.append(ax.text(bar.get_x() + bar.get_width()/2., height,
+                              format_money(height),
+                              ha='center', va='bottom', fontweight='bold',
+                              animated=animated))
+    
+    ax.set_ylim(0, expense_ylim_top(values))
+    return bars, labels
+
+def cashflow_series(periods, income, expense):
+    # periods: datas de início de cada período já agregado (mês/semana)
+    x = mdates.date2num(periods) if len(periods) else np.array([])
+    return [(x, np.asarray(income, dtype=float), 'Receitas', '#4CAF50', minmax_downsample),
+            (x, np.asarray(expense, dtype=float), 'Despesas', '#f44336', minmax_downsample)]
+
+def balance_series(days, balance):
+    x = mdates.date2num(days) if len(days) else np.array([])
+    return [(x, np.asarray(balance, dtype=float), 'Saldo', '#2196F3', lttb_downsample)]
+
+def draw_series_lines(ax, series, title):
+    lines = []
+    for x, y, label, color, downsample in series:
+        sx, sy = downsample(x, y, CHART_MAX_POINTS)
+        line, = ax.plot(sx, sy, label=label, color=color, linewidth=1.5)
+        lines.append((line, x, y, downsample))
+    
+    ax.set_xlabel('Período')
+    ax.set_ylabel(f'Valor ({currency_symbol()})')
+    ax.set_title(title)
+    ax.legend(loc='upper left')
+    
+    locator = mdates.AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    
+    return lines
+
 class FinanceChart(FigureCanvas):
+    bar_clicked = pyqtSignal(str)  # Categoria da barra clicada no gráfico de despesas
+    
     def __init__(self, parent=None, width=5, height=4, dpi=100):
-        self.fig, self.ax = plt.subplots(figsize=(width, height), dpi=dpi)
+        # Figura criada fora do pyplot para não ficar registrada globalmente
+        with chart_style():
+            self.fig = Figure(figsize=(width, height), dpi=dpi)
+            self.ax = self.fig.add_subplot()
         super().__init__(self.fig)
         self.setParent(parent)
         
+        # Séries completas usadas para reamostrar ao aplicar zoom/pan
+        self.series = []
+        self.profiler = UIProfiler()  # Substituído pelo da janela quando o perfil está ativo
+        
+        # Artistas reaproveitados entre atualizações do gráfico de barras
+        self.mode = None
+        self.data_key = None
+        self.bar_categories = []
+        self.bars = []
+        self.bar_labels = []
+        self.animated_artists = []
+        self.background = None
+        self.mpl_connect('draw_event', self.on_draw)
+        self.mpl_connect('button_press_event', self.on_press)
+        
         # Estilo do gráfico
-        plt.style.use('seaborn-v0_8')
         self.ax.set_xlabel('Categorias')
-        self.ax.set_ylabel('Valor (R$)')
+        self.ax.set_ylabel(f'Valor ({currency_symbol()})')
         self.ax.set_title('Despesas por Categoria')
         self.fig.tight_layout()
     
-    def plot_expenses(self, data):
+    def draw(self):
+        with self.profiler.span("Desenho do gráfico", "chart draw"):
+            super().draw()
+    
+    def on_draw(self, event):
+        # Guarda o fundo sem os artistas animados e os desenha por cima
+        self.background = self.copy_from_bbox(self.fig.bbox)
+        self.draw_animated()
+    
+    def on_press(self, event):
+        # Cliques com zoom/pan ativos pertencem à barra de ferramentas
+        if self.mode != 'expenses' or event.button != 1 or event.inaxes is not self.ax:
+            return
+        if self.toolbar is not None and self.toolbar.mode:
+            return
+        for category, bar in zip(self.bar_categories, self.bars):
+            if bar.contains(event)[0]:
+                self.bar_clicked.emit(category)
+                return
+    
+    def draw_animated(self):
+        for artist in self.animated_artists:
+            self.fig.draw_artist(artist)
+    
+    def reset_axes(self, mode):
         self.ax.clear()
+        self.series = []
+        self.bars = []
+        self.bar_labels = []
+        self.animated_artists = []
+        self.mode = mode
+    
+    def plot_expenses(self, data):
+        categories = list(data.keys())
+        values = list(data.values())
         
-        if not data:
-            self.ax.text(0.5, 0.5, 'Nenhuma despesa encontrada', 
-                        horizontalalignment='center', verticalalignment='center',
-                        transform=self.ax.transAxes, fontsize=12)
-            self.draw()
+        # Nada mudou desde o último desenho
+        data_key = ('expenses', tuple(categories), tuple(values))
+        if data_key == self.data_key:
             return
+        self.data_key = data_key
         
-        categories = list(data.keys())
-        values = list(data.values())
+        if self.mode == 'expenses' and categories and categories == self.bar_categories:
+            self.update_expense_bars(values)
+            return
+        
+        with chart_style():
+            self.reset_axes('expenses')
+            self.bar_categories = categories
+            
+            if not data:
+                draw_empty_message(self.ax, 'Nenhuma despesa encontrada')
+                self.draw_idle()
+                return
+            
+            self.bars, self.bar_labels = draw_expense_bars(self.ax, data, animated=True)
+            self.animated_artists = self.bars + self.bar_labels
+            self.fig.tight_layout()
         
-        # Cores para as barras
-        colors = plt.cm.Set3(range(len(categories)))
+        self.draw_idle()
+    
+    def update_expense_bars(self, values):
+        for bar, label, value in zip(self.bars, self.bar_labels, values):
+            bar.set_height(value)
+            label.set_position((bar.get_x() + bar.get_width()/2., value))
+            label.set_text(format_money(value))
+        
+        # Escala mudou: redesenho completo (o fundo é recapturado no draw_event)
+        top = expense_ylim_top(values)
+        current_top = self.ax.get_ylim()[1]
+        if top > current_top or top < current_top * 0.5 or self.background is None:
+            self.ax.set_ylim(0, top)
+            self.draw_idle()
+            return
         
-        bars = self.ax.bar(categories, values, color=colors)
-        self.ax.set_xlabel('Categorias')
-        self.ax.set_ylabel('Valor (R$)')
-        self.ax.set_title('Despesas por Categoria')
+        # Mesma escala: apenas as barras e rótulos são redesenhados (blitting)
+        self.restore_region(self.background)
+        self.draw_animated()
+        self.blit(self.fig.bbox)
+    
+    def plot_cashflow(self, periods, income, expense, title):
+        self.plot_series(cashflow_series(periods, income, expense), title)
+    
+    def plot_balance(self, days, balance):
+        self.plot_series(balance_series(days, balance), CHART_TITLES['balance'])
+    
+    def plot_series(self, series, title):
+        # Nada mudou desde o último desenho
+        data_key = ('series', title, tuple((label, x.tobytes(), y.tobytes()) 
+                                           for x, y, label, _, _ in series))
+        if data_key == self.data_key:
+            return
+        self.data_key = data_key
+        
+        with chart_style():
+            self.reset_axes('series')
+            
+            if not series or len(series[0][0]) == 0:
+                draw_empty_message(self.ax, 'Nenhuma transação encontrada')
+                self.draw_idle()
+                return
+            
+            self.series = draw_series_lines(self.ax, series, title)
+            
+            # Reamostrar apenas o intervalo visível ao aplicar zoom/pan
+            self.ax.callbacks.connect('xlim_changed', self.on_xlim_changed)
+            
+            self.fig.tight_layout()
+        
+        self.draw_idle()
+    
+    def on_xlim_changed(self, ax):
+        x_min, x_max = ax.get_xlim()
+        
+        for line, x, y, downsample in self.series:
+            # Inclui um ponto de cada lado para a linha não ser cortada na borda
+            start = max(int(np.searchsorted(x, x_min, side='left')) - 1, 0)
+            end = min(int(np.searchsorted(x, x_max, side='right')) + 1, len(x))
+            sx, sy = downsample(x[start:end], y[start:end], CHART_MAX_POINTS)
+            line.set_data(sx, sy)
+        
+        self.draw_idle()
+
+def chart_data_hash(kind, data):
+    digest = hashlib.sha1(kind.encode())
+    
+    if isinstance(data, dict):
+        digest.update(repr(list(data.items())).encode())
+    else:
+        for part in data:
+            if isinstance(part, np.ndarray):
+                digest.update(part.tobytes())
+            else:
+                digest.update(repr(list(part)).encode())
+    
+    return digest.hexdigest()
+
+def render_chart_png(kind, data, size, dpi):
+    # Renderização com o backend Agg puro, sem passar pelo canvas Qt
+    width, height = size
+    
+    with chart_style():
+        fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        
+        if kind == 'expenses':
+            series = None
+            if data:
+                draw_expense_bars(ax, data)
+            else:
+                draw_empty_message(ax, 'Nenhuma despesa encontrada')
+        elif kind == 'balance':
+            series = balance_series(*data)
+        else:
+            series = cashflow_series(*data)
+        
+        if series is not None:
+            if len(series[0][0]):
+                draw_series_lines(ax, series, CHART_TITLES[kind])
+            else:
+                draw_empty_message(ax, 'Nenhuma transação encontrada')
         
-        # Rotacionar labels para melhor visualização
-        plt.setp(self.ax.get_xticklabels(), rotation=45, ha='right')
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png')
+    
+    return buffer.getvalue()
+
+class ChartRenderService:
+    def __init__(self, max_entries=64, max_workers=1):
+        self.max_entries = max_entries
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, 
+                                           thread_name_prefix="chart-render")
+        self.cache = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+    
+    def render(self, user_id, kind, data, size=(600, 400), dpi=100):
+        # Retorna um Future com os bytes PNG; renders iguais são compartilhados
+        key = (user_id, kind, chart_data_hash(kind, data), tuple(size), dpi)
+        
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                future = Future()
+                future.set_result(self.cache[key])
+                return future
+            
+            if key in self.pending:
+                return self.pending[key]
+            
+            future = self.executor.submit(render_chart_png, kind, data, tuple(size), dpi)
+            self.pending[key] = future
         
-        # Adicionar valores nas barras
-        for bar in bars:
-            height = bar.get_height()
-            self.ax.text(bar.get_x() + bar.get_width()/2., height,
-                        f'R$ {height:.2f}',
-                        ha='center', va='bottom', fontweight='bold')
+        future.add_done_callback(lambda done: self.store(key, done))
+        return future
+    
+    def render_png(self, user_id, kind, data, size=(600, 400), dpi=100):
+        return self.render(user_id, kind, data, size, dpi).result()
+    
+    def store(self, key, future):
+        with self.lock:
+            self.pending.pop(key, None)
+            
+            if future.cancelled() or future.exception() is not None:
+                return
+            
+            self.cache[key] = future.result()
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+    
+    def invalidate_user(self, user_id):
+        with self.lock:
+            for key in [key for key in self.cache if key[0] == user_id]:
+                del self.cache[key]
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+# Cores das barras de progresso das metas, compartilhadas por todos os itens
+GOAL_PROGRESS_COLORS = {
+    'done': QtGui.QColor('#4CAF50'),
+    'near': QtGui.QColor('#FF9800'),
+    'progress': QtGui.QColor('#2196F3'),
+}
+
+def goal_progress_color(progress_percentage):
+    if progress_percentage >= 100:
+        return GOAL_PROGRESS_COLORS['done']
+    if progress_percentage >= 70:
+        return GOAL_PROGRESS_COLORS['near']
+    return GOAL_PROGRESS_COLORS['progress']
+
+class GoalProgressModel(QtCore.QAbstractListModel):
+    GoalRole = Qt.UserRole + 1
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.goal_ids = []
+        self.goals = {}  # goal_id -> (title, target_amount, current_amount)
+    
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.goal_ids)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        
+        title, target_amount, current_amount = self.goals[self.goal_ids[index.row()]]
+        if role == Qt.DisplayRole:
+            return title
+        if role == self.GoalRole:
+            return title, target_amount, current_amount
+        return None
+    
+    def set_goals(self, rows):
+        # rows: [(goal_id, title, target_amount, current_amount)] ordenadas por id
+        new_ids = [row[0] for row in rows]
+        new_id_set = set(new_ids)
+        
+        # Remover metas excluídas (de trás para frente para manter os índices)
+        for position in reversed(range(len(self.goal_ids))):
+            goal_id = self.goal_ids[position]
+            if goal_id not in new_id_set:
+                self.beginRemoveRows(QtCore.QModelIndex(), position, position)
+                del self.goal_ids[position]
+                del self.goals[goal_id]
+                self.endRemoveRows()
+        
+        # A ordem mudou de forma inesperada: recomeça o modelo
+        remaining = [goal_id for goal_id in new_ids if goal_id in self.goals]
+        if remaining != self.goal_ids:
+            self.beginResetModel()
+            self.goal_ids = new_ids
+            self.goals = {row[0]: tuple(row[1:]) for row in rows}
+            self.endResetModel()
+            return
         
-        self.fig.tight_layout()
-        self.draw()
+        # Inserir novas metas e atualizar somente as que mudaram
+        for position, row in enumerate(rows):
+            goal_id, values = row[0], tuple(row[1:])
+            
+            if position < len(self.goal_ids) and self.goal_ids[position] == goal_id:
+                if self.goals[goal_id] != values:
+                    self.goals[goal_id] = values
+                    index = self.index(position)
+                    self.dataChanged.emit(index, index)
+            else:
+                self.beginInsertRows(QtCore.QModelIndex(), position, position)
+                self.goal_ids.insert(position, goal_id)
+                self.goals[goal_id] = values
+                self.endInsertRows()
+
+class GoalProgressDelegate(QtWidgets.QStyledItemDelegate):
+    ITEM_HEIGHT = 64
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.title_font = QFont()
+        self.title_font.setBold(True)
+        self.text_font = QFont()
+        self.bar_background = QtGui.QColor('#f0f0f0')
+        self.bar_border = QtGui.QColor('#cccccc')
+    
+    def sizeHint(self, option, index):
+        return QtCore.QSize(option.rect.width(), self.ITEM_HEIGHT)
+    
+    def paint(self, painter, option, index):
+        title, target_amount, current_amount = index.data(GoalProgressModel.GoalRole)
+        progress_percentage = (current_amount / target_amount) * 100 if target_amount > 0 else 0
+        
+        rect = option.rect.adjusted(6, 4, -6, -4)
+        line_height = rect.height() // 3
+        
+        painter.save()
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        
+        painter.setFont(self.title_font)
+        painter.drawText(QtCore.QRect(rect.x(), rect.y(), rect.width(), line_height),
+                         Qt.AlignLeft | Qt.AlignVCenter, title)
+        
+        painter.setFont(self.text_font)
+        painter.drawText(QtCore.QRect(rect.x(), rect.y() + line_height, rect.width(), line_height),
+                         Qt.AlignLeft | Qt.AlignVCenter,
+                         f"Progresso: {format_money(current_amount)} / {format_money(target_amount)} ({progress_percentage:.1f}%)")
+        
+        # Barra de progresso desenhada diretamente (sem um QProgressBar por meta)
+        bar_rect = QtCore.QRectF(rect.x(), rect.y() + 2 * line_height + 2, 
+                                 rect.width(), line_height - 4)
+        painter.setPen(self.bar_border)
+        painter.setBrush(self.bar_background)
+        painter.drawRoundedRect(bar_rect, 4, 4)
+        
+        fraction = max(0.0, min(progress_percentage / 100, 1.0))
+        if fraction > 0:
+            chunk_rect = QtCore.QRectF(bar_rect.x(), bar_rect.y(), 
+                                       bar_rect.width() * fraction, bar_rect.height())
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(goal_progress_color(progress_percentage))
+            painter.drawRoundedRect(chunk_rect, 4, 4)
+        
+        painter.restore()
+
+# Slots/handlers da janela principal medidos quando o perfil está ativo
+PROFILED_SLOTS = [
+    "refresh_current_tab", "load_transactions", "load_budgets", "load_goals", "apply_filters",
+    "sort_transactions", "on_transaction_page_loaded",
+    "update_dashboard", "update_chart", "load_analytics", "update_budget_alerts", "update_goals_progress",
+    "add_transaction", "edit_transaction", "delete_transaction",
+    "add_budget", "edit_budget", "delete_budget",
+    "add_goal", "edit_goal", "delete_goal", "contribute_to_goal", "show_goal_history",
+    "load_accounts", "add_account", "add_transfer",
+    "export_pdf", "export_excel", "sync_with_cloud", "create_backup", "close_period", "show_query_stats",
+]
 
 class MainWindow(QMainWindow):
-    def __init__(self, user_id, username, db_manager):
+    def __init__(self, user_id, username, db_manager, profiler=None):
         super().__init__()
         self.user_id = user_id
         self.username = username
         self.db_manager = db_manager
+        self.profiler = profiler or UIProfiler()
+        self.profiler.instrument(self, PROFILED_SLOTS)
+        self.profiler.start_stall_watchdog()
         self.sync_signals = SyncSignals()  # Instância dos sinais
+        self.write_signals = WriteSignals()  # Commits da fila de escrita
+        self.page_signals = PageSignals()  # Páginas da listagem de transações
+        self.page_executor = ThreadPoolExecutor(max_workers=1)
+        self.page_generation = 0
+        self.page_loading = False
+        self.transaction_filters = {}
+        self.transaction_sort_key = "date"
+        self.transaction_sort_descending = True
+        self.chart_renderer = ChartRenderService()  # Renderização offscreen (relatórios)
+        self.budget_status = BudgetStatusService(db_manager)  # Consumo dos orçamentos em cache
+        self.tray_icon = None  # Criado no primeiro alerta de orçamento, se houver bandeja do sistema
+        self.transaction_cache = TransactionColumnCache(db_manager) if COLUMNAR_CACHE_ENABLED else None  # Filtros em memória
+        self.pivots = PivotService(db_manager, self.transaction_cache)  # Tabelas dinâmicas em cache
+        self.account_balances = AccountBalanceIndex(db_manager)  # Saldos por conta via checkpoints
         self.setWindowTitle(f"Controle Financeiro Pessoal - {username}")
         self.setGeometry(100, 100, 1200, 800)
         
         self.setup_ui()
-        self.load_data()
-        self.update_dashboard()
+        
+        # Abas são populadas apenas quando ficam visíveis (a primeira após exibir a janela)
+        self.tab_loaders = {
+            self.dashboard_tab: self.update_dashboard,
+            self.transactions_tab: self.load_transactions,
+            self.budgets_tab: self.load_budgets,
+            self.goals_tab: self.load_goals,
+            self.analytics_tab: self.load_analytics,
+            self.accounts_tab: self.load_accounts,
+        }
+        self.stale_tabs = set(self.tab_loaders)
+        self.tab_widget.currentChanged.connect(self.refresh_current_tab)
+        QTimer.singleShot(0, self.refresh_current_tab)
         
         # Conecte os sinais aos slots
+        self.write_signals.committed.connect(self.on_write_committed)
+        self.page_signals.loaded.connect(self.on_transaction_page_loaded)
         self.sync_signals.progress.connect(self.update_sync_progress)
         self.sync_signals.finished.connect(self.sync_finished)
         self.sync_signals.error.connect(self.sync_error)
@@ -863,6 +4875,14 @@ class MainWindow(QMainWindow):
         sync_action.triggered.connect(self.sync_with_cloud)
         file_menu.addAction(sync_action)
         
+        backup_action = QtWidgets.QAction("Criar Backup...", self)
+        backup_action.triggered.connect(self.create_backup)
+        file_menu.addAction(backup_action)
+        
+        close_period_action = QtWidgets.QAction("Fechar Período...", self)
+        close_period_action.triggered.connect(self.close_period)
+        file_menu.addAction(close_period_action)
+        
         logout_action = QtWidgets.QAction("Sair", self)
         logout_action.triggered.connect(self.logout)
         file_menu.addAction(logout_action)
@@ -874,6 +4894,10 @@ class MainWindow(QMainWindow):
         add_transaction_action.triggered.connect(self.add_transaction)
         transaction_menu.addAction(add_transaction_action)
         
+        add_category_action = QtWidgets.QAction("Nova Categoria...", self)
+        add_category_action.triggered.connect(self.add_category)
+        transaction_menu.addAction(add_category_action)
+        
         # Menu Orçamentos
         budget_menu = menubar.addMenu("Orçamentos")
         
@@ -888,6 +4912,18 @@ class MainWindow(QMainWindow):
         add_goal_action.triggered.connect(self.add_goal)
         goal_menu.addAction(add_goal_action)
         
+        # Menu Depuração
+        debug_menu = menubar.addMenu("Depuração")
+        
+        query_stats_action = QtWidgets.QAction("Estatísticas SQL", self)
+        query_stats_action.triggered.connect(self.show_query_stats)
+        debug_menu.addAction(query_stats_action)
+        
+        if self.profiler.enabled:
+            save_trace_action = QtWidgets.QAction("Salvar Trace de Perfil", self)
+            save_trace_action.triggered.connect(self.save_profile_trace)
+            debug_menu.addAction(save_trace_action)
+        
         # Widget de abas
         self.tab_widget = QTabWidget()
         layout.addWidget(self.tab_widget)
@@ -911,6 +4947,16 @@ class MainWindow(QMainWindow):
         self.goals_tab = QWidget()
         self.setup_goals_tab()
         self.tab_widget.addTab(self.goals_tab, "🎯 Metas")
+        
+        # Análises
+        self.analytics_tab = QWidget()
+        self.setup_analytics_tab()
+        self.tab_widget.addTab(self.analytics_tab, "📈 Análises")
+        
+        # Contas
+        self.accounts_tab = QWidget()
+        self.setup_accounts_tab()
+        self.tab_widget.addTab(self.accounts_tab, "🏦 Contas")
     
     def setup_dashboard_tab(self):
         layout = QVBoxLayout(self.dashboard_tab)
@@ -937,7 +4983,7 @@ class MainWindow(QMainWindow):
         income_layout = QVBoxLayout(income_card)
         income_title = QLabel("Receitas")
         income_title.setStyleSheet("font-size: 12pt; font-weight: bold;")
-        self.income_label = QLabel("R$ 0.00")
+        self.income_label = QLabel(format_money(0))
         self.income_label.setStyleSheet("font-size: 16pt; font-weight: bold;")
         income_layout.addWidget(income_title)
         income_layout.addWidget(self.income_label)
@@ -957,7 +5003,7 @@ class MainWindow(QMainWindow):
         expense_layout = QVBoxLayout(expense_card)
         expense_title = QLabel("Despesas")
         expense_title.setStyleSheet("font-size: 12pt; font-weight: bold;")
-        self.expense_label = QLabel("R$ 0.00")
+        self.expense_label = QLabel(format_money(0))
         self.expense_label.setStyleSheet("font-size: 16pt; font-weight: bold;")
         expense_layout.addWidget(expense_title)
         expense_layout.addWidget(self.expense_label)
@@ -977,7 +5023,7 @@ class MainWindow(QMainWindow):
         balance_layout = QVBoxLayout(balance_card)
         balance_title = QLabel("Saldo")
         balance_title.setStyleSheet("font-size: 12pt; font-weight: bold;")
-        self.balance_label = QLabel("R$ 0.00")
+        self.balance_label = QLabel(format_money(0))
         self.balance_label.setStyleSheet("font-size: 16pt; font-weight: bold;")
         balance_layout.addWidget(balance_title)
         balance_layout.addWidget(self.balance_label)
@@ -992,9 +5038,26 @@ class MainWindow(QMainWindow):
         chart_alerts_layout = QHBoxLayout()
         
         # Gráfico
-        chart_group = QGroupBox("Despesas por Categoria")
+        chart_group = QGroupBox("Gráficos")
         chart_layout = QVBoxLayout()
+        
+        self.chart_kind_combo = QComboBox()
+        self.chart_kind_combo.addItems([CHART_TITLES[kind] for kind in CHART_KINDS])
+        self.chart_kind_combo.currentIndexChanged.connect(self.update_chart)
+        
         self.chart = FinanceChart(self, width=6, height=4, dpi=100)
+        self.chart.profiler = self.profiler
+        self.chart.bar_clicked.connect(self.drill_into_category)
+        self.chart_toolbar = NavigationToolbar(self.chart, self)
+        
+        # Categoria aberta no gráfico de despesas (None: categorias raiz)
+        self.chart_category_root = None
+        self.chart_up_button = QPushButton("⬆ Voltar")
+        self.chart_up_button.setVisible(False)
+        self.chart_up_button.clicked.connect(self.drill_up)
+        chart_layout.addWidget(self.chart_kind_combo)
+        chart_layout.addWidget(self.chart_up_button)
+        chart_layout.addWidget(self.chart_toolbar)
         chart_layout.addWidget(self.chart)
         chart_group.setLayout(chart_layout)
         chart_group.setMinimumWidth(500)
@@ -1007,11 +5070,28 @@ class MainWindow(QMainWindow):
         self.budget_alerts_layout = QVBoxLayout()
         self.budget_alerts_group.setLayout(self.budget_alerts_layout)
         
+        # Labels de alerta reaproveitados entre atualizações (chave: id do orçamento)
+        self.budget_alert_labels = {}
+        self.no_budget_alerts_label = QLabel("<font color='green'>Nenhum alerta de orçamento</font>")
+        self.budget_alerts_layout.addWidget(self.no_budget_alerts_label)
+        
         # Progresso de metas
         self.goals_progress_group = QGroupBox("🎯 Progresso de Metas")
         self.goals_progress_layout = QVBoxLayout()
         self.goals_progress_group.setLayout(self.goals_progress_layout)
         
+        # Lista virtualizada: só os itens visíveis são desenhados
+        self.goals_progress_model = GoalProgressModel(self)
+        self.goals_progress_view = QtWidgets.QListView()
+        self.goals_progress_view.setModel(self.goals_progress_model)
+        self.goals_progress_view.setItemDelegate(GoalProgressDelegate(self.goals_progress_view))
+        self.goals_progress_view.setUniformItemSizes(True)
+        self.goals_progress_view.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+        self.goals_progress_view.setVerticalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
+        self.no_goals_label = QLabel("Nenhuma meta definida")
+        self.goals_progress_layout.addWidget(self.goals_progress_view)
+        self.goals_progress_layout.addWidget(self.no_goals_label)
+        
         alerts_goals_layout.addWidget(self.budget_alerts_group)
         alerts_goals_layout.addWidget(self.goals_progress_group)
         alerts_goals_layout.setStretch(0, 1)
@@ -1038,9 +5118,7 @@ class MainWindow(QMainWindow):
         self.filter_type_combo.addItems(["Todos", "Receita", "Despesa"])
         
         self.filter_category_combo = QComboBox()
-        self.filter_category_combo.addItems(["Todas", "Alimentação", "Transporte", "Moradia", 
-                                           "Saúde", "Educação", "Lazer", "Salário", 
-                                           "Freelance", "Investimentos", "Outros"])
+        self.load_category_filter()
         
         self.filter_start_date = QDateEdit()
         self.filter_start_date.setDate(QDate.currentDate().addMonths(-1))
@@ -1072,6 +5150,13 @@ class MainWindow(QMainWindow):
         self.transactions_table.setHorizontalHeaderLabels(["ID", "Tipo", "Categoria", "Valor", "Descrição", "Data"])
         self.transactions_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         
+        # Ordenação pelo cabeçalho feita no banco; novas páginas ao rolar até o fim
+        header = self.transactions_table.horizontalHeader()
+        header.setSortIndicatorShown(True)
+        header.setSortIndicator(5, Qt.DescendingOrder)
+        header.sectionClicked.connect(self.sort_transactions)
+        self.transactions_table.verticalScrollBar().valueChanged.connect(self.on_transactions_scrolled)
+        
         # Botões de ação
         action_layout = QHBoxLayout()
         action_layout.setSpacing(10)
@@ -1151,6 +5236,28 @@ class MainWindow(QMainWindow):
         
         layout.addWidget(self.budgets_table)
         layout.addLayout(action_layout)
+        
+        # Grade com os meses até o filtrado: saldo de cada orçamento (envelopes acumulam entre os meses)
+        grid_group = QGroupBox("Grade de Orçamentos")
+        grid_layout = QVBoxLayout()
+        
+        grid_filter_layout = QHBoxLayout()
+        self.budget_grid_months_combo = QComboBox()
+        self.budget_grid_months_combo.addItems([f"{count} meses" for count in BUDGET_GRID_MONTHS])
+        self.budget_grid_months_combo.setCurrentIndex(1)
+        self.budget_grid_months_combo.currentIndexChanged.connect(self.load_budget_grid)
+        grid_filter_layout.addWidget(QLabel("Período:"))
+        grid_filter_layout.addWidget(self.budget_grid_months_combo)
+        grid_filter_layout.addStretch()
+        
+        self.budget_grid_table = QTableWidget()
+        self.budget_grid_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.budget_grid_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        
+        grid_layout.addLayout(grid_filter_layout)
+        grid_layout.addWidget(self.budget_grid_table)
+        grid_group.setLayout(grid_layout)
+        layout.addWidget(grid_group)
     
     def setup_goals_tab(self):
         layout = QVBoxLayout(self.goals_tab)
@@ -1159,8 +5266,8 @@ class MainWindow(QMainWindow):
         
         # Tabela de metas
         self.goals_table = QTableWidget()
-        self.goals_table.setColumnCount(5)
-        self.goals_table.setHorizontalHeaderLabels(["ID", "Título", "Valor Alvo", "Valor Atual", "Prazo"])
+        self.goals_table.setColumnCount(6)
+        self.goals_table.setHorizontalHeaderLabels(["ID", "Título", "Valor Alvo", "Valor Atual", "Prazo", "Previsão"])
         self.goals_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         
         # Botões de ação
@@ -1179,63 +5286,253 @@ class MainWindow(QMainWindow):
         contribute_btn = QPushButton("💰 Contribuir")
         contribute_btn.clicked.connect(self.contribute_to_goal)
         
+        history_btn = QPushButton("📈 Histórico")
+        history_btn.clicked.connect(self.show_goal_history)
+        
         action_layout.addWidget(add_btn)
         action_layout.addWidget(edit_btn)
         action_layout.addWidget(delete_btn)
         action_layout.addWidget(contribute_btn)
+        action_layout.addWidget(history_btn)
         action_layout.addStretch()
         
         layout.addWidget(self.goals_table)
         layout.addLayout(action_layout)
     
+    def setup_accounts_tab(self):
+        layout = QVBoxLayout(self.accounts_tab)
+        layout.setSpacing(15)
+        layout.setContentsMargins(15, 15, 15, 15)
+        
+        # Data do saldo
+        filter_group = QGroupBox("Saldo")
+        filter_layout = QHBoxLayout()
+        filter_layout.setSpacing(10)
+        
+        self.accounts_date_input = QDateEdit()
+        self.accounts_date_input.setDate(QDate.currentDate())
+        self.accounts_date_input.setCalendarPopup(True)
+        
+        filter_btn = QPushButton("Atualizar")
+        filter_btn.clicked.connect(self.load_accounts)
+        
+        filter_layout.addWidget(QLabel("Saldo em:"))
+        filter_layout.addWidget(self.accounts_date_input)
+        filter_layout.addWidget(filter_btn)
+        filter_layout.addStretch()
+        
+        filter_group.setLayout(filter_layout)
+        layout.addWidget(filter_group)
+        
+        # Tabela de contas
+        self.accounts_table = QTableWidget()
+        self.accounts_table.setColumnCount(4)
+        self.accounts_table.setHorizontalHeaderLabels(["ID", "Conta", "Moeda", "Saldo"])
+        self.accounts_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        
+        # Botões de ação
+        action_layout = QHBoxLayout()
+        action_layout.setSpacing(10)
+        
+        add_btn = QPushButton("➕ Nova Conta")
+        add_btn.clicked.connect(self.add_account)
+        
+        transfer_btn = QPushButton("🔁 Transferir")
+        transfer_btn.clicked.connect(self.add_transfer)
+        
+        action_layout.addWidget(add_btn)
+        action_layout.addWidget(transfer_btn)
+        action_layout.addStretch()
+        
+        layout.addWidget(self.accounts_table)
+        layout.addLayout(action_layout)
+    
+    def setup_analytics_tab(self):
+        layout = QVBoxLayout(self.analytics_tab)
+        layout.setSpacing(15)
+        layout.setContentsMargins(15, 15, 15, 15)
+        
+        # Definição da tabela dinâmica
+        pivot_group = QGroupBox("Tabela Dinâmica")
+        pivot_layout = QHBoxLayout()
+        pivot_layout.setSpacing(10)
+        
+        self.pivot_rows_combo = QComboBox()
+        self.pivot_rows_combo.addItems(list(PIVOT_DIMENSIONS))
+        
+        self.pivot_columns_combo = QComboBox()
+        self.pivot_columns_combo.addItems(["Nenhuma"] + list(PIVOT_DIMENSIONS))
+        self.pivot_columns_combo.setCurrentText("Tipo")
+        
+        self.pivot_metric_combo = QComboBox()
+        self.pivot_metric_combo.addItems(list(PIVOT_METRICS))
+        
+        for combo in (self.pivot_rows_combo, self.pivot_columns_combo, self.pivot_metric_combo):
+            combo.currentIndexChanged.connect(self.load_analytics)
+        
+        pivot_layout.addWidget(QLabel("Linhas:"))
+        pivot_layout.addWidget(self.pivot_rows_combo)
+        pivot_layout.addWidget(QLabel("Colunas:"))
+        pivot_layout.addWidget(self.pivot_columns_combo)
+        pivot_layout.addWidget(QLabel("Métrica:"))
+        pivot_layout.addWidget(self.pivot_metric_combo)
+        pivot_layout.addStretch()
+        
+        pivot_group.setLayout(pivot_layout)
+        layout.addWidget(pivot_group)
+        
+        self.analytics_table = QTableWidget()
+        self.analytics_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.analytics_table)
+    
+    def load_analytics(self):
+        rows = PIVOT_DIMENSIONS[self.pivot_rows_combo.currentText()]
+        columns = PIVOT_DIMENSIONS.get(self.pivot_columns_combo.currentText())
+        metric = PIVOT_METRICS[self.pivot_metric_combo.currentText()]
+        
+        with self.profiler.span("Tabela dinâmica", "query", rows=rows, columns=columns, metric=metric):
+            table = self.pivots.pivot(self.user_id, rows, columns, metric)
+        
+        with self.profiler.span("Tabela de análises", "model build", rows=len(table)):
+            self.analytics_table.clear()
+            self.analytics_table.setRowCount(len(table))
+            self.analytics_table.setColumnCount(len(table.columns))
+            self.analytics_table.setHorizontalHeaderLabels(list(table.columns))
+            self.analytics_table.setVerticalHeaderLabels(list(table.index))
+            
+            for row, values in enumerate(table.itertuples(index=False)):
+                for col, value in enumerate(values):
+                    if pd.isna(value):
+                        text = "-"
+                    elif metric == "count" and not table.columns[col].startswith("Δ"):
+                        text = str(int(value))
+                    elif metric == "count":
+                        text = f"{value:+.0f}"
+                    elif table.columns[col].startswith("Δ"):
+                        text = f"{'+' if value >= 0 else '-'}{format_money(abs(value))}"
+                    else:
+                        text = format_money(value)
+                    
+                    item = QTableWidgetItem(text)
+                    item.setFlags(item.flags() ^ Qt.ItemIsEditable)
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                    self.analytics_table.setItem(row, col, item)
+    
     def load_data(self):
-        self.load_transactions()
-        self.load_budgets()
-        self.load_goals()
+        self.pivots.invalidate_user(self.user_id)
+        if self.transaction_cache is not None:
+            self.transaction_cache.invalidate_user(self.user_id)
+        self.invalidate_tabs(*self.tab_loaders)
+    
+    def invalidate_tabs(self, *tabs):
+        # Marca as abas como desatualizadas e recarrega apenas a que está visível
+        self.stale_tabs.update(tabs)
+        self.refresh_current_tab()
+    
+    def refresh_current_tab(self, index=None):
+        tab = self.tab_widget.currentWidget()
+        if tab in self.stale_tabs:
+            self.stale_tabs.discard(tab)
+            self.tab_loaders[tab]()
     
     def load_transactions(self):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
+        # Histórico completo, a partir da primeira página
+        self.transaction_filters = {}
+        self.reset_transaction_pages()
+    
+    def reset_transaction_pages(self):
+        self.page_generation += 1
+        self.page_loading = False
+        self.transaction_pager = TransactionPager(
+            self.db_manager, self.user_id, self.transaction_filters, self.transaction_sort_key,
+            self.transaction_sort_descending, transaction_cache=self.transaction_cache)
+        self.transactions_table.setRowCount(0)
+        self.fetch_transaction_page()
+    
+    def fetch_transaction_page(self):
+        if self.page_loading or self.transaction_pager.exhausted:
+            return
         
-        query = """
-            SELECT id, type, category, amount, description, date 
-            FROM transactions 
-            WHERE user_id = ?
-            ORDER BY date DESC
-        """
+        # A página é lida em segundo plano; resultados de gerações antigas são descartados
+        self.page_loading = True
+        generation = self.page_generation
+        future = self.page_executor.submit(self.transaction_pager.next_page)
+        future.add_done_callback(lambda future: self.page_signals.loaded.emit((generation, future)))
+    
+    def on_transaction_page_loaded(self, payload):
+        generation, future = payload
+        if generation != self.page_generation:
+            return
         
-        cursor.execute(query, (self.user_id,))
-        transactions = cursor.fetchall()
-        conn.close()
+        self.page_loading = False
+        error = future.exception()
+        if error is not None:
+            QMessageBox.warning(self, "Erro", f"Falha ao carregar transações: {error}")
+            return
         
-        self.transactions_table.setRowCount(len(transactions))
+        self.append_transactions_rows(future.result())
         
-        for row, transaction in enumerate(transactions):
-            for col, value in enumerate(transaction):
-                item = QTableWidgetItem(str(value))
-                item.setFlags(item.flags() ^ Qt.ItemIsEditable)
-                
-                # Colorir receitas e despesas
-                if col == 1:  # Coluna do tipo
-                    if value == "Receita":
-                        item.setForeground(QtGui.QColor(0, 128, 0))  # Verde
-                    else:
-                        item.setForeground(QtGui.QColor(255, 0, 0))  # Vermelho
-                
-                self.transactions_table.setItem(row, col, item)
+        # Enquanto a tabela não tiver barra de rolagem, busca a próxima página
+        if self.transactions_table.verticalScrollBar().maximum() == 0:
+            self.fetch_transaction_page()
+    
+    def on_transactions_scrolled(self, value):
+        scroll_bar = self.transactions_table.verticalScrollBar()
+        if value >= scroll_bar.maximum() - 5:
+            self.fetch_transaction_page()
+    
+    def sort_transactions(self, column):
+        sort_key = TRANSACTION_SORT_KEYS.get(column)
+        header = self.transactions_table.horizontalHeader()
+        if sort_key is None:
+            # Coluna sem ordenação: mantém o indicador atual
+            current = [index for index, key in TRANSACTION_SORT_KEYS.items() if key == self.transaction_sort_key][0]
+            header.setSortIndicator(current, Qt.DescendingOrder if self.transaction_sort_descending else Qt.AscendingOrder)
+            return
+        
+        if sort_key == self.transaction_sort_key:
+            self.transaction_sort_descending = not self.transaction_sort_descending
+        else:
+            self.transaction_sort_key = sort_key
+            self.transaction_sort_descending = sort_key in ("date", "amount")
+        
+        header.setSortIndicator(column, Qt.DescendingOrder if self.transaction_sort_descending else Qt.AscendingOrder)
+        self.reset_transaction_pages()
+    
+    def append_transactions_rows(self, transactions):
+        with self.profiler.span("Tabela de transações", "model build", rows=len(transactions)):
+            first_row = self.transactions_table.rowCount()
+            self.transactions_table.setRowCount(first_row + len(transactions))
+            
+            for row, transaction in enumerate(transactions, first_row):
+                currency = transaction[6]
+                for col, value in enumerate(transaction[:6]):
+                    # Valores em outra moeda levam o código ao lado
+                    text = f"{value} {currency}" if col == 3 and currency != BASE_CURRENCY else str(value)
+                    item = QTableWidgetItem(text)
+                    item.setFlags(item.flags() ^ Qt.ItemIsEditable)
+                    
+                    # Colorir receitas e despesas
+                    if col == 1:  # Coluna do tipo
+                        if value == "Receita":
+                            item.setForeground(QtGui.QColor(0, 128, 0))  # Verde
+                        else:
+                            item.setForeground(QtGui.QColor(255, 0, 0))  # Vermelho
+                    
+                    self.transactions_table.setItem(row, col, item)
     
     def load_budgets(self):
         month = self.budget_month_combo.currentIndex() + 1
         year = int(self.budget_year_input.text())
         
-        conn = self.db_manager.get_connection()
+        conn = self.db_manager.get_connection(self.user_id)
         cursor = conn.cursor()
         
         query = """
-            SELECT id, category, amount, month, year 
-            FROM budgets 
-            WHERE user_id = ? AND month = ? AND year = ?
-            ORDER BY category
+            SELECT b.id, c.name, b.amount, b.month, b.year 
+            FROM budgets b JOIN categories c ON c.id = b.category_id
+            WHERE b.user_id = ? AND b.month = ? AND b.year = ?
+            ORDER BY c.name
         """
         
         cursor.execute(query, (self.user_id, month, year))
@@ -1256,9 +5553,51 @@ class MainWindow(QMainWindow):
                     item.setText(months[value - 1])
                 
                 self.budgets_table.setItem(row, col, item)
+        
+        self.load_budget_grid()
+    
+    def load_budget_grid(self):
+        last_month = f"{int(self.budget_year_input.text()):04d}-{self.budget_month_combo.currentIndex() + 1:02d}"
+        count = BUDGET_GRID_MONTHS[self.budget_grid_months_combo.currentIndex()]
+        months, rows = self.db_manager.envelopes.grid(self.user_id, add_months(last_month, 1 - count), last_month)
+        
+        self.budget_grid_table.setColumnCount(len(months))
+        self.budget_grid_table.setHorizontalHeaderLabels([f"{month[5:]}/{month[:4]}" for month in months])
+        self.budget_grid_table.setRowCount(len(rows))
+        self.budget_grid_table.setVerticalHeaderLabels([f"{name} ↻" if rollover else name 
+                                                        for _, name, rollover, _ in rows])
+        
+        for row, (_, _, rollover, cells) in enumerate(rows):
+            for col, (allocated, spent, carry) in enumerate(cells):
+                # Saldo do mês = orçado + trazido do mês anterior (envelopes) - gasto
+                if allocated is None and not (rollover and (carry or spent)):
+                    item = QTableWidgetItem("—")
+                else:
+                    balance = (allocated or 0) + carry - spent
+                    item = QTableWidgetItem(format_money(balance))
+                    item.setToolTip(f"Orçado: {format_money(allocated or 0)}\n"
+                                    f"Trazido: {format_money(carry)}\n"
+                                    f"Gasto: {format_money(spent)}")
+                    if balance < 0:
+                        item.setForeground(QtGui.QColor(244, 67, 54))  # Vermelho
+                item.setTextAlignment(Qt.AlignCenter)
+                self.budget_grid_table.setItem(row, col, item)
+    
+    def load_accounts(self):
+        as_of = self.accounts_date_input.date().toString("yyyy-MM-dd")
+        accounts = self.account_balances.balances(self.user_id, as_of)
+        
+        self.accounts_table.setRowCount(len(accounts))
+        for row, (account_id, name, currency, balance) in enumerate(accounts):
+            for col, value in enumerate([str(account_id), name, currency, format_money(balance, currency)]):
+                item = QTableWidgetItem(value)
+                item.setFlags(item.flags() ^ Qt.ItemIsEditable)
+                if col == 3 and balance < 0:
+                    item.setForeground(QtGui.QColor(255, 0, 0))
+                self.accounts_table.setItem(row, col, item)
     
     def load_goals(self):
-        conn = self.db_manager.get_connection()
+        conn = self.db_manager.get_connection(self.user_id)
         cursor = conn.cursor()
         
         query = """
@@ -1272,6 +5611,8 @@ class MainWindow(QMainWindow):
         goals = cursor.fetchall()
         conn.close()
         
+        projections = self.get_goal_projections()
+        
         self.goals_table.setRowCount(len(goals))
         
         for row, goal in enumerate(goals):
@@ -1289,77 +5630,78 @@ class MainWindow(QMainWindow):
                         item.setForeground(QtGui.QColor(255, 165, 0))  # Laranja
                 
                 self.goals_table.setItem(row, col, item)
+            
+            item = QTableWidgetItem(projections.get(goal[0], "—"))
+            item.setFlags(item.flags() ^ Qt.ItemIsEditable)
+            self.goals_table.setItem(row, 5, item)
     
-    def apply_filters(self):
-        filter_type = self.filter_type_combo.currentText()
-        filter_category = self.filter_category_combo.currentText()
-        start_date = self.filter_start_date.date().toString("yyyy-MM-dd")
-        end_date = self.filter_end_date.date().toString("yyyy-MM-dd")
-        
-        conn = self.db_manager.get_connection()
+    def get_goal_projections(self):
+        # Ritmo médio de contribuições desde a primeira, em uma consulta agregada
+        conn = self.db_manager.get_connection(self.user_id)
         cursor = conn.cursor()
         
-        query = """
-            SELECT id, type, category, amount, description, date 
-            FROM transactions 
-            WHERE user_id = ? 
-            AND date BETWEEN ? AND ?
-        """
-        
-        params = [self.user_id, start_date, end_date]
-        
-        if filter_type != "Todos":
-            query += " AND type = ?"
-            params.append(filter_type)
-        
-        if filter_category != "Todas":
-            query += " AND category = ?"
-            params.append(filter_category)
-        
-        query += " ORDER BY date DESC"
+        cursor.execute("""
+            SELECT g.id, g.target_amount, g.current_amount, 
+                   MIN(c.date), COALESCE(SUM(c.amount), 0)
+            FROM goals g
+            LEFT JOIN goal_contributions c ON c.goal_id = g.id
+            WHERE g.user_id = ?
+            GROUP BY g.id
+        """, (self.user_id,))
         
-        cursor.execute(query, params)
-        transactions = cursor.fetchall()
+        rows = cursor.fetchall()
         conn.close()
         
-        self.transactions_table.setRowCount(len(transactions))
+        today = date.today()
+        projections = {}
         
-        for row, transaction in enumerate(transactions):
-            for col, value in enumerate(transaction):
-                item = QTableWidgetItem(str(value))
-                item.setFlags(item.flags() ^ Qt.ItemIsEditable)
-                
-                # Colorir receitas e despesas
-                if col == 1:  # Coluna do tipo
-                    if value == "Receita":
-                        item.setForeground(QtGui.QColor(0, 128, 0))  # Verde
-                    else:
-                        item.setForeground(QtGui.QColor(255, 0, 0))  # Vermelho
-                
-                self.transactions_table.setItem(row, col, item)
+        for goal_id, target_amount, current_amount, first_date, contributed in rows:
+            if current_amount >= target_amount:
+                projections[goal_id] = "Concluída"
+                continue
+            if not first_date or contributed <= 0:
+                continue
+            
+            elapsed_days = max((today - date.fromisoformat(first_date[:10])).days, 1)
+            daily_rate = contributed / elapsed_days
+            remaining_days = (target_amount - current_amount) / daily_rate
+            if remaining_days < 365 * 100:
+                projected = today + timedelta(days=int(remaining_days) + 1)
+                projections[goal_id] = projected.strftime("%d/%m/%Y")
+        
+        return projections
+    
+    def load_category_filter(self):
+        current = self.filter_category_combo.currentData()
+        self.filter_category_combo.clear()
+        self.filter_category_combo.addItem("Todas", None)
+        for label, name in self.db_manager.categories.choices(self.user_id):
+            self.filter_category_combo.addItem(label, name)
+        self.filter_category_combo.setCurrentIndex(max(self.filter_category_combo.findData(current), 0))
+    
+    def apply_filters(self):
+        filter_type = self.filter_type_combo.currentText()
+        
+        self.transaction_filters = {
+            "type": filter_type if filter_type != "Todos" else None,
+            "category": self.filter_category_combo.currentData(),
+            "start": self.filter_start_date.date().toString("yyyy-MM-dd"),
+            "end": self.filter_end_date.date().toString("yyyy-MM-dd"),
+        }
+        self.reset_transaction_pages()
     
     def update_dashboard(self):
         # Calcular totais
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Receitas
-        cursor.execute("SELECT SUM(amount) FROM transactions WHERE user_id = ? AND type = 'Receita'", 
-                      (self.user_id,))
-        total_income = cursor.fetchone()[0] or 0
-        
-        # Despesas
-        cursor.execute("SELECT SUM(amount) FROM transactions WHERE user_id = ? AND type = 'Despesa'", 
-                      (self.user_id,))
-        total_expense = cursor.fetchone()[0] or 0
+        with self.profiler.span("Totais do dashboard", "query"):
+            total_income, total_expense = self.db_manager.get_totals(self.user_id)
         
         # Saldo
         balance = total_income - total_expense
         
         # Atualizar labels
-        self.income_label.setText(f"R$ {total_income:.2f}")
-        self.expense_label.setText(f"R$ {total_expense:.2f}")
-        self.balance_label.setText(f"R$ {balance:.2f}")
+        self.income_label.setText(format_money(total_income))
+        self.expense_label.setText(format_money(total_expense))
+        self.balance_label.setText(format_money(balance))
         
         # Colorir saldo
         if balance < 0:
@@ -1367,145 +5709,305 @@ class MainWindow(QMainWindow):
         else:
             self.balance_label.setStyleSheet("font-size: 16pt; font-weight: bold; color: white;")
         
-        # Gráfico de despesas por categoria
-        cursor.execute("""
-            SELECT category, SUM(amount) 
-            FROM transactions 
-            WHERE user_id = ? AND type = 'Despesa'
-            GROUP BY category
-        """, (self.user_id,))
-        
-        expenses_by_category = {row[0]: row[1] for row in cursor.fetchall()}
-        self.chart.plot_expenses(expenses_by_category)
+        # Gráfico selecionado
+        self.update_chart()
         
         # Alertas de orçamento
         self.update_budget_alerts()
         
         # Progresso de metas
         self.update_goals_progress()
+    
+    def update_chart(self):
+        kind = CHART_KINDS[self.chart_kind_combo.currentIndex()]
+        with self.profiler.span("Dados do gráfico", "query", kind=kind):
+            data = self.get_chart_data(kind)
+        
+        with self.profiler.span("Montagem do gráfico", "chart draw", kind=kind):
+            self.chart_up_button.setVisible(kind == 'expenses' and self.chart_category_root is not None)
+            if kind == 'expenses':
+                self.chart.plot_expenses(data)
+            elif kind == 'balance':
+                self.chart.plot_balance(*data)
+            else:
+                self.chart.plot_cashflow(*data, CHART_TITLES[kind])
+    
+    def drill_into_category(self, name):
+        # Clique numa barra de despesas: abre as subcategorias, se houver
+        category_id = self.db_manager.categories.ids(self.user_id).get(name)
+        if category_id is None or category_id == self.chart_category_root:
+            return
+        if self.db_manager.categories.children(self.user_id, category_id):
+            self.set_chart_category_root(category_id)
+    
+    def drill_up(self):
+        self.set_chart_category_root(self.db_manager.categories.parent(self.user_id, self.chart_category_root))
+    
+    def set_chart_category_root(self, category_id):
+        self.chart_category_root = category_id
+        if category_id is not None:
+            self.chart_up_button.setText(f"⬆ Voltar ({self.db_manager.categories.label(self.user_id, category_id)})")
+        self.update_chart()
+    
+    def get_chart_data(self, kind):
+        if kind == 'cashflow_month':
+            return self.get_cashflow_series('month')
+        if kind == 'cashflow_week':
+            return self.get_cashflow_series('week')
+        if kind == 'balance':
+            return self.get_balance_series()
+        return self.get_expenses_by_category(self.chart_category_root)
+    
+    def get_expenses_by_category(self, parent_id=None):
+        # Totais das categorias raiz (ou dos filhos de parent_id), cada um somando a própria subárvore:
+        # agrupa por categoria e sobe os grupos pelo fecho da árvore em um único join
+        conn = self.db_manager.get_connection(self.user_id)
+        cursor = conn.cursor()
         
+        # Períodos fechados entram pelos totais congelados (já na moeda base)
+        cursor.execute(f"""
+            WITH leaf AS (
+                SELECT category_id, currency, {FX_DAY_SQL} AS day, SUM(amount) AS amount
+                FROM transactions 
+                WHERE user_id = ? AND type = 'Despesa'
+                GROUP BY category_id, currency, day
+                UNION ALL
+                SELECT category_id, ?, 0, SUM(amount) FROM closed_period_totals 
+                WHERE user_id = ? AND type = 'Despesa'
+                GROUP BY category_id
+            )
+            SELECT cc.ancestor_id, leaf.currency, leaf.day, SUM(leaf.amount)
+            FROM leaf
+            JOIN category_closure cc ON cc.descendant_id = leaf.category_id
+            JOIN categories c ON c.id = cc.ancestor_id
+            WHERE c.parent_id IS ? OR (cc.ancestor_id = ? AND cc.depth = 0)
+            GROUP BY cc.ancestor_id, leaf.currency, leaf.day
+        """, (BASE_CURRENCY, self.user_id, BASE_CURRENCY, self.user_id, parent_id, parent_id))
+        rows = cursor.fetchall()
+        
+        sums = convert_grouped(self.db_manager.fx_rates, rows, ["amount"])
         conn.close()
+        
+        # Agrupado por id; os nomes vêm da lista de categorias em cache.
+        # Lançamentos feitos direto na categoria aberta aparecem numa barra própria
+        names = self.db_manager.categories.names(self.user_id, set(sums.index))
+        return {(f"{names[category_id]} (direto)" if category_id == parent_id else names[category_id]): amount 
+                for category_id, amount in zip(sums.index, sums["amount"].tolist())}
     
-    def update_budget_alerts(self):
-        # Limpar alertas anteriores
-        for i in reversed(range(self.budget_alerts_layout.count())):
-            widget = self.budget_alerts_layout.itemAt(i).widget()
-            if widget is not None:
-                widget.setParent(None)
+    def get_cashflow_series(self, period):
+        # Agregação feita no SQLite: uma linha por mês/semana
+        if period == 'week':
+            period_expr = "date(date, '-6 days', 'weekday 1')"
+        else:
+            period_expr = "strftime('%Y-%m-01', date)"
         
-        current_month = QDate.currentDate().month()
-        current_year = QDate.currentDate().year()
+        conn = self.db_manager.get_connection(self.user_id)
+        cursor = conn.cursor()
         
-        conn = self.db_manager.get_connection()
+        cursor.execute(f"""
+            SELECT {period_expr} AS period, currency, {FX_DAY_SQL} AS day,
+                   SUM(CASE WHEN type = 'Receita' THEN amount ELSE 0 END),
+                   SUM(CASE WHEN type = 'Despesa' THEN amount ELSE 0 END)
+            FROM transactions 
+            WHERE user_id = ?
+            GROUP BY period, currency, day
+        """, (BASE_CURRENCY, self.user_id))
+        rows = cursor.fetchall()
+        
+        cursor.execute(f"""
+            SELECT {period_expr} AS period, ?, 0, SUM(income), SUM(expense)
+            FROM closed_daily_totals 
+            WHERE user_id = ?
+            GROUP BY period
+        """, (BASE_CURRENCY, self.user_id))
+        rows += cursor.fetchall()
+        
+        sums = convert_grouped(self.db_manager.fx_rates, rows, ["income", "expense"])
+        conn.close()
+        
+        periods = [date.fromisoformat(period) for period in sums.index]
+        income = sums["income"].tolist()
+        expense = sums["expense"].tolist()
+        
+        return periods, income, expense
+    
+    def get_balance_series(self):
+        conn = self.db_manager.get_connection(self.user_id)
         cursor = conn.cursor()
         
-        # Buscar orçamentos do mês atual
+        cursor.execute(f"""
+            SELECT date(date) AS day_key, currency, {FX_DAY_SQL} AS day,
+                   SUM(CASE WHEN type = 'Receita' THEN amount ELSE -amount END)
+            FROM transactions 
+            WHERE user_id = ?
+            GROUP BY day_key, currency, day
+        """, (BASE_CURRENCY, self.user_id))
+        rows = cursor.fetchall()
+        
         cursor.execute("""
-            SELECT category, amount 
-            FROM budgets 
-            WHERE user_id = ? AND month = ? AND year = ?
-        """, (self.user_id, current_month, current_year))
+            SELECT date, ?, 0, income - expense FROM closed_daily_totals WHERE user_id = ?
+        """, (BASE_CURRENCY, self.user_id))
+        rows += cursor.fetchall()
         
-        budgets = cursor.fetchall()
+        sums = convert_grouped(self.db_manager.fx_rates, rows, ["amount"])
+        conn.close()
         
-        for category, budget_amount in budgets:
-            # Buscar despesas da categoria no mês atual
-            first_day = date(current_year, current_month, 1)
-            if current_month < 12:
-                last_day = date(current_year, current_month + 1, 1) - timedelta(days=1)
-            else:
-                last_day = date(current_year, 12, 31)
-            
-            cursor.execute("""
-                SELECT SUM(amount) 
-                FROM transactions 
-                WHERE user_id = ? AND type = 'Despesa' AND category = ? 
-                AND date BETWEEN ? AND ?
-            """, (self.user_id, category, first_day.isoformat(), last_day.isoformat()))
-            
-            expenses = cursor.fetchone()[0] or 0
+        days = [date.fromisoformat(day) for day in sums.index]
+        balance = np.cumsum(sums["amount"].to_numpy())
+        
+        return days, balance
+    
+    def update_budget_alerts(self):
+        current_month = QDate.currentDate().month()
+        current_year = QDate.currentDate().year()
+        
+        with self.profiler.span("Consumo dos orçamentos", "query"):
+            status = self.budget_status.get_status(self.user_id, current_month, current_year)
+        
+        alerts = {}
+        for budget_id, category, budget_amount, expenses, carry, thresholds in status:
+            # Nos envelopes o limite do mês inclui o saldo trazido do mês anterior
+            budget_amount += carry or 0
             percentage = (expenses / budget_amount) * 100 if budget_amount > 0 else 0
             
-            if percentage >= 80:
-                alert_color = "red" if percentage >= 100 else "orange"
-                alert_text = f"<font color='{alert_color}'><b>Alerta:</b> {category} - {percentage:.1f}% do orçamento utilizado (R$ {expenses:.2f} / R$ {budget_amount:.2f})</font>"
+            # Aparece a partir do primeiro limiar do orçamento; vermelho ao estourar ou no último
+            if percentage >= thresholds[0]:
+                alert_color = "red" if percentage >= min(100, thresholds[-1]) else "orange"
+                alerts[budget_id] = f"<font color='{alert_color}'><b>Alerta:</b> {category} - {percentage:.1f}% do orçamento utilizado ({format_money(expenses)} / {format_money(budget_amount)})</font>"
+        
+        # Remover apenas os alertas que deixaram de existir
+        for budget_id in list(self.budget_alert_labels):
+            if budget_id not in alerts:
+                alert_label = self.budget_alert_labels.pop(budget_id)
+                self.budget_alerts_layout.removeWidget(alert_label)
+                alert_label.deleteLater()
+        
+        # Criar os novos e atualizar o texto dos existentes
+        for budget_id, alert_text in alerts.items():
+            alert_label = self.budget_alert_labels.get(budget_id)
+            if alert_label is None:
                 alert_label = QLabel(alert_text)
                 alert_label.setWordWrap(True)
                 self.budget_alerts_layout.addWidget(alert_label)
+                self.budget_alert_labels[budget_id] = alert_label
+            elif alert_label.text() != alert_text:
+                alert_label.setText(alert_text)
         
         # Se não houver alertas
-        if self.budget_alerts_layout.count() == 0:
-            alert_label = QLabel("<font color='green'>Nenhum alerta de orçamento</font>")
-            self.budget_alerts_layout.addWidget(alert_label)
-        
-        conn.close()
+        self.no_budget_alerts_label.setVisible(not alerts)
     
     def update_goals_progress(self):
-        # Limpar progresso anterior
-        for i in reversed(range(self.goals_progress_layout.count())):
-            widget = self.goals_progress_layout.itemAt(i).widget()
-            if widget is not None:
-                widget.setParent(None)
-        
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Buscar metas
-        cursor.execute("SELECT id, title, target_amount, current_amount FROM goals WHERE user_id = ?", 
-                      (self.user_id,))
-        
-        goals = cursor.fetchall()
-        
-        for goal_id, title, target_amount, current_amount in goals:
-            progress_percentage = (current_amount / target_amount) * 100 if target_amount > 0 else 0
-            
-            goal_group = QGroupBox(title)
-            goal_layout = QVBoxLayout()
-            
-            progress_label = QLabel(f"Progresso: R$ {current_amount:.2f} / R$ {target_amount:.2f} ({progress_percentage:.1f}%)")
-            progress_bar = QProgressBar()
-            progress_bar.setValue(int(progress_percentage))
-            
-            # Colorir a barra de progresso
-            if progress_percentage >= 100:
-                progress_bar.setStyleSheet("QProgressBar::chunk { background-color: #4CAF50; }")
-            elif progress_percentage >= 70:
-                progress_bar.setStyleSheet("QProgressBar::chunk { background-color: #FF9800; }")
-            else:
-                progress_bar.setStyleSheet("QProgressBar::chunk { background-color: #2196F3; }")
+        with self.profiler.span("Consulta de metas", "query"):
+            conn = self.db_manager.get_connection(self.user_id)
+            cursor = conn.cursor()
             
-            goal_layout.addWidget(progress_label)
-            goal_layout.addWidget(progress_bar)
-            goal_group.setLayout(goal_layout)
+            # Buscar metas
+            cursor.execute("SELECT id, title, target_amount, current_amount FROM goals WHERE user_id = ? ORDER BY id", 
+                          (self.user_id,))
             
-            self.goals_progress_layout.addWidget(goal_group)
+            goals = cursor.fetchall()
+            conn.close()
         
-        # Se não houver metas
-        if self.goals_progress_layout.count() == 0:
-            goal_label = QLabel("Nenhuma meta definida")
-            self.goals_progress_layout.addWidget(goal_label)
+        # O modelo atualiza apenas as metas cujos valores mudaram
+        with self.profiler.span("Modelo de metas", "model build", goals=len(goals)):
+            self.goals_progress_model.set_goals(goals)
         
-        conn.close()
+        # Se não houver metas
+        self.goals_progress_view.setVisible(bool(goals))
+        self.no_goals_label.setVisible(not goals)
+    
+    def submit_write(self, function, on_committed=None, on_error=None):
+        # A escrita entra na fila do escritor; os callbacks rodam na thread da GUI após o commit
+        future = self.db_manager.get_writer().submit(self.user_id, function)
+        future.add_done_callback(
+            lambda future: self.write_signals.committed.emit((future, on_committed, on_error)))
+        return future
+    
+    def on_write_committed(self, payload):
+        future, on_committed, on_error = payload
+        error = future.exception()
+        if error is None:
+            if on_committed:
+                on_committed(future.result())
+        elif on_error:
+            on_error(error)
+        else:
+            QMessageBox.warning(self, "Erro", f"Falha ao gravar: {error}")
     
     def add_transaction(self):
         dialog = TransactionDialog(self.user_id, self.db_manager, parent=self)
         if dialog.exec_():
             data = dialog.get_data()
             
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO transactions (user_id, type, category, amount, description, date)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (self.user_id, data["type"], data["category"], data["amount"], 
-                 data["description"], data["date"]))
+            def insert(cursor):
+                self.db_manager.periods.check_open(cursor, self.user_id, [data["date"]])
+                account_id = data["account_id"] or self.db_manager.default_account_id(cursor, self.user_id)
+                category_id = self.db_manager.categories.resolve(cursor, self.user_id, data["category"])
+                cursor.execute("""
+                    INSERT INTO transactions (user_id, type, category_id, amount, currency, account_id, description, date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (self.user_id, data["type"], category_id, data["amount"], data["currency"],
+                     account_id, data["description"], data["date"]))
+                transaction_id = cursor.lastrowid
+                signed = data["amount"] if data["type"] == "Receita" else -data["amount"]
+                self.db_manager.apply_account_movements(cursor, [(account_id, data["date"], signed, data["currency"])])
+                self.db_manager.envelopes.apply_spending(cursor, [(data["type"], category_id, data["date"], data["amount"], 
+                                                                     data["currency"])])
+                return transaction_id
             
-            conn.commit()
-            conn.close()
+            def inserted(transaction_id):
+                self.update_cached_transaction(transaction_id, data)
+                spent = data["amount"] if data["type"] == "Despesa" else 0
+                self.evaluate_budget_alerts(self.on_transaction_changed(
+                    data["date"], data["category"], data["currency"], spent, started))
+                self.invalidate_tabs(self.transactions_tab, self.dashboard_tab)
             
-            self.load_transactions()
-            self.update_dashboard()
+            started = self.budget_status.tick()
+            self.submit_write(insert, inserted)
+    
+    def on_transaction_changed(self, transaction_date, category, currency, spent=None, started=None):
+        # Notifica os caches que dependem das transações do mês/categoria/moeda; com a variação de
+        # gasto (spent) o consumo em cache é ajustado sem reconsulta e as linhas afetadas são devolvidas
+        if spent is None:
+            self.budget_status.invalidate_transaction(self.user_id, transaction_date, category)
+            rows = []
+        else:
+            rows = self.budget_status.apply_transaction(self.user_id, transaction_date, category, currency, spent, started)
+        self.db_manager.currency_totals.invalidate_transaction(self.user_id, transaction_date, currency)
+        self.pivots.invalidate_user(self.user_id)
+        self.stale_tabs.update((self.analytics_tab, self.accounts_tab))
+        return rows
+    
+    def evaluate_budget_alerts(self, rows):
+        future = self.db_manager.budget_alerts.evaluate(self.user_id, rows)
+        if future is not None:
+            future.add_done_callback(lambda future: self.write_signals.committed.emit(
+                (future, self.notify_budget_alerts, lambda error: logger.warning("Falha ao gravar alertas: %s", error))))
+    
+    def notify_budget_alerts(self, alerts):
+        for budget_id, category, threshold, spent, limit in alerts:
+            title = "Orçamento estourado" if threshold >= 100 else "Alerta de orçamento"
+            message = f"{category}: {threshold}% do orçamento atingido ({format_money(spent)} / {format_money(limit)})"
+            # Notificação do sistema quando houver bandeja; senão, barra de status
+            if self.tray_icon is None and QSystemTrayIcon.isSystemTrayAvailable():
+                self.tray_icon = QSystemTrayIcon(self.windowIcon(), self)
+                self.tray_icon.show()
+            if self.tray_icon is not None:
+                self.tray_icon.showMessage(title, message, QSystemTrayIcon.Warning)
+            else:
+                self.statusBar().showMessage(f"{title} - {message}", 10000)
+        if alerts:
+            self.invalidate_tabs(self.dashboard_tab)
+    
+    def update_cached_transaction(self, transaction_id, data):
+        if self.transaction_cache is not None:
+            self.transaction_cache.upsert(self.user_id, transaction_id, data["type"], data["category"],
+                                          data["amount"], data["description"], data["date"], 
+                                          data.get("currency", BASE_CURRENCY))
+    
+    def remove_cached_transaction(self, transaction_id):
+        if self.transaction_cache is not None:
+            self.transaction_cache.remove(self.user_id, transaction_id)
     
     def edit_transaction(self):
         selected_row = self.transactions_table.currentRow()
@@ -1514,26 +6016,36 @@ class MainWindow(QMainWindow):
             return
         
         transaction_id = int(self.transactions_table.item(selected_row, 0).text())
+        if not self.is_period_open(self.transactions_table.item(selected_row, 5).text()):
+            return
         
         dialog = TransactionDialog(self.user_id, self.db_manager, transaction_id, parent=self)
         if dialog.exec_():
             data = dialog.get_data()
             
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                UPDATE transactions 
-                SET type = ?, category = ?, amount = ?, description = ?, date = ?
-                WHERE id = ? AND user_id = ?
-            """, (data["type"], data["category"], data["amount"], data["description"], 
-                 data["date"], transaction_id, self.user_id))
+            def update(cursor):
+                previous = self.previous_transaction(cursor, transaction_id)
+                category_id = self.db_manager.categories.resolve(cursor, self.user_id, data["category"])
+                cursor.execute("""
+                    UPDATE transactions 
+                    SET type = ?, category_id = ?, amount = ?, currency = ?, account_id = COALESCE(?, account_id), 
+                        description = ?, date = ?
+                    WHERE id = ? AND user_id = ?
+                """, (data["type"], category_id, data["amount"], data["currency"], data["account_id"],
+                     data["description"], data["date"], transaction_id, self.user_id))
+                return previous
             
-            conn.commit()
-            conn.close()
+            def updated(previous):
+                self.update_cached_transaction(transaction_id, data)
+                # Avalia os alertas só com o estado final (saída do valor antigo e entrada do novo)
+                rows = self.on_transaction_changed(*previous, started) if previous else []
+                spent = data["amount"] if data["type"] == "Despesa" else 0
+                rows += self.on_transaction_changed(data["date"], data["category"], data["currency"], spent, started)
+                self.evaluate_budget_alerts(list({row[0]: row for row in rows}.values()))
+                self.invalidate_tabs(self.transactions_tab, self.dashboard_tab)
             
-            self.load_transactions()
-            self.update_dashboard()
+            started = self.budget_status.tick()
+            self.submit_write(update, updated)
     
     def delete_transaction(self):
         selected_row = self.transactions_table.currentRow()
@@ -1542,48 +6054,144 @@ class MainWindow(QMainWindow):
             return
         
         transaction_id = int(self.transactions_table.item(selected_row, 0).text())
+        if not self.is_period_open(self.transactions_table.item(selected_row, 5).text()):
+            return
         
         reply = QMessageBox.question(self, "Confirmar", 
                                     "Tem certeza que deseja excluir esta transação?",
                                     QMessageBox.Yes | QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
+            def delete(cursor):
+                previous = self.previous_transaction(cursor, transaction_id)
+                cursor.execute("DELETE FROM transactions WHERE id = ? AND user_id = ?", 
+                              (transaction_id, self.user_id))
+                return previous
             
-            cursor.execute("DELETE FROM transactions WHERE id = ? AND user_id = ?", 
-                          (transaction_id, self.user_id))
+            def deleted(previous):
+                self.remove_cached_transaction(transaction_id)
+                if previous:
+                    self.evaluate_budget_alerts(self.on_transaction_changed(*previous, started))
+                self.invalidate_tabs(self.transactions_tab, self.dashboard_tab)
+            
+            started = self.budget_status.tick()
+            self.submit_write(delete, deleted)
+    
+    def previous_transaction(self, cursor, transaction_id):
+        # (data, categoria, moeda, variação de gasto ao removê-la) antes da escrita
+        cursor.execute("""
+            SELECT t.date, c.name, t.currency, CASE WHEN t.type = 'Despesa' THEN -t.amount ELSE 0 END
+            FROM transactions t JOIN categories c ON c.id = t.category_id 
+            WHERE t.id = ? AND t.user_id = ?
+        """, (transaction_id, self.user_id))
+        return cursor.fetchone()
+    
+    def is_period_open(self, transaction_date):
+        # Transações de períodos fechados estão arquivadas e não podem ser alteradas
+        conn = self.db_manager.get_connection(self.user_id)
+        closed_through = self.db_manager.periods.closed_through(conn.cursor(), self.user_id)
+        conn.close()
+        
+        if closed_through is not None and transaction_date[:7] <= closed_through:
+            QMessageBox.warning(self, "Período Fechado", 
+                                f"Os meses até {closed_through} estão fechados e não podem ser alterados")
+            return False
+        return True
+    
+    def budget_write_failed(self, error):
+        if isinstance(error, sqlite3.IntegrityError):
+            QMessageBox.warning(self, "Erro", "Já existe um orçamento para esta categoria neste mês")
+        else:
+            QMessageBox.warning(self, "Erro", f"Falha ao gravar: {error}")
+    
+    def add_category(self):
+        dialog = CategoryDialog(self.user_id, self.db_manager, parent=self)
+        if dialog.exec_():
+            data = dialog.get_data()
+            if not data["name"]:
+                QMessageBox.warning(self, "Erro", "Informe o nome da categoria")
+                return
+            
+            def insert(cursor):
+                cursor.execute("INSERT INTO categories (user_id, name, parent_id, type) VALUES (?, ?, ?, ?)", 
+                              (self.user_id, data["name"], data["parent_id"], data["type"]))
+            
+            def inserted(result):
+                self.db_manager.categories.invalidate(self.user_id)
+                self.load_category_filter()
+            
+            def failed(error):
+                if isinstance(error, sqlite3.IntegrityError):
+                    QMessageBox.warning(self, "Erro", "Já existe uma categoria com este nome (inclusive sob outro pai)")
+                else:
+                    QMessageBox.warning(self, "Erro", f"Falha ao gravar: {error}")
+            
+            self.submit_write(insert, inserted, failed)
+    
+    def add_account(self):
+        dialog = AccountDialog(self.user_id, self.db_manager, parent=self)
+        if dialog.exec_():
+            data = dialog.get_data()
+            if not data["name"]:
+                QMessageBox.warning(self, "Erro", "Informe o nome da conta")
+                return
+            
+            def insert(cursor):
+                cursor.execute("INSERT INTO accounts (user_id, name, currency) VALUES (?, ?, ?)", 
+                              (self.user_id, data["name"], data["currency"]))
+            
+            def failed(error):
+                if isinstance(error, sqlite3.IntegrityError):
+                    QMessageBox.warning(self, "Erro", "Já existe uma conta com este nome")
+                else:
+                    QMessageBox.warning(self, "Erro", f"Falha ao gravar: {error}")
+            
+            self.submit_write(insert, lambda result: self.invalidate_tabs(self.accounts_tab), failed)
+    
+    def add_transfer(self):
+        dialog = TransferDialog(self.user_id, self.db_manager, parent=self)
+        if dialog.exec_():
+            data = dialog.get_data()
+            if data["from_account_id"] is None or data["from_account_id"] == data["to_account_id"]:
+                QMessageBox.warning(self, "Erro", "Escolha duas contas diferentes")
+                return
             
-            conn.commit()
-            conn.close()
+            def insert(cursor):
+                self.db_manager.periods.check_open(cursor, self.user_id, [data["date"]])
+                cursor.execute("""
+                    INSERT INTO transfers (user_id, from_account_id, to_account_id, amount, to_amount, description, date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (self.user_id, data["from_account_id"], data["to_account_id"], data["amount"], 
+                     data["to_amount"], data["description"], data["date"]))
+                self.db_manager.apply_account_movements(cursor, [
+                    (data["from_account_id"], data["date"], -data["amount"]),
+                    (data["to_account_id"], data["date"], data["to_amount"]),
+                ])
             
-            self.load_transactions()
-            self.update_dashboard()
+            self.submit_write(insert, lambda result: self.invalidate_tabs(self.accounts_tab))
     
     def add_budget(self):
         dialog = BudgetDialog(self.user_id, self.db_manager, parent=self)
         if dialog.exec_():
             data = dialog.get_data()
             
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            try:
+            def insert(cursor):
+                category_id = self.db_manager.categories.resolve(cursor, self.user_id, data["category"])
                 cursor.execute("""
-                    INSERT INTO budgets (user_id, category, amount, month, year)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (self.user_id, data["category"], data["amount"], 
-                     data["month"], data["year"]))
-                
-                conn.commit()
+                    INSERT INTO budgets (user_id, category_id, amount, month, year, alert_thresholds)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (self.user_id, category_id, data["amount"], 
+                     data["month"], data["year"], data["alert_thresholds"]))
+                self.set_category_rollover(cursor, category_id, data["rollover"])
+            
+            def inserted(result):
                 QMessageBox.information(self, "Sucesso", "Orçamento adicionado com sucesso")
-            except sqlite3.IntegrityError:
-                QMessageBox.warning(self, "Erro", "Já existe um orçamento para esta categoria neste mês")
-            finally:
-                conn.close()
+                # Nos envelopes o orçamento muda o saldo trazido dos meses seguintes
+                self.budget_status.invalidate_budgets(self.user_id)
+                self.reevaluate_budget_alerts(data["month"], data["year"])
+                self.invalidate_tabs(self.budgets_tab, self.dashboard_tab)
             
-            self.load_budgets()
-            self.update_dashboard()
+            self.submit_write(insert, inserted, self.budget_write_failed)
     
     def edit_budget(self):
         selected_row = self.budgets_table.currentRow()
@@ -1597,26 +6205,39 @@ class MainWindow(QMainWindow):
         if dialog.exec_():
             data = dialog.get_data()
             
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            try:
+            def update(cursor):
+                category_id = self.db_manager.categories.resolve(cursor, self.user_id, data["category"])
                 cursor.execute("""
                     UPDATE budgets 
-                    SET category = ?, amount = ?, month = ?, year = ?
+                    SET category_id = ?, amount = ?, month = ?, year = ?, alert_thresholds = ?
                     WHERE id = ? AND user_id = ?
-                """, (data["category"], data["amount"], data["month"], 
-                     data["year"], budget_id, self.user_id))
-                
-                conn.commit()
+                """, (category_id, data["amount"], data["month"], 
+                     data["year"], data["alert_thresholds"], budget_id, self.user_id))
+                self.set_category_rollover(cursor, category_id, data["rollover"])
+            
+            def updated(result):
                 QMessageBox.information(self, "Sucesso", "Orçamento atualizado com sucesso")
-            except sqlite3.IntegrityError:
-                QMessageBox.warning(self, "Erro", "Já existe um orçamento para esta categoria neste mês")
-            finally:
-                conn.close()
+                self.budget_status.invalidate_budgets(self.user_id)
+                self.reevaluate_budget_alerts(data["month"], data["year"])
+                self.invalidate_tabs(self.budgets_tab, self.dashboard_tab)
             
-            self.load_budgets()
-            self.update_dashboard()
+            self.submit_write(update, updated, self.budget_write_failed)
+    
+    def reevaluate_budget_alerts(self, month, year):
+        # Valor, limiares ou mês do orçamento alterados mudam o que já foi atingido: os limiares do mês
+        # são avaliados de novo (um orçamento aumentado rearma os avisos). Nos envelopes o saldo
+        # trazido muda também nos meses seguintes, então o mês atual é avaliado junto
+        today = date.today()
+        months = {(month, year)}
+        if (year, month) < (today.year, today.month):
+            months.add((today.month, today.year))
+        for month, year in months:
+            self.evaluate_budget_alerts(self.budget_status.get_status(self.user_id, month, year))
+    
+    def set_category_rollover(self, cursor, category_id, rollover):
+        # O trigger descarta os saldos do envelope; são recalculados na próxima leitura
+        cursor.execute("UPDATE categories SET rollover = ? WHERE id = ? AND rollover != ?", 
+                       (int(rollover), category_id, int(rollover)))
     
     def delete_budget(self):
         selected_row = self.budgets_table.currentRow()
@@ -1631,37 +6252,33 @@ class MainWindow(QMainWindow):
                                     QMessageBox.Yes | QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("DELETE FROM budgets WHERE id = ? AND user_id = ?", 
-                          (budget_id, self.user_id))
+            def delete(cursor):
+                cursor.execute("DELETE FROM budgets WHERE id = ? AND user_id = ?", 
+                              (budget_id, self.user_id))
             
-            conn.commit()
-            conn.close()
+            def deleted(result):
+                self.budget_status.invalidate_budgets(self.user_id)
+                self.invalidate_tabs(self.budgets_tab, self.dashboard_tab)
             
-            self.load_budgets()
-            self.update_dashboard()
+            self.submit_write(delete, deleted)
     
     def add_goal(self):
         dialog = GoalDialog(self.user_id, self.db_manager, parent=self)
         if dialog.exec_():
             data = dialog.get_data()
             
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO goals (user_id, title, target_amount, current_amount, deadline)
-                VALUES (?, ?, ?, ?, ?)
-            """, (self.user_id, data["title"], data["target_amount"], 
-                 data["current_amount"], data["deadline"]))
-            
-            conn.commit()
-            conn.close()
+            def insert(cursor):
+                cursor.execute("""
+                    INSERT INTO goals (user_id, title, target_amount, current_amount, deadline)
+                    VALUES (?, ?, ?, 0, ?)
+                """, (self.user_id, data["title"], data["target_amount"], data["deadline"]))
+                
+                # O valor atual informado entra no histórico como saldo inicial
+                if data["current_amount"]:
+                    self.record_goal_contribution(cursor, cursor.lastrowid, data["current_amount"], 
+                                                  "Saldo inicial")
             
-            self.load_goals()
-            self.update_dashboard()
+            self.submit_write(insert, lambda result: self.invalidate_tabs(self.goals_tab, self.dashboard_tab))
     
     def edit_goal(self):
         selected_row = self.goals_table.currentRow()
@@ -1675,21 +6292,23 @@ class MainWindow(QMainWindow):
         if dialog.exec_():
             data = dialog.get_data()
             
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                UPDATE goals 
-                SET title = ?, target_amount = ?, current_amount = ?, deadline = ?
-                WHERE id = ? AND user_id = ?
-            """, (data["title"], data["target_amount"], data["current_amount"], 
-                 data["deadline"], goal_id, self.user_id))
-            
-            conn.commit()
-            conn.close()
+            def update(cursor):
+                cursor.execute("""
+                    UPDATE goals 
+                    SET title = ?, target_amount = ?, deadline = ?
+                    WHERE id = ? AND user_id = ?
+                """, (data["title"], data["target_amount"], data["deadline"], 
+                     goal_id, self.user_id))
+                
+                # Alterações manuais do valor atual ficam registradas como ajuste
+                cursor.execute("SELECT current_amount FROM goals WHERE id = ? AND user_id = ?", 
+                              (goal_id, self.user_id))
+                goal = cursor.fetchone()
+                if goal and round(data["current_amount"] - goal[0], 2):
+                    self.record_goal_contribution(cursor, goal_id, data["current_amount"] - goal[0], 
+                                                  "Ajuste manual")
             
-            self.load_goals()
-            self.update_dashboard()
+            self.submit_write(update, lambda result: self.invalidate_tabs(self.goals_tab, self.dashboard_tab))
     
     def delete_goal(self):
         selected_row = self.goals_table.currentRow()
@@ -1704,17 +6323,11 @@ class MainWindow(QMainWindow):
                                     QMessageBox.Yes | QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
+            def delete(cursor):
+                cursor.execute("DELETE FROM goals WHERE id = ? AND user_id = ?", 
+                              (goal_id, self.user_id))
             
-            cursor.execute("DELETE FROM goals WHERE id = ? AND user_id = ?", 
-                          (goal_id, self.user_id))
-            
-            conn.commit()
-            conn.close()
-            
-            self.load_goals()
-            self.update_dashboard()
+            self.submit_write(delete, lambda result: self.invalidate_tabs(self.goals_tab, self.dashboard_tab))
     
     def contribute_to_goal(self):
         selected_row = self.goals_table.currentRow()
@@ -1723,35 +6336,108 @@ class MainWindow(QMainWindow):
             return
         
         goal_id = int(self.goals_table.item(selected_row, 0).text())
-        current_amount = float(self.goals_table.item(selected_row, 3).text())
-        target_amount = float(self.goals_table.item(selected_row, 2).text())
+        
+        conn = self.db_manager.get_connection(self.user_id)
+        cursor = conn.cursor()
+        cursor.execute("SELECT title, target_amount, current_amount FROM goals WHERE id = ? AND user_id = ?", 
+                      (goal_id, self.user_id))
+        goal = cursor.fetchone()
+        conn.close()
+        
+        if not goal:
+            return
+        
+        title, target_amount, current_amount = goal
+        if current_amount >= target_amount:
+            QMessageBox.information(self, "Meta", "Esta meta já foi atingida")
+            return
         
         amount, ok = QInputDialog.getDouble(self, "Contribuir para Meta", 
                                            "Valor da contribuição:", 
                                            decimals=2, min=0.01, max=target_amount - current_amount)
         
         if ok:
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                UPDATE goals 
-                SET current_amount = current_amount + ?
-                WHERE id = ? AND user_id = ?
-            """, (amount, goal_id, self.user_id))
+            today = QDate.currentDate().toString("yyyy-MM-dd")
+            transaction = {"type": "Despesa", "category": GOAL_CATEGORY, "amount": amount,
+                           "currency": BASE_CURRENCY, "description": f"Contribuição para meta: {title}", 
+                           "date": today}
             
-            # Registrar a contribuição como uma transação
-            cursor.execute("""
-                INSERT INTO transactions (user_id, type, category, amount, description, date)
-                VALUES (?, 'Despesa', 'Meta Financeira', ?, 'Contribuição para meta', ?)
-            """, (self.user_id, amount, QDate.currentDate().toString("yyyy-MM-dd")))
+            def insert(cursor):
+                # Registrar a contribuição como uma transação (metas ficam na moeda base)
+                account_id = self.db_manager.default_account_id(cursor, self.user_id)
+                category_id = self.db_manager.categories.resolve(cursor, self.user_id, GOAL_CATEGORY)
+                cursor.execute("""
+                    INSERT INTO transactions (user_id, type, category_id, amount, currency, account_id, description, date)
+                    VALUES (?, 'Despesa', ?, ?, ?, ?, ?, ?)
+                """, (self.user_id, category_id, amount, BASE_CURRENCY, account_id, transaction["description"], today))
+                transaction_id = cursor.lastrowid
+                self.db_manager.apply_account_movements(cursor, [(account_id, today, -amount, BASE_CURRENCY)])
+                self.db_manager.envelopes.apply_spending(cursor, [("Despesa", category_id, today, amount)])
+                
+                # O trigger da tabela de contribuições atualiza o valor atual da meta
+                self.record_goal_contribution(cursor, goal_id, amount, "Contribuição", 
+                                              transaction_id=transaction_id, contribution_date=today)
+                return transaction_id
             
-            conn.commit()
-            conn.close()
+            def inserted(transaction_id):
+                self.update_cached_transaction(transaction_id, transaction)
+                self.evaluate_budget_alerts(self.on_transaction_changed(today, GOAL_CATEGORY, BASE_CURRENCY, 
+                                                                        amount, started))
+                self.invalidate_tabs(self.goals_tab, self.transactions_tab, self.dashboard_tab)
             
-            self.load_goals()
-            self.load_transactions()
-            self.update_dashboard()
+            started = self.budget_status.tick()
+            self.submit_write(insert, inserted)
+    
+    def record_goal_contribution(self, cursor, goal_id, amount, description, 
+                                 transaction_id=None, contribution_date=None):
+        cursor.execute("""
+            INSERT INTO goal_contributions (goal_id, user_id, transaction_id, amount, description, date)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (goal_id, self.user_id, transaction_id, amount, description, 
+             contribution_date or QDate.currentDate().toString("yyyy-MM-dd")))
+    
+    def show_goal_history(self):
+        selected_row = self.goals_table.currentRow()
+        if selected_row == -1:
+            QMessageBox.warning(self, "Erro", "Selecione uma meta para ver o histórico")
+            return
+        
+        goal_id = int(self.goals_table.item(selected_row, 0).text())
+        
+        conn = self.db_manager.get_connection(self.user_id)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT date, amount, description,
+                   SUM(amount) OVER (ORDER BY date, id) AS balance
+            FROM goal_contributions
+            WHERE goal_id = ? AND user_id = ?
+            ORDER BY date, id
+        """, (goal_id, self.user_id))
+        contributions = cursor.fetchall()
+        conn.close()
+        
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Histórico da Meta")
+        dialog.resize(500, 400)
+        layout = QVBoxLayout(dialog)
+        
+        table = QTableWidget(len(contributions), 4)
+        table.setHorizontalHeaderLabels(["Data", "Valor", "Descrição", "Saldo"])
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        
+        for row, (contribution_date, amount, description, balance) in enumerate(contributions):
+            for col, value in enumerate([contribution_date, format_money(amount), 
+                                         description or "", format_money(balance)]):
+                item = QTableWidgetItem(value)
+                item.setFlags(item.flags() ^ Qt.ItemIsEditable)
+                table.setItem(row, col, item)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(dialog.reject)
+        
+        layout.addWidget(table)
+        layout.addWidget(buttons)
+        dialog.exec_()
     
     def export_pdf(self):
         file_path, _ = QFileDialog.getSaveFileName(self, "Exportar PDF", "", "PDF Files (*.pdf)")
@@ -1759,6 +6445,10 @@ class MainWindow(QMainWindow):
         if not file_path:
             return
         
+        self.write_pdf(file_path)
+        QMessageBox.information(self, "Sucesso", "PDF exportado com sucesso")
+    
+    def write_pdf(self, file_path):
         doc = SimpleDocTemplate(file_path, pagesize=letter)
         elements = []
         
@@ -1776,23 +6466,18 @@ class MainWindow(QMainWindow):
         # Resumo
         elements.append(Paragraph("Resumo Financeiro", heading_style))
         
-        conn = self.db_manager.get_connection()
+        conn = self.db_manager.get_connection(self.user_id)
         cursor = conn.cursor()
         
-        cursor.execute("SELECT SUM(amount) FROM transactions WHERE user_id = ? AND type = 'Receita'", 
-                      (self.user_id,))
-        total_income = cursor.fetchone()[0] or 0
-        
-        cursor.execute("SELECT SUM(amount) FROM transactions WHERE user_id = ? AND type = 'Despesa'", 
-                      (self.user_id,))
-        total_expense = cursor.fetchone()[0] or 0
+        # Totais convertidos para a moeda base
+        total_income, total_expense = self.db_manager.get_totals(self.user_id)
         
         balance = total_income - total_expense
         
         summary_data = [
-            ["Receitas", f"R$ {total_income:.2f}"],
-            ["Despesas", f"R$ {total_expense:.2f}"],
-            ["Saldo", f"R$ {balance:.2f}"]
+            ["Receitas", format_money(total_income)],
+            ["Despesas", format_money(total_expense)],
+            ["Saldo", format_money(balance)]
         ]
         
         summary_table = Table(summary_data)
@@ -1811,12 +6496,19 @@ class MainWindow(QMainWindow):
         elements.append(summary_table)
         elements.append(Paragraph("<br/>", normal_style))
         
+        # Gráfico de despesas (reaproveita o render em cache quando os dados não mudaram)
+        chart_png = self.chart_renderer.render_png(self.user_id, 'expenses', 
+                                                   self.get_expenses_by_category(), 
+                                                   size=(600, 400))
+        elements.append(ReportImage(io.BytesIO(chart_png), width=6 * inch, height=4 * inch))
+        elements.append(Paragraph("<br/>", normal_style))
+        
         # Transações recentes
         elements.append(Paragraph("Últimas Transações", heading_style))
         
         cursor.execute("""
-            SELECT type, category, amount, description, date 
-            FROM transactions 
+            SELECT type, category_id, amount, description, date, currency 
+            FROM all_transactions 
             WHERE user_id = ? 
             ORDER BY date DESC 
             LIMIT 10
@@ -1826,10 +6518,11 @@ class MainWindow(QMainWindow):
         
         if transactions:
             trans_data = [["Tipo", "Categoria", "Valor", "Descrição", "Data"]]
+            names = self.db_manager.categories.names(self.user_id, {trans[1] for trans in transactions})
             
             for trans in transactions:
                 trans_data.append([
-                    trans[0], trans[1], f"R$ {trans[2]:.2f}", 
+                    trans[0], names[trans[1]], format_money(trans[2], trans[5]), 
                     trans[3] or "", trans[4]
                 ])
             
@@ -1867,7 +6560,7 @@ class MainWindow(QMainWindow):
             for goal in goals:
                 progress = (goal[2] / goal[1]) * 100 if goal[1] > 0 else 0
                 goals_data.append([
-                    goal[0], f"R$ {goal[1]:.2f}", f"R$ {goal[2]:.2f}", 
+                    goal[0], format_money(goal[1]), format_money(goal[2]), 
                     f"{progress:.1f}%", goal[3]
                 ])
             
@@ -1893,7 +6586,6 @@ class MainWindow(QMainWindow):
         
         # Gerar PDF
         doc.build(elements)
-        QMessageBox.information(self, "Sucesso", "PDF exportado com sucesso")
     
     def export_excel(self):
         file_path, _ = QFileDialog.getSaveFileName(self, "Exportar Excel", "", "Excel Files (*.xlsx)")
@@ -1901,36 +6593,12 @@ class MainWindow(QMainWindow):
         if not file_path:
             return
         
-        conn = self.db_manager.get_connection()
-        
-        # Transações
-        transactions_df = pd.read_sql_query(
-            "SELECT type, category, amount, description, date FROM transactions WHERE user_id = ?", 
-            conn, params=[self.user_id]
-        )
-        
-        # Orçamentos
-        budgets_df = pd.read_sql_query(
-            "SELECT category, amount, month, year FROM budgets WHERE user_id = ?", 
-            conn, params=[self.user_id]
-        )
-        
-        # Metas
-        goals_df = pd.read_sql_query(
-            "SELECT title, target_amount, current_amount, deadline FROM goals WHERE user_id = ?", 
-            conn, params=[self.user_id]
-        )
-        
-        conn.close()
-        
-        # Criar arquivo Excel com múltiplas abas
-        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-            transactions_df.to_excel(writer, sheet_name='Transações', index=False)
-            budgets_df.to_excel(writer, sheet_name='Orçamentos', index=False)
-            goals_df.to_excel(writer, sheet_name='Metas', index=False)
-        
+        self.write_excel(file_path)
         QMessageBox.information(self, "Sucesso", "Excel exportado com sucesso")
     
+    def write_excel(self, file_path):
+        self.db_manager.export_excel(self.user_id, file_path)
+    
     def sync_with_cloud(self):
         # Mostrar diálogo de progresso
         self.progress_dialog = QProgressDialog("Sincronizando com a nuvem...", "Cancelar", 0, 100, self)
@@ -1948,57 +6616,21 @@ class MainWindow(QMainWindow):
         try:
             self.sync_signals.progress.emit(10)
             
-            # Exportar dados para um arquivo temporário
-            temp_file = "temp_finance_data.xlsx"
-            
-            conn = self.db_manager.get_connection()
-            
-            # Transações
-            transactions_df = pd.read_sql_query(
-                "SELECT * FROM transactions WHERE user_id = ?", 
-                conn, params=[self.user_id]
-            )
-            
-            # Orçamentos
-            budgets_df = pd.read_sql_query(
-                "SELECT * FROM budgets WHERE user_id = ?", 
-                conn, params=[self.user_id]
-            )
-            
-            # Metas
-            goals_df = pd.read_sql_query(
-                "SELECT * FROM goals WHERE user_id = ?", 
-                conn, params=[self.user_id]
-            )
-            
-            conn.close()
-            
-            self.sync_signals.progress.emit(30)
-            
-            # Criar arquivo Excel temporário
-            with pd.ExcelWriter(temp_file, engine='openpyxl') as writer:
-                transactions_df.to_excel(writer, sheet_name='Transações', index=False)
-                budgets_df.to_excel(writer, sheet_name='Orçamentos', index=False)
-                goals_df.to_excel(writer, sheet_name='Metas', index=False)
+            # Snapshot compacto do banco do usuário (fica retido localmente com rotação)
+            snapshot_file = self.db_manager.snapshot(self.user_id)
             
             self.sync_signals.progress.emit(60)
             
             # Fazer upload para o Cloudinary
             response = cloudinary.uploader.upload(
-                temp_file,
-                public_id=f"finance_app/{self.user_id}_{int(datetime.datetime.now().timestamp())}",
+                snapshot_file,
+                public_id=f"finance_app/{self.user_id}_{int(datetime.datetime.now().timestamp())}.db",
                 resource_type="raw"
             )
             
-            self.sync_signals.progress.emit(90)
-            
-            # Remover arquivo temporário
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-            
             self.sync_signals.progress.emit(100)
             self.sync_signals.finished.emit()
-            
+        
         except Exception as e:
             self.sync_signals.error.emit(str(e))
     
@@ -2020,13 +6652,607 @@ class MainWindow(QMainWindow):
         # Implementar cancelamento se necessário
         pass
     
+    def create_backup(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Criar Backup", "", "SQLite (*.db)")
+        
+        if not file_path:
+            return
+        
+        self.backup_dialog = QProgressDialog("Copiando banco de dados...", None, 0, 100, self)
+        self.backup_dialog.setWindowTitle("Backup")
+        self.backup_dialog.setWindowModality(Qt.WindowModal)
+        self.backup_dialog.show()
+        
+        # Backup online em thread separada; a interface continua usando o banco
+        self.backup_signals = SyncSignals()
+        self.backup_signals.progress.connect(self.backup_dialog.setValue)
+        self.backup_signals.finished.connect(self.backup_finished)
+        self.backup_signals.error.connect(self.backup_error)
+        
+        def run_backup():
+            try:
+                self.db_manager.backup(file_path, self.user_id, progress=self.backup_signals.progress.emit)
+                self.backup_signals.finished.emit()
+            except Exception as e:
+                self.backup_signals.error.emit(str(e))
+        
+        backup_thread = threading.Thread(target=run_backup)
+        backup_thread.daemon = True
+        backup_thread.start()
+    
+    def close_period(self):
+        conn = self.db_manager.get_connection(self.user_id)
+        cursor = conn.cursor()
+        closed_through = self.db_manager.periods.closed_through(cursor, self.user_id)
+        cursor.execute("SELECT MIN(date) FROM transactions WHERE user_id = ?", (self.user_id,))
+        first_date = cursor.fetchone()[0]
+        conn.close()
+        
+        # Meses já encerrados e ainda abertos, do mais recente ao mais antigo
+        last_month = add_months(QDate.currentDate().toString("yyyy-MM"), -1)
+        if closed_through is not None:
+            first_month = add_months(closed_through, 1)
+        else:
+            first_month = first_date[:7] if first_date else last_month
+        
+        months = []
+        month = last_month
+        while month >= first_month:
+            months.append(month)
+            month = add_months(month, -1)
+        
+        if not months:
+            QMessageBox.information(self, "Fechar Período", "Não há meses encerrados em aberto")
+            return
+        
+        month, ok = QInputDialog.getItem(self, "Fechar Período", "Fechar todos os meses até (inclusive):", 
+                                         months, 0, False)
+        if not ok:
+            return
+        
+        reply = QMessageBox.question(self, "Confirmar", 
+                                    f"As transações até {month} serão arquivadas e não poderão mais ser "
+                                    "alteradas. Deseja continuar?",
+                                    QMessageBox.Yes | QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+        
+        def closed(archived):
+            # Os totais passam a vir das tabelas congeladas
+            self.budget_status.invalidate_budgets(self.user_id)
+            self.db_manager.currency_totals.invalidate(self.user_id)
+            self.invalidate_tabs(self.dashboard_tab, self.budgets_tab)
+            QMessageBox.information(self, "Sucesso", f"{archived} transação(ões) arquivada(s) até {month}")
+        
+        self.submit_write(lambda cursor: self.db_manager.periods.close(cursor, self.user_id, month), closed)
+    
+    def backup_finished(self):
+        self.backup_dialog.accept()
+        QMessageBox.information(self, "Sucesso", "Backup criado com sucesso")
+    
+    def backup_error(self, error_msg):
+        self.backup_dialog.reject()
+        QMessageBox.warning(self, "Erro", f"Falha no backup: {error_msg}")
+    
+    def show_query_stats(self):
+        # Painel não modal: pode ficar aberto enquanto o app é usado
+        if not hasattr(self, 'query_stats_dialog'):
+            self.query_stats_dialog = QueryStatsDialog(self.db_manager, self)
+        self.query_stats_dialog.refresh()
+        self.query_stats_dialog.show()
+        self.query_stats_dialog.raise_()
+    
+    def save_profile_trace(self):
+        path = self.profiler.write()
+        QMessageBox.information(self, "Perfil", f"Trace salvo em {path} (abra em chrome://tracing ou Perfetto)")
+    
     def logout(self):
         self.close()
 
+# API HTTP/JSON local (python finance_app.py --api)
+API_HOST = os.getenv('FINANCE_API_HOST', '127.0.0.1')
+API_PORT = int(os.getenv('FINANCE_API_PORT', 8765))
+API_PAGE_SIZE = 1000
+API_MAX_PAGE_SIZE = 100000
+API_STREAM_CHUNK = 500
+API_MAX_BODY_BYTES = 1024 * 1024  # Corpo máximo aceito (as rotas recebem só JSON pequeno)
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class ConnectionPool:
+    # Conexões de leitura reaproveitadas entre requisições (por usuário/arquivo)
+    def __init__(self, db_manager, size=4):
+        self.db_manager = db_manager
+        self.size = size
+        self.idle = {}
+        self.lock = threading.Lock()
+    
+    def acquire(self, user_id):
+        with self.lock:
+            connections = self.idle.get(user_id)
+            if connections:
+                return connections.pop()
+        return self.db_manager.get_connection(user_id, check_same_thread=False)
+    
+    def release(self, user_id, conn):
+        with self.lock:
+            connections = self.idle.setdefault(user_id, [])
+            if len(connections) < self.size:
+                connections.append(conn)
+                return
+        conn.close()
+    
+    def run(self, user_id, function):
+        conn = self.acquire(user_id)
+        try:
+            return function(conn.cursor())
+        finally:
+            self.release(user_id, conn)
+    
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for conn in connections:
+                    conn.close()
+            self.idle.clear()
+
+class ApiRequest:
+    def __init__(self, method, target, headers, body):
+        self.method = method
+        url = urlsplit(target)
+        self.path = url.path.rstrip("/") or "/"
+        self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.headers = headers
+        self.body = body
+        self.user_id = None
+        self.match = None
+        self.streaming = False  # Cabeçalhos de uma resposta em blocos já enviados
+    
+    def json(self):
+        try:
+            return json.loads(self.body or b"{}")
+        except ValueError:
+            raise ApiError(400, "JSON inválido")
+
+class ApiServer:
+    def __init__(self, db_manager, host=API_HOST, port=API_PORT, readers=4):
+        self.db_manager = db_manager
+        self.host = host
+        self.port = port
+        self.pool = ConnectionPool(db_manager, size=readers)
+        self.read_executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="api-read")
+        self.writes = db_manager.get_writer()
+        self.budget_status = BudgetStatusService(db_manager)
+        self.account_balances = AccountBalanceIndex(db_manager)
+        self.server = None
+        
+        # (método, caminho, handler, exige autenticação)
+        self.routes = [
+            ("POST", re.compile(r"/api/login"), self.login, False),
+            ("POST", re.compile(r"/api/logout"), self.logout, True),
+            ("GET", re.compile(r"/api/summary"), self.get_summary, True),
+            ("GET", re.compile(r"/api/transactions"), self.list_transactions, True),
+            ("POST", re.compile(r"/api/transactions"), self.add_transaction, True),
+            ("DELETE", re.compile(r"/api/transactions/(\d+)"), self.delete_transaction, True),
+            ("GET", re.compile(r"/api/budgets"), self.list_budgets, True),
+            ("GET", re.compile(r"/api/alerts"), self.list_alerts, True),
+            ("GET", re.compile(r"/api/goals"), self.list_goals, True),
+            ("GET", re.compile(r"/api/accounts"), self.list_accounts, True),
+            ("GET", re.compile(r"/api/categories"), self.list_categories, True),
+            ("GET", re.compile(r"/api/export"), self.export, True),
+        ]
+    
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info("API ouvindo em http://%s:%s", self.host, self.port)
+        return self.server
+    
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+    
+    def close(self):
+        if self.server:
+            self.server.close()
+        self.db_manager.close_writer()
+        self.read_executor.shutdown(wait=True)
+        self.pool.close()
+    
+    async def read(self, function, *args):
+        # Consultas rodam no pool de threads de leitura, fora do loop de eventos
+        return await asyncio.get_running_loop().run_in_executor(self.read_executor, function, *args)
+    
+    async def write(self, user_id, function):
+        return await asyncio.wrap_future(self.writes.submit(user_id, function))
+    
+    def apply_transaction(self, user_id, transaction_date, category, currency, spent, started):
+        # Ajusta o consumo em cache e avalia os limiares; os avisos ficam em /api/alerts
+        rows = self.budget_status.apply_transaction(user_id, transaction_date, category, currency, spent, started)
+        self.db_manager.budget_alerts.evaluate(user_id, rows)
+    
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                
+                content_length = int(headers.get("content-length", 0))
+                if content_length < 0 or content_length > API_MAX_BODY_BYTES:
+                    # Recusa antes de ler: o corpo inteiro ficaria em memória
+                    await self.send_json(writer, 413, {"error": f"Corpo maior que {API_MAX_BODY_BYTES} bytes"},
+                                         close=True)
+                    break
+                body = await reader.readexactly(content_length)
+                request = ApiRequest(method, target, headers, body)
+                await self.dispatch(request, writer)
+                
+                if version != "HTTP/1.1" or headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+    
+    async def dispatch(self, request, writer):
+        try:
+            for method, pattern, handler, needs_auth in self.routes:
+                request.match = pattern.fullmatch(request.path)
+                if request.match and method == request.method:
+                    break
+            else:
+                raise ApiError(404, "Rota não encontrada")
+            
+            if needs_auth:
+                token = request.headers.get("authorization", "").partition("Bearer ")[2]
+                session = self.db_manager.sessions.resolve(token) if token else None
+                if session is None:
+                    raise ApiError(401, "Token inválido ou expirado")
+                request.user_id = session[0]
+            
+            await handler(request, writer)
+        except Exception as e:
+            if request.streaming:
+                # A resposta já começou: outra resposta no mesmo fluxo chegaria corrompida ao cliente,
+                # que vê a conexão cair no meio dos blocos
+                logger.exception("Erro na API durante o envio: %s %s", request.method, request.path)
+                writer.transport.abort()
+                raise ConnectionAbortedError("Resposta interrompida") from e
+            if isinstance(e, ApiError):
+                await self.send_json(writer, e.status, {"error": e.message})
+            else:
+                logger.exception("Erro na API: %s %s", request.method, request.path)
+                await self.send_json(writer, 500, {"error": str(e)})
+    
+    async def send(self, writer, status, body, content_type, close=False):
+        reason = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized",
+                  404: "Not Found", 409: "Conflict", 413: "Payload Too Large",
+                  500: "Internal Server Error"}.get(status, "OK")
+        connection = "Connection: close\r\n" if close else ""
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n{connection}"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+    
+    async def send_json(self, writer, status, payload, close=False):
+        await self.send(writer, status, json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                        "application/json; charset=utf-8", close)
+    
+    async def start_chunked(self, request, writer, content_type):
+        request.streaming = True
+        writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n"
+                     "Transfer-Encoding: chunked\r\n\r\n".encode("latin-1"))
+    
+    async def send_chunk(self, writer, text):
+        data = text.encode("utf-8")
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+        await writer.drain()
+    
+    async def login(self, request, writer):
+        data = request.json()
+        # O KDF é custoso: roda fora do loop de eventos
+        user = await self.read(self.db_manager.authenticate, data.get("username", ""), data.get("password", ""))
+        if user is None:
+            raise ApiError(401, "Usuário ou senha incorretos")
+        token = self.db_manager.sessions.issue(*user)
+        await self.send_json(writer, 200, {"token": token, "user_id": user[0], "username": user[1]})
+    
+    async def logout(self, request, writer):
+        self.db_manager.sessions.revoke(request.headers["authorization"].partition("Bearer ")[2])
+        await self.send_json(writer, 200, {"ok": True})
+    
+    async def get_summary(self, request, writer):
+        total_income, total_expense = await self.read(self.db_manager.get_totals, request.user_id)
+        await self.send_json(writer, 200, {"income": total_income, "expense": total_expense,
+                                           "balance": total_income - total_expense, "currency": BASE_CURRENCY})
+    
+    async def list_transactions(self, request, writer):
+        # Página por chave (data, id) decrescente, enviada em blocos (chunked)
+        try:
+            limit = min(int(request.query.get("limit", API_PAGE_SIZE)), API_MAX_PAGE_SIZE)
+        except ValueError:
+            raise ApiError(400, "limit inválido")
+        
+        query = """
+            SELECT id, type, category_id, amount, description, date, currency 
+            FROM all_transactions 
+            WHERE user_id = ?
+        """
+        params = [request.user_id]
+        filters = dict(request.query)
+        if "category" in filters:
+            # Filtro pelo nome; uma categoria inexistente não casa com nenhum id
+            category_ids = await self.read(self.db_manager.categories.ids, request.user_id)
+            filters["category"] = category_ids.get(filters["category"], 0)
+        for field, condition in (("type", "type = ?"), ("category", "category_id = ?"),
+                                 ("start", "date >= ?"), ("end", "date <= ?")):
+            if field in filters:
+                query += f" AND {condition}"
+                params.append(filters[field])
+        
+        if "before" in request.query:
+            before_date, _, before_id = request.query["before"].rpartition(",")
+            if not before_date or not before_id.isdigit():
+                raise ApiError(400, "before deve ser '<data>,<id>'")
+            query += " AND (date < ? OR (date = ? AND id < ?))"
+            params += [before_date, before_date, int(before_id)]
+        
+        query += " ORDER BY date DESC, id DESC LIMIT ?"
+        params.append(limit)
+        
+        conn = await self.read(self.pool.acquire, request.user_id)
+        try:
+            cursor = conn.cursor()
+            await self.read(cursor.execute, query, params)
+            
+            await self.start_chunked(request, writer, "application/json; charset=utf-8")
+            await self.send_chunk(writer, '{"items": [')
+            
+            count, last = 0, None
+            while True:
+                rows = await self.read(cursor.fetchmany, API_STREAM_CHUNK)
+                if not rows:
+                    break
+                names = await self.read(self.db_manager.categories.names, request.user_id, {row[2] for row in rows})
+                items = [dict(zip(("id", "type", "category", "amount", "description", "date", "currency"), 
+                                  (row[0], row[1], names[row[2]], *row[3:]))) 
+                         for row in rows]
+                await self.send_chunk(writer, ("," if count else "") + 
+                                      ",".join(json.dumps(item, ensure_ascii=False) for item in items))
+                count += len(rows)
+                last = rows[-1]
+        finally:
+            self.pool.release(request.user_id, conn)
+        
+        next_page = f"{last[5]},{last[0]}" if last and count == limit else None
+        await self.send_chunk(writer, f'], "count": {count}, "next": {json.dumps(next_page)}}}')
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+    
+    async def add_transaction(self, request, writer):
+        data = request.json()
+        if data.get("type") not in ("Receita", "Despesa"):
+            raise ApiError(400, "type deve ser 'Receita' ou 'Despesa'")
+        try:
+            amount = float(data["amount"])
+            transaction_date = date.fromisoformat(data["date"]).isoformat()
+            category = str(data["category"])
+        except (KeyError, TypeError, ValueError):
+            raise ApiError(400, "Campos obrigatórios: type, category, amount, date (AAAA-MM-DD)")
+        if amount <= 0:
+            raise ApiError(400, "amount deve ser positivo")
+        currency = str(data.get("currency", BASE_CURRENCY)).upper()
+        if not re.fullmatch(r"[A-Z]{3}", currency):
+            raise ApiError(400, "currency deve ser um código de 3 letras (ISO 4217)")
+        account_id = data.get("account_id")
+        if account_id is not None and not isinstance(account_id, int):
+            raise ApiError(400, "account_id deve ser um inteiro")
+        
+        def insert(cursor):
+            try:
+                self.db_manager.periods.check_open(cursor, request.user_id, [transaction_date])
+            except ClosedPeriodError as e:
+                raise ApiError(409, str(e))
+            if account_id is None:
+                target_account = self.db_manager.default_account_id(cursor, request.user_id)
+            else:
+                cursor.execute("SELECT 1 FROM accounts WHERE id = ? AND user_id = ?", (account_id, request.user_id))
+                if cursor.fetchone() is None:
+                    raise ApiError(404, "Conta não encontrada")
+                target_account = account_id
+            category_id = self.db_manager.categories.resolve(cursor, request.user_id, category)
+            cursor.execute("""
+                INSERT INTO transactions (user_id, type, category_id, amount, currency, account_id, description, date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (request.user_id, data["type"], category_id, amount, currency, target_account, 
+                  data.get("description", ""), transaction_date))
+            transaction_id = cursor.lastrowid
+            signed = amount if data["type"] == "Receita" else -amount
+            self.db_manager.apply_account_movements(cursor, [(target_account, transaction_date, signed, currency)])
+            self.db_manager.envelopes.apply_spending(cursor, [(data["type"], category_id, transaction_date, amount, currency)])
+            return transaction_id
+        
+        started = self.budget_status.tick()
+        transaction_id = await self.write(request.user_id, insert)
+        await self.read(self.apply_transaction, request.user_id, transaction_date, category, currency,
+                        amount if data["type"] == "Despesa" else 0, started)
+        self.db_manager.currency_totals.invalidate_transaction(request.user_id, transaction_date, currency)
+        await self.send_json(writer, 201, {"id": transaction_id})
+    
+    async def delete_transaction(self, request, writer):
+        transaction_id = int(request.match.group(1))
+        
+        def delete(cursor):
+            cursor.execute("""
+                SELECT t.date, c.name, t.currency, CASE WHEN t.type = 'Despesa' THEN -t.amount ELSE 0 END
+                FROM transactions t JOIN categories c ON c.id = t.category_id 
+                WHERE t.id = ? AND t.user_id = ?
+            """, (transaction_id, request.user_id))
+            previous = cursor.fetchone()
+            if previous is None:
+                cursor.execute("SELECT 1 FROM transactions_archive WHERE id = ? AND user_id = ?", 
+                               (transaction_id, request.user_id))
+                if cursor.fetchone():
+                    raise ApiError(409, CLOSED_PERIOD_ERROR)
+            cursor.execute("DELETE FROM transactions WHERE id = ? AND user_id = ?", 
+                           (transaction_id, request.user_id))
+            return previous
+        
+        started = self.budget_status.tick()
+        previous = await self.write(request.user_id, delete)
+        if previous is None:
+            raise ApiError(404, "Transação não encontrada")
+        transaction_date, category, currency, spent = previous
+        await self.read(self.apply_transaction, request.user_id, transaction_date, category, currency, spent, started)
+        self.db_manager.currency_totals.invalidate_transaction(request.user_id, transaction_date, currency)
+        await self.send_json(writer, 200, {"deleted": transaction_id})
+    
+    async def list_budgets(self, request, writer):
+        today = date.today()
+        try:
+            month = int(request.query.get("month", today.month))
+            year = int(request.query.get("year", today.year))
+        except ValueError:
+            raise ApiError(400, "month/year inválidos")
+        
+        status = await self.read(self.budget_status.get_status, request.user_id, month, year)
+        await self.send_json(writer, 200, {"month": month, "year": year, "items": [
+            {"id": budget_id, "category": category, "amount": amount, "spent": spent, "carry": carry,
+             "thresholds": list(thresholds)}
+            for budget_id, category, amount, spent, carry, thresholds in status
+        ]})
+    
+    async def list_alerts(self, request, writer):
+        # Histórico dos limiares atingidos, do mais recente ao mais antigo
+        try:
+            limit = min(int(request.query.get("limit", API_PAGE_SIZE)), API_MAX_PAGE_SIZE)
+        except ValueError:
+            raise ApiError(400, "limit inválido")
+        
+        def fetch(cursor):
+            cursor.execute("""
+                SELECT a.budget_id, c.name, b.month, b.year, a.threshold, a.spent, a.amount, a.created_at
+                FROM budget_alerts a
+                JOIN budgets b ON b.id = a.budget_id
+                JOIN categories c ON c.id = b.category_id
+                WHERE a.user_id = ?
+                ORDER BY a.created_at DESC, a.threshold DESC
+                LIMIT ?
+            """, (request.user_id, limit))
+            return cursor.fetchall()
+        
+        alerts = await self.read(self.pool.run, request.user_id, fetch)
+        await self.send_json(writer, 200, {"items": [
+            dict(zip(("budget_id", "category", "month", "year", "threshold", "spent", "limit", "created_at"), alert))
+            for alert in alerts
+        ]})
+    
+    async def list_goals(self, request, writer):
+        def fetch(cursor):
+            cursor.execute("""
+                SELECT id, title, target_amount, current_amount, deadline 
+                FROM goals WHERE user_id = ? ORDER BY id
+            """, (request.user_id,))
+            return cursor.fetchall()
+        
+        goals = await self.read(self.pool.run, request.user_id, fetch)
+        await self.send_json(writer, 200, {"items": [
+            dict(zip(("id", "title", "target_amount", "current_amount", "deadline"), goal)) for goal in goals
+        ]})
+    
+    async def list_accounts(self, request, writer):
+        as_of = request.query.get("as_of", date.today().isoformat())
+        try:
+            as_of = date.fromisoformat(as_of).isoformat()
+        except ValueError:
+            raise ApiError(400, "as_of deve ser AAAA-MM-DD")
+        
+        accounts = await self.read(self.account_balances.balances, request.user_id, as_of)
+        await self.send_json(writer, 200, {"as_of": as_of, "items": [
+            {"id": account_id, "name": name, "currency": currency, "balance": balance}
+            for account_id, name, currency, balance in accounts
+        ]})
+    
+    async def list_categories(self, request, writer):
+        categories = await self.read(self.db_manager.categories.get, request.user_id)
+        await self.send_json(writer, 200, {"items": [
+            dict(zip(("id", "name", "parent_id", "type"), category)) for category in categories
+        ]})
+    
+    async def export(self, request, writer):
+        export_format = request.query.get("format", "xlsx")
+        if export_format == "xlsx":
+            handle, file_path = tempfile.mkstemp(suffix=".xlsx")
+            os.close(handle)
+            try:
+                await self.read(self.db_manager.export_excel, request.user_id, file_path)
+                content = await self.read(read_file_bytes, file_path)
+            finally:
+                os.remove(file_path)
+            content_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        elif export_format == "db":
+            # Cópia compacta como a da sincronização, mas temporária: não entra na rotação dos snapshots
+            handle, file_path = tempfile.mkstemp(suffix=".db")
+            os.close(handle)
+            try:
+                await self.read(self.db_manager.compact_copy, file_path, request.user_id)
+                content = await self.read(read_file_bytes, file_path)
+            finally:
+                os.remove(file_path)
+            content_type = "application/vnd.sqlite3"
+        else:
+            raise ApiError(400, "format deve ser 'xlsx' ou 'db'")
+        
+        await self.send(writer, 200, content, content_type)
+
+def read_file_bytes(file_path):
+    with open(file_path, "rb") as file:
+        return file.read()
+
+def load_fx_rate_files(db_manager, path=FX_RATES_PATH):
+    # Cotações locais (sem serviço externo), relidas a cada inicialização
+    if not os.path.exists(path):
+        return
+    try:
+        count = db_manager.load_fx_rates(path)
+        logger.info("%s cotação(ões) carregada(s) de %s", count, path)
+    except (OSError, ValueError) as e:
+        logger.warning("Falha ao carregar cotações de %s: %s", path, e)
+
+def run_api_server(host, port):
+    logging.basicConfig(level=logging.INFO)
+    db_manager = DatabaseManager()
+    load_fx_rate_files(db_manager)
+    server = ApiServer(db_manager, host, port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
 class FinanceApp(QApplication):
     def __init__(self, argv):
         super().__init__(argv)
         self.db_manager = DatabaseManager()
+        load_fx_rate_files(self.db_manager)
+        self.profiler = UIProfiler.from_environment()
+        self.aboutToQuit.connect(self.profiler.write)
+        self.aboutToQuit.connect(self.db_manager.close_writer)  # Grava o que ainda estiver na fila
         self.auth_dialog = AuthDialog(self.db_manager)
         self.main_window = None
         
@@ -2034,14 +7260,52 @@ class FinanceApp(QApplication):
             self.main_window = MainWindow(
                 self.auth_dialog.user_id, 
                 self.auth_dialog.username, 
-                self.db_manager
+                self.db_manager,
+                self.profiler
             )
             self.main_window.show()
         else:
             self.quit()
 
+def split_ledgers(source_db):
+    # Divide um banco compartilhado em catálogo + um ledger por usuário
+    db_manager = DatabaseManager(source_db, layout="per_user")
+    migrated = db_manager.split_into_ledgers()
+    
+    for user_id, counts in migrated.items():
+        summary = ", ".join(f"{table}: {count}" for table, count in counts.items())
+        print(f"Usuário {user_id} -> {db_manager.ledger_path(user_id)} ({summary})")
+    print(f"{len(migrated)} ledger(s) criado(s). Use FINANCE_DB_LAYOUT=per_user para ativar o novo layout.")
+
 def main():
-    app = FinanceApp(sys.argv)
+    parser = argparse.ArgumentParser(description="Controle Financeiro Pessoal")
+    parser.add_argument("--split-ledgers", metavar="BANCO", nargs="?", const="finance_manager.db",
+                        help="divide o banco compartilhado em um ledger por usuário e sai")
+    parser.add_argument("--fx-rates", metavar="CAMINHO", 
+                        help="importa cotações de um CSV (ou pasta de CSVs: date,currency,rate) e sai")
+    parser.add_argument("--api", action="store_true", help="inicia a API HTTP/JSON local em vez da interface")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args, qt_args = parser.parse_known_args()
+    
+    if args.split_ledgers:
+        split_ledgers(args.split_ledgers)
+        return
+    
+    if args.fx_rates:
+        try:
+            count = DatabaseManager().load_fx_rates(args.fx_rates)
+        except (OSError, ValueError) as e:
+            # CSV malformado, colunas ausentes, datas ou taxas inválidas
+            parser.error(f"falha ao importar cotações de {args.fx_rates}: {e}")
+        print(f"{count} cotação(ões) importada(s) de {args.fx_rates}")
+        return
+    
+    if args.api:
+        run_api_server(args.host, args.port)
+        return
+    
+    app = FinanceApp(sys.argv[:1] + qt_args)
     sys.exit(app.exec_())
 
 if __name__ == "__main__":